@@ -0,0 +1,68 @@
+"""
+Scaling of column-parallel fused operators with the number of threads.
+
+    python benchmarks/bench_column_parallel.py --rows 50000 --cols 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+
+from src.processing import DataProcessor  # noqa: E402
+from src.schemas import PipelineStep  # noqa: E402
+
+PIPELINE = [
+    {"operator": "imputer", "params": {"strategy": "median"}},
+    {"operator": "minmax_scaler", "params": {}},
+    {"operator": "standard_scaler", "params": {}},
+]
+
+
+def make_wide_frame(rows: int, cols: int, null_ratio: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(rows, cols))
+    values[rng.random((rows, cols)) < null_ratio] = np.nan
+    return pd.DataFrame(values, columns=[f"f{i}" for i in range(cols)])
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--cols", type=int, default=1_000)
+    parser.add_argument("--max-jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_wide_frame(args.rows, args.cols)
+    steps = [PipelineStep(**step) for step in PIPELINE]
+    processor = DataProcessor()
+    serial = processor.process(df, steps, n_jobs=1)
+
+    print(f"{args.rows} rows x {args.cols} columns, {os.cpu_count()} cores")
+    print(f"{'n_jobs':>6}{'seconds':>10}{'speedup':>10}")
+    jobs = sorted({1, *[2 ** i for i in range(1, args.max_jobs.bit_length())], args.max_jobs})
+    baseline = None
+    for n_jobs in jobs:
+        # Bit-identical to the serial run, whatever the number of threads
+        pd.testing.assert_frame_equal(serial, processor.process(df, steps, n_jobs=n_jobs), check_exact=True)
+        seconds = best_of(lambda: processor.process(df, steps, n_jobs=n_jobs), args.repeat)
+        baseline = baseline or seconds
+        print(f"{n_jobs:>6}{seconds:>10.3f}{baseline / seconds:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
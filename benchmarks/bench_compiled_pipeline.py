@@ -0,0 +1,83 @@
+"""
+Compares the compiled (fused) pipeline with the step-by-step reference path.
+
+    python benchmarks/bench_compiled_pipeline.py --rows 1000000 --cols 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+
+from src.processing import DataProcessor  # noqa: E402
+from src.schemas import PipelineStep  # noqa: E402
+
+PIPELINES = {
+    "impute_mean+standard": [
+        {"operator": "imputer", "params": {"strategy": "mean"}},
+        {"operator": "standard_scaler", "params": {}},
+    ],
+    "impute_zero+minmax+standard": [
+        {"operator": "imputer", "params": {"strategy": "constant_zero"}},
+        {"operator": "minmax_scaler", "params": {}},
+        {"operator": "standard_scaler", "params": {}},
+    ],
+    "frontend_default": [
+        {"operator": "imputer", "params": {"strategy": "mean"}},
+        {"operator": "imputer", "params": {"strategy": "most_frequent"}},
+        {"operator": "standard_scaler", "params": {}},
+    ],
+}
+
+
+def make_frame(rows: int, cols: int, null_ratio: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(cols):
+        if i % 5 == 4:
+            data[f"cat_{i}"] = rng.choice(["a", "b", "c", None], rows)
+        elif i % 2:
+            data[f"int_{i}"] = rng.integers(0, 1000, rows)
+        else:
+            values = rng.normal(size=rows)
+            values[rng.random(rows) < null_ratio] = np.nan
+            data[f"num_{i}"] = values
+    return pd.DataFrame(data)
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--cols", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.cols)
+    processor = DataProcessor()
+    print(f"{args.rows} rows x {args.cols} columns")
+    print(f"{'pipeline':<30}{'stepwise (s)':>14}{'compiled (s)':>14}{'speedup':>10}")
+
+    for name, config in PIPELINES.items():
+        steps = [PipelineStep(**step) for step in config]
+        pd.testing.assert_frame_equal(processor.process_stepwise(df, steps), processor.process(df, steps), check_exact=True)
+
+        stepwise = best_of(lambda: processor.process_stepwise(df, steps), args.repeat)
+        compiled = best_of(lambda: processor.process(df, steps), args.repeat)
+        print(f"{name:<30}{stepwise:>14.3f}{compiled:>14.3f}{stepwise / compiled:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
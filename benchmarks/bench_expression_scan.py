@@ -0,0 +1,75 @@
+"""
+Expression steps pushed into the input scan against the same steps run after a full load.
+
+    python benchmarks/bench_expression_scan.py --rows 1000000 --cols 30
+
+The pipeline keeps the last day of a time-ordered dataset, derives one column, selects a
+few and scales them. "load" parses every column and row into a DataFrame and then runs the
+whole pipeline on it; "scan" runs the leading filter/derive/select steps in the Arrow scan
+of the object (expressions.ScanPlan), so only the kept columns and rows are materialized.
+Parquet row groups of other days are skipped from their statistics.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from s3_standin import S3StandIn  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--cols", type=int, default=30)
+    parser.add_argument("--days", type=int, default=10)
+    args = parser.parse_args()
+
+    with S3StandIn() as server:
+        os.environ["MINIO_ENDPOINT"] = server.endpoint
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_expression_scan.db")
+        from src.schemas import PipelineStep
+        from src.processing import processor
+        from src.expressions import split_scan
+        from src.minio_client import minio_client
+        from src.dtypes import memory_usage
+        from src.config import settings
+
+        minio_client.ensure_buckets()
+        bucket = settings.MINIO_BUCKET_RAW
+        df = make_dataset(args.rows, args.cols)
+        df.insert(0, "day", np.arange(args.rows) * args.days // args.rows)
+        pipeline = [PipelineStep(**step) for step in [
+            {"operator": "filter", "params": {"condition": f"day == {args.days - 1} and int_1 < 500"}},
+            {"operator": "derive", "params": {"column": "ratio", "expression": "num_0 / (int_3 + 1)"}},
+            {"operator": "select", "params": {"columns": ["num_0", "num_2", "cat_4", "ratio"]}},
+            {"operator": "imputer", "params": {"strategy": "mean"}},
+            {"operator": "standard_scaler", "params": {}},
+        ]]
+        scan, rest = split_scan(pipeline)
+
+        print(f"{args.rows} rows x {args.cols + 1} columns, {len(scan.steps)} of {len(pipeline)} steps in the scan")
+        print(f"{'format':<9}{'mode':<6}{'seconds':>9}{'loaded rows':>13}{'loaded MiB':>12}{'output rows':>13}")
+        for fmt in ("csv", "parquet"):
+            path = f"bench/expression_scan.{fmt}"
+            minio_client.save_dataframe(df, bucket, path)
+            for mode in ("load", "scan"):
+                start = time.perf_counter()
+                if mode == "load":
+                    loaded = minio_client.load_dataframe(bucket, path)
+                    out = processor.process(loaded, pipeline)
+                else:
+                    loaded = minio_client.load_dataframe(bucket, path, scan=scan)
+                    out = processor.process(loaded, rest)
+                seconds = time.perf_counter() - start
+                print(f"{fmt:<9}{mode:<6}{seconds:>9.2f}{len(loaded):>13}{memory_usage(loaded) / 2 ** 20:>12.1f}{len(out):>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Refresh cost of a growing dataset: full reprocessing against incremental runs.
+
+    python benchmarks/bench_incremental.py --days 8 --rows-per-day 100000 --statistics update
+
+Each simulated day adds one partition object under an input prefix, then the output is
+refreshed twice: by a job into a new output, which fits on and writes the whole history
+(what every refresh costs without incremental mode), and by an incremental job that only
+reads the new object.
+Full refreshes grow with the history; incremental ones stay at the cost of one day.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from s3_standin import S3StandIn  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+
+PIPELINE = [
+    {"operator": "imputer", "params": {"strategy": "mean"}},
+    {"operator": "imputer", "params": {"strategy": "most_frequent"}},
+    {"operator": "standard_scaler", "params": {}},
+    {"operator": "one_hot", "params": {"max_categories": 20, "dtype": "int8"}},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=8)
+    parser.add_argument("--rows-per-day", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=12)
+    parser.add_argument("--statistics", choices=("frozen", "update"), default="update")
+    args = parser.parse_args()
+
+    with S3StandIn() as server:
+        os.environ["MINIO_ENDPOINT"] = server.endpoint
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_incremental.db")
+        from src.schemas import PreparationRequest
+        from src.jobs import run_preparation
+        from src.minio_client import minio_client
+        from src.config import settings
+
+        minio_client.ensure_buckets()
+        bucket = settings.MINIO_BUCKET_RAW
+        base = {"input_data": {"bucket": bucket, "path": "events/"}, "pipeline": PIPELINE, "output_format": "parquet"}
+        incremental = PreparationRequest(**base, incremental={"statistics": args.statistics}, output_path="bench/events")
+
+        print(f"{args.rows_per_day} rows x {args.cols} columns per day, statistics={args.statistics}")
+        print(f"{'day':<5}{'history rows':>14}{'full (s)':>10}{'incremental (s)':>17}")
+        for day in range(args.days):
+            df = make_dataset(args.rows_per_day, args.cols, seed=day)
+            minio_client.save_dataframe(df, bucket, f"events/day-{day:03d}.parquet")
+
+            # A first run into a new output fits on, and writes, the whole history
+            full = PreparationRequest(**base, incremental={"statistics": args.statistics}, output_path=f"bench/full-{day}")
+            start = time.perf_counter()
+            run_preparation(str(uuid.uuid4()), full)
+            full_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            run_preparation(str(uuid.uuid4()), incremental)
+            incremental_seconds = time.perf_counter() - start
+            print(f"{day:<5}{(day + 1) * args.rows_per_day:>14}{full_seconds:>10.2f}{incremental_seconds:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
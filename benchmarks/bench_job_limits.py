@@ -0,0 +1,121 @@
+"""
+Per-job memory and time limits and cancellation, and what running jobs in child processes costs.
+
+    python benchmarks/bench_job_limits.py --rows 200000 --cols 20 --memory-limit-mb 1024 --time-limit 20
+
+One worker runs, in order:
+  - normal: the same job in the worker process and in a prestarted child process
+  - hog: one_hot into a dense frame of twice --memory-limit-mb, which the node itself
+    could hold; must end as OOM
+  - slow: a streaming job in --slow-chunk-size row chunks, past --time-limit; must end as TIMEOUT
+  - cancelled: the slow job again, cancelled --cancel-after seconds in; must end as CANCELLED,
+    and the time from the cancel request to the status is reported
+  - normal again: the worker must still complete jobs afterwards
+Exits with 1 if a job ends in another status.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from s3_standin import S3StandIn  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+
+PIPELINE = [
+    {"operator": "imputer", "params": {"strategy": "mean"}},
+    {"operator": "standard_scaler", "params": {}},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--memory-limit-mb", type=int, default=1024)
+    parser.add_argument("--time-limit", type=float, default=20.0)
+    parser.add_argument("--slow-chunk-size", type=int, default=100)
+    parser.add_argument("--cancel-after", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with S3StandIn() as server:
+        # Read by the job processes when they start
+        os.environ.update(MINIO_ENDPOINT=server.endpoint, JOB_MEMORY_LIMIT_MB=str(args.memory_limit_mb),
+                          JOB_TIME_LIMIT_SECONDS=str(args.time_limit), JOB_CANCEL_POLL_INTERVAL="0.2",
+                          JOB_CANCEL_GRACE_SECONDS="5")
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_job_limits.db")
+        from src.schemas import PreparationRequest
+        from src.job_queue import InMemoryJobQueue
+        from src.worker import Worker
+        from src.minio_client import minio_client
+        from src.config import settings
+
+        minio_client.ensure_buckets()
+        bucket = settings.MINIO_BUCKET_RAW
+        df = make_dataset(args.rows, args.cols)
+        # Distinct values for a bool indicator frame of twice the memory limit
+        distinct = 2 * args.memory_limit_mb * 2 ** 20 // args.rows
+        df["id"] = (np.arange(args.rows) % distinct).astype(str)
+        minio_client.save_dataframe(df, bucket, "bench/limits.parquet")
+        source = {"bucket": bucket, "path": "bench/limits.parquet"}
+        normal = {"input_data": dict(source, columns=[c for c in df.columns if c != "id"]), "pipeline": PIPELINE,
+                  "use_cache": False}
+        hog = {"input_data": dict(source, columns=["id"]), "pipeline": [
+            {"operator": "one_hot", "params": {"columns": ["id"], "max_categories": distinct}}], "use_cache": False}
+        slow = dict(normal, streaming=True, chunk_size=args.slow_chunk_size)
+
+        queue = InMemoryJobQueue()
+        workers = {"in-process": Worker(queue, "bench", isolate=False), "child": Worker(queue, "bench")}
+        failures = []
+
+        def run(label, body, expected, worker="child", cancel_after=None):
+            job_id = str(uuid.uuid4())
+            queue.submit(job_id, PreparationRequest(**body))
+            worker = workers[worker]
+            if worker.isolate:
+                worker._prestart()
+                time.sleep(3)  # the child imports while the worker is idle
+            runner = threading.Thread(target=worker.run_once)
+            start = time.perf_counter()
+            runner.start()
+            note = ""
+            if cancel_after is not None:
+                time.sleep(cancel_after)
+                requested = time.perf_counter()
+                queue.cancel(job_id)
+                while queue.jobs[job_id]["status"] == "PROCESSING":
+                    time.sleep(0.01)
+                note = f"stopped {time.perf_counter() - requested:.2f} s after the cancel request"
+            runner.join()
+            seconds = time.perf_counter() - start
+            job = queue.jobs[job_id]
+            peak = (job["metrics"] or {}).get("peak_rss_bytes")
+            print(f"{label:<22}{job['status']:<11}{seconds:>8.2f}{peak / 2 ** 20 if peak else float('nan'):>15.0f}  {note}")
+            if job["status"] != expected:
+                failures.append(f"{label}: {job['status']} ({job['error_message']}), expected {expected}")
+
+        print(f"{args.rows} rows x {args.cols} columns, limits {args.memory_limit_mb} MiB and {args.time_limit:.0f} s")
+        print(f"{'job':<22}{'status':<11}{'seconds':>8}{'peak RSS MiB':>15}")
+        run("normal, in-process", normal, "COMPLETED", worker="in-process")
+        run("normal, child", normal, "COMPLETED")
+        run("hog", hog, "OOM")
+        run("slow", slow, "TIMEOUT")
+        run("cancelled", slow, "CANCELLED", cancel_after=args.cancel_after)
+        run("normal, child, after", normal, "COMPLETED")
+        for worker in workers.values():
+            worker.close()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
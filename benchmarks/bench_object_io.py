@@ -0,0 +1,67 @@
+"""
+Serial vs parallel MinIO transfers against a local S3-compatible stand-in.
+
+    python benchmarks/bench_object_io.py --rows 500000 --bandwidth-mbps 400 --latency-ms 5
+
+The stand-in throttles each connection, so parallel ranges and parts only help the way
+they would against a real remote object store.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from s3_standin import S3StandIn  # noqa: E402
+from src.config import settings  # noqa: E402
+from src import minio_client as minio_module  # noqa: E402
+
+
+def make_frame(rows: int, cols: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(size=(rows, cols)), columns=[f"f{i}" for i in range(cols)])
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--bandwidth-mbps", type=float, default=400.0, help="per connection")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--part-mb", type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.cols)
+    with S3StandIn(latency_ms=args.latency_ms, bandwidth_mbps=args.bandwidth_mbps) as server:
+        settings.MINIO_ENDPOINT = server.endpoint
+        settings.MINIO_PART_SIZE = args.part_mb * 1024 * 1024
+        settings.MINIO_DOWNLOAD_PART_SIZE = args.part_mb * 1024 * 1024
+        settings.CSV_WRITE_CHUNK_ROWS = 20_000
+
+        print(f"{args.rows} x {args.cols} frame, {args.latency_ms} ms latency, {args.bandwidth_mbps} Mbit/s per connection")
+        print(f"{'format':<10}{'concurrency':>12}{'upload (s)':>12}{'download (s)':>14}{'size (MB)':>11}")
+        for fmt in ("csv", "parquet"):
+            for concurrency in (1, args.concurrency):
+                settings.MINIO_TRANSFER_CONCURRENCY = concurrency
+                client = minio_module.MinioClient()
+                path = f"bench_{concurrency}.{fmt}"
+                upload = timed(lambda: client.save_dataframe(df, settings.MINIO_BUCKET_PROCESSED, path))
+                download = timed(lambda: client.load_dataframe(settings.MINIO_BUCKET_PROCESSED, path))
+                size = len(server.objects[(settings.MINIO_BUCKET_PROCESSED, path)][0]) / 1e6
+                print(f"{fmt:<10}{concurrency:>12}{upload:>12.3f}{download:>14.3f}{size:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
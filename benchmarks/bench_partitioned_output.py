@@ -0,0 +1,88 @@
+"""
+Partitioned job output against a single output object, for readers training in parallel.
+
+    python benchmarks/bench_partitioned_output.py --rows 2000000 --cols 20 --partitions 8
+
+The same job writes its output once as one Parquet object and once as `--partitions`
+objects plus a manifest (PreparationRequest.partitioning). Then each of the readers of
+a data-parallel trainer (one per partition) gets its share of the rows: from the single
+object every reader downloads and decodes the whole of it and keeps its slice, while from
+the partitioned output it fetches only its own partition listed in the manifest.
+The partitioned job encodes and uploads MINIO_TRANSFER_CONCURRENCY partitions at a time,
+but also hashes every byte it writes (SHA-256, for the manifest): on few cores it takes
+longer than the single-object job.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from s3_standin import S3StandIn  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+
+PIPELINE = [
+    {"operator": "imputer", "params": {"strategy": "mean"}},
+    {"operator": "standard_scaler", "params": {}},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--partitions", type=int, default=8)
+    args = parser.parse_args()
+
+    with S3StandIn() as server:
+        os.environ["MINIO_ENDPOINT"] = server.endpoint
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_partitioned_output.db")
+        from src.schemas import PreparationRequest
+        from src.jobs import run_preparation
+        from src.minio_client import minio_client
+        from src.config import settings
+
+        minio_client.ensure_buckets()
+        minio_client.save_dataframe(make_dataset(args.rows, args.cols), settings.MINIO_BUCKET_RAW, "bench/partitioned.parquet")
+        base = {"input_data": {"bucket": settings.MINIO_BUCKET_RAW, "path": "bench/partitioned.parquet"},
+                "pipeline": PIPELINE, "output_format": "parquet", "use_cache": False}
+        bucket = settings.MINIO_BUCKET_PROCESSED
+
+        def read(path):
+            buffer, _ = minio_client.read_object(bucket, path)
+            return pd.read_parquet(io.BytesIO(bytes(buffer)))
+
+        n = args.partitions
+        print(f"{args.rows} rows x {args.cols} columns, {n} readers")
+        print(f"{'output':<13}{'job (s)':>9}{'read per reader (s)':>21}{'MiB per reader':>16}")
+        for partitioned in (False, True):
+            request = PreparationRequest(**base, partitioning={"count": n} if partitioned else None)
+            start = time.perf_counter()
+            result = run_preparation(str(uuid.uuid4()), request)
+            job_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if partitioned:
+                manifest = json.loads(bytes(minio_client.read_object(bucket, result["output_path"])[0]))
+                parts = [read(p["path"]) for p in manifest["partitions"]]
+                size = manifest["bytes"] / n
+            else:
+                bounds = [i * args.rows // n for i in range(n + 1)]
+                parts = [read(result["output_path"]).iloc[bounds[i]:bounds[i + 1]] for i in range(n)]
+                size = minio_client.object_info(bucket, result["output_path"])[1]
+            read_seconds = (time.perf_counter() - start) / n
+            assert sum(len(part) for part in parts) == args.rows
+            label = f"{n} partitions" if partitioned else "one object"
+            print(f"{label:<13}{job_seconds:>9.2f}{read_seconds:>21.2f}{size / 2 ** 20:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Import time and cold start of the API, and its behaviour while MinIO is still down.
+
+    python benchmarks/bench_startup.py --repeat 5 --max-import-seconds 2
+
+Every measurement runs in a fresh interpreter:
+  - `import src.main`: median wall time, and which of the heavy libraries that only jobs
+    need (scikit-learn, scipy.stats) were imported; those must load on first use
+  - cold start: uvicorn launched as a subprocess, time until /health/live and until
+    /health/ready answer 200 (tables and buckets created; SQLite and the S3 stand-in)
+  - outage: the same with MinIO unreachable for --outage seconds; the process must stay
+    up, live, and not ready until the object store is back
+Exits with 1 if the import loads a deferred library or takes longer than --max-import-seconds.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import median
+
+import requests
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from s3_standin import S3StandIn  # noqa: E402
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "data_preparer")
+DEFERRED_MODULES = ["sklearn", "scipy.stats"]
+
+IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import src.main
+print(json.dumps({{"seconds": time.perf_counter() - start,
+                  "loaded": [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def service_env(minio_endpoint: str) -> dict:
+    return dict(os.environ, PYTHONPATH=SERVICE_DIR, MINIO_ENDPOINT=minio_endpoint, STARTUP_RETRY_MAX_SECONDS="1",
+                DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/bench_startup.db")
+
+
+def measure_import(minio_endpoint: str) -> dict:
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", IMPORT_PROBE], cwd=SERVICE_DIR,
+                         env=service_env(minio_endpoint), capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def wait_for(url: str, proc: subprocess.Popen, timeout: float = 120.0) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API exited with {proc.returncode} before {url} answered")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def cold_start(minio_port: int, outage: float = 0.0) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-W", "ignore", "-m", "uvicorn", "src.main:app", "--port", str(port),
+                             "--log-level", "warning"], cwd=SERVICE_DIR, env=service_env(f"127.0.0.1:{minio_port}"),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server = None
+    try:
+        live = wait_for(f"{base}/health/live", proc) - start
+        if outage:
+            time.sleep(max(outage - live, 0))
+            not_ready = requests.get(f"{base}/health/ready", timeout=5).status_code
+            server = S3StandIn(port=minio_port).__enter__()
+            back = time.perf_counter()
+            ready = wait_for(f"{base}/health/ready", proc) - back
+            return {"live": live, "ready_after_outage": ready, "status_during_outage": not_ready,
+                    "still_running": proc.poll() is None}
+        ready = wait_for(f"{base}/health/ready", proc) - start
+        return {"live": live, "ready": ready}
+    finally:
+        proc.terminate()
+        proc.wait()
+        if server is not None:
+            server.__exit__(None, None, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--outage", type=float, default=3.0)
+    parser.add_argument("--max-import-seconds", type=float)
+    args = parser.parse_args()
+
+    failures = []
+    with S3StandIn() as server:
+        imports = [measure_import(server.endpoint) for _ in range(args.repeat)]
+        seconds = median(i["seconds"] for i in imports)
+        loaded = sorted({m for i in imports for m in i["loaded"]})
+        print(f"import src.main    median {seconds:.2f} s over {args.repeat} runs, deferred modules loaded: {loaded or 'none'}")
+        if loaded:
+            failures.append(f"importing src.main loads {loaded}")
+        if args.max_import_seconds and seconds > args.max_import_seconds:
+            failures.append(f"import took {seconds:.2f} s > {args.max_import_seconds} s")
+
+        port = int(server.endpoint.rsplit(":", 1)[1])
+        starts = [cold_start(port) for _ in range(args.repeat)]
+        print(f"cold start         live after {median(s['live'] for s in starts):.2f} s, "
+              f"ready after {median(s['ready'] for s in starts):.2f} s (median)")
+
+    # The stand-in is stopped: its port now refuses connections until it is started again
+    outage = cold_start(port, args.outage)
+    print(f"MinIO down {args.outage:.0f} s    live after {outage['live']:.2f} s, /health/ready "
+          f"{outage['status_during_outage']} meanwhile, ready {outage['ready_after_outage']:.2f} s after MinIO is back")
+    if outage["status_during_outage"] != 503 or not outage["still_running"]:
+        failures.append("the API did not stay up and unready while MinIO was down")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Performance regression suite: per-operator and end-to-end DataProcessor.process timings,
+MinIO load/save per format and whole jobs, on synthetic data, fully offline.
+
+    python benchmarks/bench_suite.py --rows 200000 --cols 30 --output base.json
+    # ... change something ...
+    python benchmarks/bench_suite.py --rows 200000 --cols 30 --output new.json --compare base.json
+
+Object store traffic goes to the in-process S3 stand-in. Each case reports the best and
+median wall time over --repeat runs, then one more run for memory: the peak of allocations
+traced by tracemalloc (numpy and Python objects, not Arrow buffers) and, on Linux, the
+peak RSS growth. With --compare, cases slower (or hungrier) than the baseline by more
+than --threshold are listed and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from statistics import median
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from s3_standin import S3StandIn  # noqa: E402
+from synthetic import make_dataset, make_numeric  # noqa: E402
+
+SCHEMA_VERSION = 1
+
+OPERATORS = {
+    "fillna": {"operator": "fillna", "params": {"value": 0}},
+    "drop_na": {"operator": "drop_na", "params": {}},
+    "imputer_mean": {"operator": "imputer", "params": {"strategy": "mean"}},
+    "imputer_median": {"operator": "imputer", "params": {"strategy": "median"}},
+    "imputer_zero": {"operator": "imputer", "params": {"strategy": "constant_zero"}},
+    "imputer_most_frequent": {"operator": "imputer", "params": {"strategy": "most_frequent"}},
+    "standard_scaler": {"operator": "standard_scaler", "params": {}},
+    "minmax_scaler": {"operator": "minmax_scaler", "params": {}},
+    "one_hot": {"operator": "one_hot", "params": {"dtype": "int"}},
+    "one_hot_sparse": {"operator": "one_hot", "params": {"sparse": True}},
+    "hash_encoder": {"operator": "hash_encoder", "params": {}},
+    "frequency_encoder": {"operator": "frequency_encoder", "params": {}},
+    "target_encoder": {"operator": "target_encoder", "params": {"target": "target"}},
+}
+
+PIPELINES = {
+    "frontend_default": [
+        {"operator": "imputer", "params": {"strategy": "mean"}},
+        {"operator": "imputer", "params": {"strategy": "most_frequent"}},
+        {"operator": "standard_scaler", "params": {}},
+        {"operator": "one_hot", "params": {"dtype": "int"}},
+    ],
+    "numeric_fused": [
+        {"operator": "imputer", "params": {"strategy": "median"}},
+        {"operator": "minmax_scaler", "params": {}},
+        {"operator": "standard_scaler", "params": {}},
+    ],
+}
+
+FORMATS = ["csv", "parquet", "arrow", "npz"]
+
+
+def _rss_kb(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    # Resets VmHWM to the current RSS (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, Optional[float]]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    rss_before = _rss_kb("VmRSS") if _reset_peak_rss() else None
+    tracemalloc.start()
+    fn()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_peak = _rss_kb("VmHWM") if rss_before is not None else None
+    return {
+        "seconds_min": min(timings),
+        "seconds_median": median(timings),
+        "traced_peak_mb": traced_peak / 2 ** 20,
+        "rss_peak_growth_mb": max(rss_peak - rss_before, 0) / 1024 if rss_peak is not None else None,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args) -> List[dict]:
+    from src.config import settings
+    from src.processing import DataProcessor
+    from src.schemas import PipelineStep, PreparationRequest
+    from src.minio_client import MinioClient
+    from src.jobs import run_preparation
+
+    df = make_dataset(args.rows, args.cols, args.null_ratio, args.cardinality, seed=args.seed)
+    numeric = make_numeric(args.rows, max(args.cols // 2, 1), args.null_ratio, seed=args.seed)
+    processor = DataProcessor()
+    client = MinioClient()
+    client.ensure_buckets()
+    bucket = settings.MINIO_BUCKET_RAW
+    selected = re.compile(args.filter) if args.filter else None
+    results = []
+
+    def case(group: str, name: str, fn: Callable[[], object], rows: int = args.rows):
+        full_name = f"{group}/{name}"
+        if selected and not selected.search(full_name):
+            return
+        with contextlib.redirect_stdout(io.StringIO()):  # the services log with print()
+            stats = measure(fn, args.repeat)
+        stats.update(name=full_name, group=group, rows=rows, rows_per_second=rows / stats["seconds_min"])
+        results.append(stats)
+        rss = stats["rss_peak_growth_mb"]
+        print(f"{full_name:<40}{stats['seconds_min']:>10.4f}{stats['seconds_median']:>10.4f}"
+              f"{stats['traced_peak_mb']:>12.1f}{rss if rss is not None else float('nan'):>12.1f}", flush=True)
+
+    print(f"{args.rows} rows x {args.cols} columns, {args.null_ratio:.0%} nulls, cardinality {args.cardinality}")
+    print(f"{'case':<40}{'min (s)':>10}{'median (s)':>10}{'traced (MB)':>12}{'RSS (MB)':>12}")
+
+    for name, step in OPERATORS.items():
+        steps = [PipelineStep(**step)]
+        case("operator", name, lambda steps=steps: processor.process(df, steps, args.n_jobs))
+
+    for name, config in PIPELINES.items():
+        steps = [PipelineStep(**step) for step in config]
+        case("pipeline", name, lambda steps=steps: processor.process(df, steps, args.n_jobs))
+        case("pipeline", f"{name}_stepwise", lambda steps=steps: processor.process_stepwise(df, steps))
+
+    for fmt in args.formats:
+        frame = numeric if fmt == "npz" else df  # npz holds numbers only
+        path = f"bench/input.{fmt}"
+        case("save", fmt, lambda frame=frame, path=path: client.save_dataframe(frame, bucket, path))
+        case("load", fmt, lambda path=path: client.load_dataframe(bucket, path))
+        case("load", f"{fmt}_compact", lambda path=path: client.load_dataframe(bucket, path, compact=True))
+
+    # Whole jobs: load, fit and transform, save output and artifact
+    client.save_dataframe(df, bucket, "bench/job.parquet")
+    pipeline = PIPELINES["frontend_default"]
+    for name, options in {"in_memory": {}, "streaming": {"streaming": True}}.items():
+        request = PreparationRequest(input_data={"bucket": bucket, "path": "bench/job.parquet"},
+                                     pipeline=pipeline, output_format="parquet", **options)
+        case("job", name, lambda name=name, request=request: run_preparation(f"bench-{name}", request))
+    return results
+
+
+def compare(results: List[dict], baseline: dict, threshold: float) -> List[str]:
+    previous = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'case':<40}{'baseline (s)':>14}{'now (s)':>10}{'ratio':>8}{'memory':>8}")
+    for r in results:
+        base = previous.get(r["name"])
+        if base is None:
+            continue
+        ratio = r["seconds_min"] / base["seconds_min"] if base["seconds_min"] else float("inf")
+        memory = r["traced_peak_mb"] / base["traced_peak_mb"] if base["traced_peak_mb"] else 1.0
+        flags = []
+        if ratio > 1 + threshold:
+            flags.append("slower")
+        # Ignore growth of a few MB on small cases
+        if memory > 1 + threshold and r["traced_peak_mb"] - base["traced_peak_mb"] > 1:
+            flags.append("more memory")
+        if flags:
+            regressions.append(f"{r['name']}: {' and '.join(flags)} ({ratio:.2f}x time, {memory:.2f}x memory)")
+        print(f"{r['name']:<40}{base['seconds_min']:>14.4f}{r['seconds_min']:>10.4f}{ratio:>7.2f}x{memory:>7.2f}x"
+              f"{'  <-- ' + ', '.join(flags) if flags else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--null-ratio", type=float, default=0.05)
+    parser.add_argument("--cardinality", type=int, default=50, help="distinct values per categorical column")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--n-jobs", type=int, default=None, help="threads for column-parallel operators")
+    parser.add_argument("--formats", nargs="+", default=FORMATS, choices=FORMATS)
+    parser.add_argument("--filter", help="regex on case names, e.g. 'operator/|load/'")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.15, help="tolerated relative slowdown")
+    args = parser.parse_args()
+
+    with S3StandIn() as server:
+        # Before the first import of src: the module-level clients read these settings
+        os.environ["MINIO_ENDPOINT"] = server.endpoint
+        results = run_suite(args)
+
+    config = {k: getattr(args, k) for k in ("rows", "cols", "null_ratio", "cardinality", "seed", "repeat", "n_jobs")}
+    report = {
+        "schema": SCHEMA_VERSION,
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Warning: baseline was run with {baseline.get('config')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {baseline.get('commit') or args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Latency of the synchronous /transform endpoint for small payloads.
+
+    python benchmarks/bench_transform_latency.py --rows 10 --requests 2000
+
+Starts the API in-process (uvicorn on a local port, SQLite instead of Postgres) and
+reports p50/p99 for the plan alone, with and without the plan cache, for a fitted
+pipeline (transform only, as with job_id) and for HTTP round-trips with JSON and
+Arrow bodies over a keep-alive connection.
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "data_preparer"))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import uvicorn  # noqa: E402
+from src.main import app  # noqa: E402
+from src.artifacts import FittedPipeline  # noqa: E402
+from src.online import transform_service, frame_to_arrow, frame_from_arrow, ARROW_STREAM  # noqa: E402
+from src.processing import DataProcessor  # noqa: E402
+from src.schemas import PipelineStep  # noqa: E402
+
+PIPELINE = [
+    {"operator": "imputer", "params": {"strategy": "mean"}},
+    {"operator": "imputer", "params": {"strategy": "most_frequent"}},
+    {"operator": "standard_scaler", "params": {}},
+]
+
+
+def make_rows(rows: int, cols: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(rows, cols)), columns=[f"f{i}" for i in range(cols)])
+    df["category"] = rng.choice(["a", "b", "c"], size=rows)
+    df.iloc[0, 0] = np.nan
+    return df
+
+
+def percentiles(fn, n: int, warmup: int = 50):
+    for _ in range(warmup):
+        fn()
+    timings = np.empty(n)
+    for i in range(n):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, 50) * 1000, np.percentile(timings, 99) * 1000
+
+
+def start_server() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    df = make_rows(args.rows, args.cols)
+    steps = [PipelineStep(**step) for step in PIPELINE]
+    processor = DataProcessor()
+    key = transform_service.register(steps)
+    records = df.replace({np.nan: None}).to_dict(orient="records")
+    arrow_body = frame_to_arrow(df)
+
+    base = start_server()
+    session = requests.Session()
+
+    def post_json():
+        r = session.post(f"{base}/transform", json={"rows": records, "pipeline_id": key})
+        r.raise_for_status()
+        return r.json()
+
+    def post_arrow():
+        r = session.post(f"{base}/transform", params={"pipeline_id": key}, data=arrow_body,
+                         headers={"Content-Type": ARROW_STREAM})
+        r.raise_for_status()
+        return frame_from_arrow(r.content)
+
+    # Same result whatever the route
+    expected = processor.process(df, steps)
+    pd.testing.assert_frame_equal(expected, pd.DataFrame(post_json()["rows"]), check_dtype=False)
+    pd.testing.assert_frame_equal(expected, post_arrow(), check_dtype=False)
+
+    fitted = []
+    processor.process(df, steps, fitted=fitted)
+    fitted_pipeline = FittedPipeline(fitted, list(df.columns))
+
+    cases = [
+        ("compile + execute", lambda: processor.process(df, steps)),
+        ("cached plan", lambda: transform_service.transform(df.copy(deep=False), key)),
+        ("fitted pipeline", lambda: fitted_pipeline.transform(df)),
+        ("HTTP JSON", post_json),
+        ("HTTP Arrow", post_arrow),
+    ]
+    print(f"{args.rows} rows x {args.cols + 1} columns, {args.requests} calls each")
+    print(f"{'path':<20}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    for name, fn in cases:
+        p50, p99 = percentiles(fn, args.requests)
+        print(f"{name:<20}{p50:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Minimal in-process S3/MinIO-compatible HTTP server for offline benchmarks.
+
+Implements just what MinioClient uses: bucket HEAD/PUT, ListObjectsV2 (one page), object
+HEAD/GET (with Range), DELETE, single PUT (with If-Match / If-None-Match: *) and multipart
+uploads. Authentication is not checked. Per-request
+latency and per-connection bandwidth can be throttled to emulate a remote object store.
+"""
+import hashlib
+import re
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+
+class S3StandIn:
+    def __init__(self, latency_ms: float = 0.0, bandwidth_mbps: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency_ms / 1000.0
+        self.bandwidth = bandwidth_mbps * 1024 * 1024 / 8 if bandwidth_mbps else 0.0  # bytes/s per connection
+        self.buckets = set()
+        self.objects = {}  # (bucket, key) -> (data, content_type, etag)
+        self.uploads = {}  # upload id -> {part number: data}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> "S3StandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _throttle(self, nbytes: int):
+        delay = self.latency + (nbytes / self.bandwidth if self.bandwidth else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    def _handler(self):
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _target(self):
+                url = urlparse(self.path)
+                parts = unquote(url.path).lstrip("/").split("/", 1)
+                return parts[0], (parts[1] if len(parts) > 1 else ""), parse_qs(url.query, keep_blank_values=True)
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                data = self.rfile.read(length) if length else b""
+                store._throttle(len(data))
+                return data
+
+            def _reply(self, status: int, body: bytes = b"", headers: dict = None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body and self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _not_found(self, code: str = "NoSuchKey"):
+                body = f"<Error><Code>{code}</Code><Message>{code}</Message></Error>".encode()
+                self._reply(404, body, {"Content-Type": "application/xml"})
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                with store._lock:
+                    store.requests += 1
+                bucket, key, query = self._target()
+                if not key:
+                    if "location" in query:
+                        self._reply(200, b"<LocationConstraint></LocationConstraint>", {"Content-Type": "application/xml"})
+                    elif "list-type" in query:
+                        self._list(bucket, query.get("prefix", [""])[0])
+                    elif bucket in store.buckets:
+                        self._reply(200)
+                    else:
+                        self._not_found("NoSuchBucket")
+                    return
+
+                obj = store.objects.get((bucket, key))
+                if obj is None:
+                    return self._not_found()
+                data, content_type, etag = obj
+                headers = {"ETag": f'"{etag}"', "Content-Type": content_type,
+                           "Last-Modified": formatdate(usegmt=True), "Accept-Ranges": "bytes"}
+
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+                if match:
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else len(data) - 1
+                    body = data[start:end + 1]
+                    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                    status = 206
+                else:
+                    body, status = data, 200
+
+                if self.command == "HEAD":
+                    store._throttle(0)
+                    self.send_response(status)
+                    for k, v in headers.items():
+                        self.send_header(k, v)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                else:
+                    store._throttle(len(body))
+                    self._reply(status, body, headers)
+
+            def _list(self, bucket: str, prefix: str):
+                with store._lock:
+                    keys = sorted(k for b, k in store.objects if b == bucket and k.startswith(prefix))
+                    entries = "".join(
+                        f"<Contents><Key>{quote(k)}</Key><LastModified>2024-01-01T00:00:00.000Z</LastModified>"
+                        f"<ETag>&quot;{store.objects[(bucket, k)][2]}&quot;</ETag>"
+                        f"<Size>{len(store.objects[(bucket, k)][0])}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+                        for k in keys
+                    )
+                body = (f"<ListBucketResult><Name>{bucket}</Name><Prefix>{quote(prefix)}</Prefix><KeyCount>{len(keys)}</KeyCount>"
+                        f"<IsTruncated>false</IsTruncated><EncodingType>url</EncodingType>{entries}</ListBucketResult>").encode()
+                self._reply(200, body, {"Content-Type": "application/xml"})
+
+            def do_PUT(self):
+                bucket, key, query = self._target()
+                body = self._body()
+                if not key:
+                    store.buckets.add(bucket)
+                    return self._reply(200)
+                etag = hashlib.md5(body).hexdigest()
+                if "uploadId" in query:
+                    store.uploads[query["uploadId"][0]][int(query["partNumber"][0])] = body
+                    return self._reply(200, headers={"ETag": f'"{etag}"'})
+                if_match, if_none_match = self.headers.get("If-Match"), self.headers.get("If-None-Match")
+                with store._lock:
+                    current = store.objects.get((bucket, key))
+                    if if_match is not None and current is None:
+                        return self._not_found()
+                    if (if_match is not None and if_match.strip('"') != current[2]) or \
+                            (if_none_match == "*" and current is not None):
+                        body = b"<Error><Code>PreconditionFailed</Code><Message>PreconditionFailed</Message></Error>"
+                        return self._reply(412, body, {"Content-Type": "application/xml"})
+                    store.objects[(bucket, key)] = (body, self.headers.get("Content-Type", "application/octet-stream"), etag)
+                self._reply(200, headers={"ETag": f'"{etag}"'})
+
+            def do_POST(self):
+                bucket, key, query = self._target()
+                self._body()
+                if "uploads" in query:
+                    upload_id = uuid.uuid4().hex
+                    store.uploads[upload_id] = {"content_type": self.headers.get("Content-Type", "application/octet-stream")}
+                    body = (f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                            f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>").encode()
+                    return self._reply(200, body, {"Content-Type": "application/xml"})
+
+                upload = store.uploads.pop(query["uploadId"][0])
+                content_type = upload.pop("content_type")
+                data = b"".join(upload[n] for n in sorted(upload))
+                etag = f"{hashlib.md5(data).hexdigest()}-{len(upload)}"
+                store.objects[(bucket, key)] = (data, content_type, etag)
+                body = (f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                        f"<ETag>\"{etag}\"</ETag></CompleteMultipartUploadResult>").encode()
+                self._reply(200, body, {"Content-Type": "application/xml"})
+
+            def do_DELETE(self):
+                bucket, key, query = self._target()
+                if "uploadId" in query:
+                    store.uploads.pop(query["uploadId"][0], None)
+                else:
+                    store.objects.pop((bucket, key), None)
+                self._reply(204)
+
+        return Handler
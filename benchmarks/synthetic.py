@@ -0,0 +1,55 @@
+"""
+Synthetic datasets for the benchmarks.
+
+    from synthetic import make_dataset
+    df = make_dataset(rows=100_000, cols=20, null_ratio=0.05, cardinality=50)
+
+Columns cycle through float, int and categorical kinds (`categorical_every` sets how
+often a categorical column appears). Float and categorical columns get `null_ratio`
+missing values; int columns never have any, as in data read from a typed source.
+A binary `target` column is appended for target encoding.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def make_dataset(rows: int, cols: int, null_ratio: float = 0.05, cardinality: int = 50,
+                 categorical_every: int = 5, target: bool = True, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(cols):
+        if categorical_every and i % categorical_every == categorical_every - 1:
+            data[f"cat_{i}"] = make_categorical(rng, rows, cardinality, null_ratio)
+        elif i % 2:
+            data[f"int_{i}"] = rng.integers(0, 1000, rows)
+        else:
+            values = rng.normal(loc=i, scale=1 + i % 7, size=rows)
+            values[rng.random(rows) < null_ratio] = np.nan
+            data[f"num_{i}"] = values
+    if target:
+        data["target"] = rng.integers(0, 2, rows)
+    return pd.DataFrame(data)
+
+
+def make_categorical(rng: np.random.Generator, rows: int, cardinality: int, null_ratio: float = 0.0,
+                     skew: Optional[float] = 1.1) -> np.ndarray:
+    """Strings drawn from `cardinality` values, Zipf-like by default (a few frequent values, a long tail)."""
+    vocabulary = np.array([f"v{j:06d}" for j in range(cardinality)], dtype=object)
+    if skew:
+        weights = 1.0 / np.arange(1, cardinality + 1) ** skew
+        codes = rng.choice(cardinality, rows, p=weights / weights.sum())
+    else:
+        codes = rng.integers(0, cardinality, rows)
+    values = vocabulary[codes]
+    values[rng.random(rows) < null_ratio] = None
+    return values
+
+
+def make_numeric(rows: int, cols: int, null_ratio: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    """Float columns only, e.g. for formats that only hold numbers (npz)."""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(rows, cols))
+    values[rng.random((rows, cols)) < null_ratio] = np.nan
+    return pd.DataFrame(values, columns=[f"f{i}" for i in range(cols)])
@@ -0,0 +1,98 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .streaming import FittedStep
+from .minio_client import minio_client
+from .config import settings
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__} in a fitted pipeline")
+
+
+class FittedPipeline:
+    """
+    The state a job learned from its training data (means, scales, min/max, fill values,
+    category vocabularies), so the exact same preparation can be applied to new data
+    without refitting.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, steps: List[FittedStep], input_columns: List[str], job_id: Optional[str] = None):
+        self.steps = steps
+        self.input_columns = input_columns
+        self.job_id = job_id
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        missing = [c for c in self.input_columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Input is missing columns the pipeline was fitted on: {missing}")
+        # A copy of the fitted columns: the steps may modify it in place
+        df = df[self.input_columns].copy()
+        for step in self.steps:
+            df = step.transform(df)
+        return df
+
+    def to_bytes(self) -> bytes:
+        payload = {
+            "version": self.FORMAT_VERSION,
+            "job_id": self.job_id,
+            "input_columns": self.input_columns,
+            "steps": [{"operator": s.operator, "params": s.params, "state": s.state} for s in self.steps],
+        }
+        return gzip.compress(json.dumps(payload, default=_json_default, separators=(",", ":")).encode())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "FittedPipeline":
+        payload = json.loads(gzip.decompress(data))
+        if payload.get("version") != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported fitted pipeline version {payload.get('version')}")
+        steps = [FittedStep(s["operator"], s["params"], s["state"]) for s in payload["steps"]]
+        return cls(steps, payload["input_columns"], payload.get("job_id"))
+
+
+class ArtifactStore:
+    """
+    Saves fitted pipelines next to the job outputs and keeps the most recently used
+    ones in memory. Artifacts are written once per job and never modified, so cached
+    copies never go stale.
+    """
+    def __init__(self, client, max_cached: int):
+        self.client = client
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[Tuple[str, str], FittedPipeline]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, job_id: str, pipeline: FittedPipeline) -> Tuple[str, str]:
+        bucket = settings.MINIO_BUCKET_PROCESSED
+        path = f"{settings.ARTIFACT_PREFIX}/{job_id}.json.gz"
+        self.client.put_bytes(pipeline.to_bytes(), bucket, path, content_type="application/gzip")
+        return bucket, path
+
+    def load(self, bucket: str, path: str) -> FittedPipeline:
+        key = (bucket, path)
+        with self._lock:
+            pipeline = self._cache.get(key)
+            if pipeline is not None:
+                self._cache.move_to_end(key)
+                return pipeline
+
+        buffer, _ = self.client.read_object(bucket, path)
+        pipeline = FittedPipeline.from_bytes(bytes(buffer))
+        with self._lock:
+            self._cache[key] = pipeline
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return pipeline
+
+artifact_store = ArtifactStore(minio_client, settings.ARTIFACT_CACHE_MAX_ENTRIES)
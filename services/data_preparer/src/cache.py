@@ -0,0 +1,208 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import PreparedDataset, ResultCacheEntry
+from .schemas import PreparationRequest
+from .minio_client import minio_client, detect_format
+from .partitioning import is_manifest, remove_output
+from .config import settings
+
+
+class ResultCache:
+    """
+    Content-addressed cache of preparation outputs.
+
+    The key hashes the input object version (ETag/version id) together with the
+    canonicalized pipeline and output options, so an identical resubmission can be
+    answered with the output of the earlier job. Entries idle for longer than the TTL,
+    and the least recently used ones beyond the size limit, are evicted together with
+    their output objects; the jobs that pointed at an evicted output are marked as such.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, request: PreparationRequest, input_version: str) -> str:
+        payload = {
+            "input": {
+                "bucket": request.input_data.bucket,
+                "path": request.input_data.path,
+                "version": input_version,
+                "columns": request.input_data.columns,
+            },
+            "pipeline": [{"operator": step.operator.lower(), "params": step.params or {}} for step in request.pipeline],
+            "output": {
+                "format": request.output_format or detect_format(request.output_path),
+                "compression": request.compression,
+                "row_group_size": request.row_group_size,
+            },
+            # Streaming medians are approximate, so the two modes are not interchangeable
+            "streaming": request.streaming,
+        }
+        if request.compact_dtypes:
+            # float32 results differ from the float64 ones; only added when set so existing keys stay valid
+            payload["compact_dtypes"] = True
+        if request.partitioning is not None:
+            payload["partitioning"] = request.partitioning.model_dump()
+        if request.output_path:
+            # A hit answers with the cached location: a job naming its output only reuses one written there
+            payload["output_path"] = request.output_path
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def resolve(self, request: PreparationRequest, versions: Optional[dict] = None) -> Optional[Tuple[str, str]]:
+        """
+        Returns (cache key, input version) for a request, or None when caching does not apply.
+        `versions` memoizes the input versions across the requests of a batch: one stat per object.
+        """
+        if not settings.RESULT_CACHE_ENABLED or not request.use_cache or request.incremental is not None:
+            # An incremental job's output depends on the earlier runs, not only on its input
+            return None
+        location = (request.input_data.bucket, request.input_data.path)
+        input_version = versions.get(location) if versions is not None else None
+        if input_version is None:
+            try:
+                input_version = minio_client.object_version(*location)
+            except Exception as e:
+                print(f"Result cache: cannot stat input {location[0]}/{location[1]}: {e}")
+                return None
+            if versions is not None:
+                versions[location] = input_version
+        return self.make_key(request, input_version), input_version
+
+    def lookup(self, db: Session, cache_key: str) -> Optional[ResultCacheEntry]:
+        entry = db.query(ResultCacheEntry).filter(ResultCacheEntry.cache_key == cache_key).first()
+        if entry is not None and not self._output_intact(entry):
+            # The object now belongs to someone else (or is gone): drop the entry, keep the object
+            db.delete(entry)
+            db.commit()
+            self.evictions += 1
+            entry = None
+        elif entry is not None and self._is_expired(entry):
+            self._evict_entries(db, [entry])
+            db.commit()
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_accessed_at = datetime.now(timezone.utc)
+        db.commit()
+        return entry
+
+    def store(self, db: Session, cache_key: Tuple[str, str], job_id: str, request: PreparationRequest,
+              output_bucket: str, output_path: str):
+        key, input_version = cache_key
+        try:
+            output_etag = minio_client.object_version(output_bucket, output_path)
+        except Exception as e:
+            print(f"Result cache: cannot stat output {output_bucket}/{output_path}: {e}")
+            return
+
+        db.add(ResultCacheEntry(
+            cache_key=key,
+            job_id=job_id,
+            input_bucket=request.input_data.bucket,
+            input_path=request.input_data.path,
+            input_version=input_version,
+            output_bucket=output_bucket,
+            output_path=output_path,
+            output_etag=output_etag,
+            hit_count=0,
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # An identical job finished first; its entry stays authoritative
+            db.rollback()
+
+    def evict(self, db: Session) -> int:
+        """Applies the TTL and LRU size limit. Returns the number of evicted entries."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.RESULT_CACHE_TTL_SECONDS)
+        victims = db.query(ResultCacheEntry).filter(ResultCacheEntry.last_accessed_at < cutoff).all()
+
+        overflow = db.query(ResultCacheEntry).count() - len(victims) - settings.RESULT_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            victims += (
+                db.query(ResultCacheEntry)
+                .filter(ResultCacheEntry.last_accessed_at >= cutoff)
+                .order_by(ResultCacheEntry.last_accessed_at.asc())
+                .limit(overflow)
+                .all()
+            )
+
+        if victims:
+            self._evict_entries(db, victims)
+            db.commit()
+        return len(victims)
+
+    def stats(self, db: Session) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "entries": db.query(ResultCacheEntry).count(),
+        }
+
+    def _is_expired(self, entry: ResultCacheEntry) -> bool:
+        if entry.last_accessed_at is None:
+            return False
+        last_accessed = entry.last_accessed_at
+        if last_accessed.tzinfo is None:
+            last_accessed = last_accessed.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - last_accessed > timedelta(seconds=settings.RESULT_CACHE_TTL_SECONDS)
+
+    def _output_intact(self, entry: ResultCacheEntry) -> bool:
+        # The output may have been deleted or overwritten by a job with the same output_path
+        try:
+            return minio_client.object_version(entry.output_bucket, entry.output_path) == entry.output_etag
+        except Exception:
+            return False
+
+    def _evict_entries(self, db: Session, entries: List[ResultCacheEntry]):
+        """
+        Drops the entries and deletes their outputs, unless another entry still refers to one.
+        The completed jobs that hand out a deleted output (the job that wrote it and the jobs
+        answered from the cache) lose its location and are marked with output_evicted_at.
+        """
+        evicted_ids = {entry.id for entry in entries}
+        now = datetime.now(timezone.utc)
+        for entry in entries:
+            shared = (
+                db.query(ResultCacheEntry.id)
+                .filter(ResultCacheEntry.output_bucket == entry.output_bucket,
+                        ResultCacheEntry.output_path == entry.output_path,
+                        ResultCacheEntry.id.notin_(evicted_ids))
+                .first()
+            )
+            if shared is None and self._output_intact(entry):
+                # (An output overwritten meanwhile belongs to a later job: only the entry goes)
+                (
+                    db.query(PreparedDataset)
+                    .filter(PreparedDataset.output_bucket == entry.output_bucket,
+                            PreparedDataset.output_path == entry.output_path,
+                            PreparedDataset.status == "COMPLETED")
+                    .update({"output_bucket": None, "output_path": None, "output_manifest": None,
+                             "output_evicted_at": now}, synchronize_session=False)
+                )
+                try:
+                    if is_manifest(entry.output_path):
+                        remove_output(entry.output_bucket, entry.output_path)
+                    else:
+                        minio_client.remove_object(entry.output_bucket, entry.output_path)
+                except Exception as e:
+                    print(f"Result cache: could not delete {entry.output_bucket}/{entry.output_path}: {e}")
+            db.delete(entry)
+            self.evictions += 1
+
+result_cache = ResultCache()
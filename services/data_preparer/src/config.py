@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 
 class Settings(BaseSettings):
     MINIO_ENDPOINT: str = "localhost:9000"
@@ -7,12 +8,123 @@ class Settings(BaseSettings):
     MINIO_SECURE: bool = False
     MINIO_BUCKET_RAW: str = "raw-data"
     MINIO_BUCKET_PROCESSED: str = "processed-data"
+
+    # Object store transfers
+    MINIO_MAX_POOL_CONNECTIONS: int = 32  # shared HTTP connection pool size per process
+    MINIO_TIMEOUT_SECONDS: float = 300.0
+    MINIO_TRANSFER_CONCURRENCY: int = 8  # parallel byte ranges / multipart parts per transfer
+    MINIO_DOWNLOAD_PART_SIZE: int = 16 * 1024 * 1024
+    CSV_WRITE_CHUNK_ROWS: int = 100_000  # rows serialized at a time while uploading CSV (and sparse frames as Parquet/Arrow)
+
+    # Presigned URLs: clients upload and download objects directly, not through the services
+    MINIO_PUBLIC_ENDPOINT: Optional[str] = None  # host:port browsers reach MinIO at; defaults to MINIO_ENDPOINT
+    MINIO_PUBLIC_SECURE: Optional[bool] = None  # defaults to MINIO_SECURE
+    MINIO_REGION: str = "us-east-1"  # signed into presigned URLs, so signing needs no request to MinIO
+    PRESIGNED_URL_EXPIRY_SECONDS: int = 3600
+    UPLOAD_PREFIX: str = "uploads"  # key prefix of presigned uploads in the raw bucket
+    PREVIEW_MAX_ROWS: int = 1000  # cap on /preview?limit=
+    PREVIEW_RANGE_BYTES: int = 256 * 1024  # head of a CSV object read for a preview
     
     POSTGRES_USER: str = "user"
     POSTGRES_PASSWORD: str = "password"
     POSTGRES_DB: str = "automl"
     POSTGRES_HOST: str = "localhost"
     POSTGRES_PORT: str = "5432"
+    DATABASE_URL: Optional[str] = None  # overrides the Postgres settings, e.g. sqlite:///./jobs.db for local runs
+    DB_POOL_SIZE: int = 10  # connections kept open per process
+    DB_MAX_OVERFLOW: int = 20  # extra connections under bursts, closed when returned
+    DB_POOL_TIMEOUT: float = 30.0  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # reopen connections older than this (seconds), ahead of server/proxy idle timeouts
+    DB_POOL_PRE_PING: bool = True  # check a connection before handing it out after a database restart
+
+    # Node-local cache of parsed inputs (Arrow IPC files, memory-mapped)
+    INPUT_CACHE_DIR: Optional[str] = None  # shared by the worker processes of a node; None disables the cache
+    INPUT_CACHE_MAX_BYTES: int = 20 * 1024 ** 3  # least recently used files beyond this are deleted
+    INPUT_CACHE_MIN_BYTES: int = 4 * 1024 * 1024  # smaller objects are quicker to download again
+
+    # Streaming (chunked) execution
+    STREAM_CHUNK_ROWS: int = 100_000
+    STREAM_MEDIAN_SAMPLE_SIZE: int = 100_000
+    MINIO_PART_SIZE: int = 16 * 1024 * 1024  # multipart upload part size, min 5 MiB
+
+    # Compact dtypes on load (PreparationRequest.compact_dtypes)
+    COMPACT_CATEGORY_MAX_RATIO: float = 0.5  # text columns with at most this share of distinct values become category
+    COMPACT_STRING_DTYPE: str = "string[pyarrow]"  # dtype of the other text columns
+
+    # Partitioned output (PreparationRequest.partitioning)
+    OUTPUT_MAX_PARTITIONS: int = 1024  # cap on partitioning.count
+
+    # Columnar output defaults
+    PARQUET_COMPRESSION: str = "snappy"
+    PARQUET_ROW_GROUP_SIZE: Optional[int] = None  # rows per row group, None lets pyarrow decide
+    ARROW_COMPRESSION: str = "lz4"
+
+    # Intra-job parallelism for fused numeric operators (scalers, mean/median imputer)
+    PROCESSING_N_JOBS: int = 1  # threads per job; a request can override it with n_jobs
+    PARALLEL_MIN_COLUMNS_PER_BLOCK: int = 32  # narrower frames are not split
+
+    # Result cache
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_TTL_SECONDS: int = 7 * 24 * 3600  # entries unused for longer are evicted
+    RESULT_CACHE_MAX_ENTRIES: int = 1000  # least recently used entries beyond this are evicted
+
+    # Incremental preparation (PreparationRequest.incremental)
+    INCREMENTAL_PREFIX: str = "incremental"  # key prefix of the outputs of incremental jobs without an output_path
+
+    # Fitted pipeline artifacts
+    ARTIFACT_PREFIX: str = "artifacts"  # key prefix in the processed bucket
+    ARTIFACT_CACHE_MAX_ENTRIES: int = 64  # fitted pipelines kept in memory for /apply
+
+    # Dataset profiles (/profile)
+    PROFILE_PREFIX: str = "profiles"  # key prefix in the processed bucket
+    PROFILE_CACHE_MAX_ENTRIES: int = 256  # profiles kept in memory per API process
+    PROFILE_FULL_SCAN_MAX_BYTES: int = 64 * 1024 * 1024  # larger CSVs are sampled by byte ranges unless mode=full
+    PROFILE_SAMPLE_RANGES: int = 32
+    PROFILE_SAMPLE_RANGE_BYTES: int = 256 * 1024
+    PROFILE_SAMPLE_SIZE: int = 20_000  # values per column kept for the quantiles
+    PROFILE_HLL_PRECISION: int = 14  # 16 KiB of registers per column, ~0.8% error on distinct counts
+    PROFILE_PREVIEW_ROWS: int = 10
+
+    # Synchronous /transform
+    TRANSFORM_MAX_ROWS: int = 10_000  # larger payloads belong in /prepare
+    TRANSFORM_PLAN_CACHE_SIZE: int = 256  # compiled plans kept per process
+
+    # Job limits: checked against the estimated cost at /prepare, enforced by the workers (see supervision.py)
+    JOB_MEMORY_LIMIT_MB: Optional[int] = None  # peak memory of one job, process included; None: no limit
+    JOB_TIME_LIMIT_SECONDS: Optional[float] = None  # run time of one job; None: no limit
+    ROUTE_OVERSIZED_TO_STREAMING: bool = True  # run in-memory jobs over the memory limit in streaming mode when their pipeline allows it
+
+    # Startup (tables, buckets): retried with exponential backoff until Postgres and MinIO answer
+    STARTUP_RETRY_INITIAL_SECONDS: float = 0.5
+    STARTUP_RETRY_MAX_SECONDS: float = 15.0
+    STARTUP_MAX_ATTEMPTS: Optional[int] = None  # per step, for workers; None: retry until it succeeds. The API always retries
+
+    # Worker pool
+    WORKER_CONCURRENCY: int = 2  # worker processes per node
+    WORKER_POLL_INTERVAL: float = 1.0  # seconds between queue scans when idle
+    WORKER_HEARTBEAT_INTERVAL: float = 10.0
+    WORKER_STALL_TIMEOUT: float = 60.0  # PROCESSING jobs without a heartbeat for this long are reclaimed
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5.0  # doubled after every failed attempt
+    JOB_ISOLATION: bool = True  # run every job in a child process of the worker, under the memory and time limits
+    JOB_PROCESS_PRESTART: bool = True  # keep one child process started and imported per worker for the next job
+    JOB_ADDRESS_SPACE_HEADROOM_MB: int = 512  # added to JOB_MEMORY_LIMIT_MB in the address space limit: mapped but unused memory
+    JOB_CANCEL_POLL_INTERVAL: float = 2.0  # seconds between a worker's checks for /cancel of its jobs
+    JOB_CANCEL_GRACE_SECONDS: float = 10.0  # a cancelled or timed out job that has not stopped by then is killed
+
+    # Batches
+    BATCH_MAX_JOBS: int = 500  # jobs per /prepare/batch call
+    BATCH_GROUP_MAX_JOBS: int = 16  # variants of one input a worker runs together (one frame per shared prefix level in memory)
+
+    # Job events (long-poll /status, SSE /events)
+    STATUS_MAX_WAIT_SECONDS: float = 60.0  # cap on /status?wait=
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    JOB_EVENTS_POLL_INTERVAL: float = 1.0  # shared poller interval on databases without LISTEN/NOTIFY
+    PROGRESS_MIN_INTERVAL: float = 0.5  # workers report progress at most this often
+
+    # Job listing (GET /jobs)
+    JOB_LIST_DEFAULT_LIMIT: int = 50
+    JOB_LIST_MAX_LIMIT: int = 500
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,80 @@
+"""
+Compact in-memory dtypes for loaded frames.
+
+CSV and Arrow loads give int64/float64 numbers and Python-object strings. Compacting
+downcasts integers to the smallest type holding their values, floats to float32, and
+stores text either as category (few distinct values) or as pyarrow-backed strings.
+Sparse frames (from sparse encoders) are converted here for writers that need dense
+columns or a sparse matrix.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .config import settings
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """Bytes held by the frame, strings included."""
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def compact_column(values: pd.Series, category_max_ratio: Optional[float] = None) -> pd.Series:
+    ratio = settings.COMPACT_CATEGORY_MAX_RATIO if category_max_ratio is None else category_max_ratio
+    dtype = values.dtype
+    if not isinstance(dtype, np.dtype) or dtype.kind == "b":
+        return values
+    if dtype.kind in "iu":
+        return pd.to_numeric(values, downcast="integer" if dtype.kind == "i" else "unsigned")
+    if dtype.kind == "f":
+        return pd.to_numeric(values, downcast="float")
+    if dtype == object and pd.api.types.infer_dtype(values, skipna=True) == "string":
+        # Mixed columns (numbers and text) stay object: converting would change their values
+        if values.nunique(dropna=True) <= max(1, ratio * values.count()):
+            return values.astype("category")
+        return values.astype(settings.COMPACT_STRING_DTYPE)
+    return values
+
+
+def compact_dtypes(df: pd.DataFrame, category_max_ratio: Optional[float] = None) -> pd.DataFrame:
+    """Returns the frame with every column in its most compact dtype (see compact_column)."""
+    return pd.DataFrame({col: compact_column(df[col], category_max_ratio) for col in df.columns}, index=df.index)
+
+
+def has_sparse(df: pd.DataFrame) -> bool:
+    return any(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes)
+
+
+def densify(df: pd.DataFrame) -> pd.DataFrame:
+    """Sparse columns as regular ones, for writers and encoders without sparse support."""
+    sparse_cols = {c: dtype.subtype for c, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)}
+    return df.astype(sparse_cols) if sparse_cols else df
+
+
+def sparse_matrix(df: pd.DataFrame) -> sp.csr_matrix:
+    """
+    The frame as a float64 CSR matrix, built from the stored values of sparse columns and the
+    non-zeros of dense ones. Every column must be numeric or boolean.
+    """
+    rows, cols, data = [], [], []
+    for j, col in enumerate(df.columns):
+        values = df[col]
+        dtype = values.dtype
+        if isinstance(dtype, pd.SparseDtype) and not pd.isna(dtype.fill_value) and dtype.fill_value == 0:
+            index = values.array.sp_index.to_int_index().indices
+            stored = values.array.sp_values.astype('float64')
+        else:
+            if not (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)):
+                raise ValueError(f"Column {col} is not numeric: sparse output holds numbers only")
+            dense = values.to_numpy(dtype='float64', na_value=np.nan)
+            index = np.flatnonzero(dense != 0)  # NaN is kept as a stored value
+            stored = dense[index]
+        rows.append(index)
+        cols.append(np.full(len(index), j))
+        data.append(stored)
+    if not rows:
+        return sp.csr_matrix((len(df), 0))
+    return sp.coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                         shape=(len(df), len(df.columns))).tocsr()
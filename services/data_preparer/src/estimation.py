@@ -0,0 +1,246 @@
+"""
+Memory and run-time estimates of a preparation job, made before it is queued.
+
+The frame is simulated rather than loaded: a cached profile of the input gives its rows,
+column types and distinct counts (which size the columns one_hot adds); without one, the
+object size is scaled by a per-format expansion factor. The pipeline is then walked step
+by step, tracking the columns each step rewrites and the temporary copies it makes.
+Costs per value were measured with benchmarks/bench_suite.py on synthetic data; they
+are meant to tell whether a job fits a worker, not to predict its run time exactly.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .schemas import PreparationRequest
+from .streaming import _is_stateful
+from .expressions import split_scan
+from .minio_client import detect_format
+from .config import settings
+
+# In-memory frame bytes per object byte, when there is no profile
+EXPANSION = {"csv": 2.0, "parquet": 4.5, "arrow": 3.5, "npz": 2.0}
+# Assumed width of an unprofiled input, to turn its size into rows
+FALLBACK_COLUMNS = 20
+TEXT_VALUE_BYTES = 64  # object pointer plus a short Python str
+PROCESS_BASELINE_BYTES = 220 * 2 ** 20  # interpreter, pandas, pyarrow and sklearn loaded
+
+# Nanoseconds per input byte (transfer and parse) and per written value
+TRANSFER_NS_PER_BYTE = 10.0
+PARSE_NS_PER_BYTE = {"csv": 10.0, "parquet": 5.0, "arrow": 5.0, "npz": 2.0}
+WRITE_NS_PER_VALUE = {"csv": 350.0, "parquet": 90.0, "arrow": 90.0, "npz": 20.0}
+
+
+class _Frame:
+    """Shape of a simulated frame. Indicator columns are grouped under the column they encode."""
+    def __init__(self, rows: int):
+        self.rows = rows
+        # name -> [kind (number, text or sparse), columns, bytes per row, rewritten since the load]
+        self.columns: Dict[str, list] = {}
+        self.distinct: Dict[str, int] = {}
+
+    def add(self, name: str, kind: str, count: int, row_bytes: float, fresh: bool = False):
+        self.columns[name] = [kind, count, row_bytes, fresh]
+
+    def names(self, kind: str) -> List[str]:
+        return [name for name, c in self.columns.items() if c[0] == kind]
+
+    def nbytes(self, names: Optional[List[str]] = None, fresh_only: bool = False) -> float:
+        names = self.columns if names is None else names
+        return self.rows * sum(self.columns[n][2] for n in names if not fresh_only or self.columns[n][3])
+
+    def values(self, names: Optional[List[str]] = None) -> float:
+        names = self.columns if names is None else names
+        return float(self.rows) * sum(self.columns[n][1] for n in names)
+
+    def to_float(self, names: List[str]):
+        for name in names:
+            column = self.columns[name]
+            column[2], column[3] = column[1] * 8, True
+
+    def rewrite_all(self):
+        for column in self.columns.values():
+            column[3] = True
+
+
+def _frame(request: PreparationRequest, size: int, fmt: str, profile: Optional[Dict[str, Any]]) -> _Frame:
+    selected = request.input_data.columns
+    if profile is None:
+        frame_bytes = size * EXPANSION.get(fmt, EXPANSION["csv"])
+        width = len(selected) if selected else FALLBACK_COLUMNS
+        frame = _Frame(int(frame_bytes / (8 * width)))
+        for i in range(width):
+            frame.add(selected[i] if selected else f"column_{i}", "number", 1, 8)
+        return frame
+
+    frame = _Frame(profile["rows"])
+    for column in profile["columns"]:
+        if selected and column["name"] not in selected:
+            continue
+        try:
+            dtype = np.dtype(column["dtype"])
+            kind, row_bytes = ("number", dtype.itemsize) if dtype.kind in "biuf" else ("text", TEXT_VALUE_BYTES)
+        except TypeError:  # category, string[pyarrow], ...
+            kind, row_bytes = "text", TEXT_VALUE_BYTES
+        frame.add(column["name"], kind, 1, row_bytes)
+        frame.distinct[column["name"]] = column["distinct"]
+    return frame
+
+
+def _indicator_bytes(params: Dict[str, Any], default_sparse: bool = False) -> tuple:
+    itemsize = np.dtype(params.get("dtype") or bool).itemsize
+    return itemsize, bool(params.get("sparse", default_sparse))
+
+
+def _step(frame: _Frame, op: str, params: Dict[str, Any]) -> tuple:
+    """Applies one step to the simulated frame. Returns (bytes of temporary copies, nanoseconds)."""
+    rows = frame.rows
+    numbers = frame.names("number")
+    texts = frame.names("text")
+
+    if op in ("fillna", "drop_na"):
+        # New arrays for every column: values for numbers, pointers for text
+        copy = 1.5 * rows * 8 * sum(frame.columns[n][1] for n in frame.columns)
+        ns = (15.0 if op == "fillna" else 10.0) * frame.values()
+        frame.rewrite_all()
+        return copy, ns
+
+    if op in ("imputer", "standard_scaler", "minmax_scaler"):
+        strategy = params.get("strategy", "most_frequent") if op == "imputer" else None
+        if strategy == "most_frequent":
+            return 2.5 * rows * 8 * len(texts), 110.0 * frame.values(texts)
+        block = frame.values(numbers) * 8
+        per_value = {"mean": 20.0, "median": 110.0, "constant_zero": 10.0}.get(strategy, 30.0)
+        ns = per_value * frame.values(numbers)
+        if strategy != "constant_zero":
+            frame.to_float(numbers)
+        # The float block, the estimator's output and its temporaries
+        return (4.5 if strategy == "median" else 3.3) * block, ns
+
+    if op in ("one_hot", "get_dummies", "hash_encoder"):
+        chosen = [c for c in params["columns"] if c in frame.columns] if params.get("columns") is not None else texts
+        if op == "hash_encoder":
+            itemsize, sparse = _indicator_bytes(params, default_sparse=True)
+            widths = {c: int(params.get("n_features", 32)) for c in chosen}
+        else:
+            itemsize, sparse = _indicator_bytes(params)
+            top = params.get("max_categories")
+            extra = int(bool(params.get("dummy_na"))) - int(bool(params.get("drop_first")))
+            widths = {c: min(frame.distinct.get(c, 1), top) + 1 if top else frame.distinct.get(c, 1) + extra
+                      for c in chosen}
+        added = 0.0
+        for c in chosen:
+            if sparse:
+                # One stored value and one int32 index per row and source column
+                frame.add(c, "sparse", 1, itemsize + 4, fresh=True)
+            else:
+                frame.add(c, "number", widths[c], widths[c] * itemsize, fresh=True)
+            added += frame.nbytes([c])
+        # Indicator blocks are built, then concatenated into a new frame
+        return 2 * added, 100.0 * rows * len(chosen) + added
+
+    if op in ("frequency_encoder", "target_encoder"):
+        chosen = [c for c in params["columns"] if c in frame.columns] if params.get("columns") is not None else texts
+        chosen = [c for c in chosen if c != params.get("target")]
+        for c in chosen:
+            frame.add(c, "number", 1, 8, fresh=True)
+        return 2 * rows * 8 * len(chosen), (160.0 if op == "frequency_encoder" else 205.0) * rows * len(chosen)
+
+    if op == "filter":
+        # How many rows pass is unknown: all of them, copied
+        ns = 5.0 * frame.values() + 5.0 * rows * len(frame.columns)
+        copy = frame.nbytes()
+        frame.rewrite_all()
+        return copy, ns
+
+    if op == "select":
+        if params.get("columns") is not None:
+            keep = [c for c in params["columns"] if c in frame.columns]
+            # An unprofiled frame has made-up names: keep as many columns
+            keep = keep or list(frame.columns)[:len(params["columns"])]
+        else:
+            keep = [c for c in frame.columns if c not in set(params["drop"])]
+        frame.columns = {c: frame.columns[c] for c in keep}
+        return 0.0, 0.0
+
+    if op == "derive":
+        frame.add(params["column"], "number", 1, 8, fresh=True)
+        return 3 * rows * 8, 25.0 * rows
+
+    if op == "cast":
+        for name, dtype in params["columns"].items():
+            if name not in frame.columns:
+                continue
+            if dtype in ("string", "category"):
+                frame.add(name, "text", 1, TEXT_VALUE_BYTES if dtype == "string" else 1, fresh=True)
+            else:
+                frame.add(name, "number", 1, np.dtype(dtype).itemsize, fresh=True)
+        return 2 * rows * 8 * len(params["columns"]), 10.0 * rows * len(params["columns"])
+
+    if op in ("clip", "winsorize"):
+        chosen = [c for c in params["columns"] if c in frame.columns] if params.get("columns") is not None else numbers
+        frame.to_float(chosen)
+        # winsorize also sorts a copy of each column for its quantiles
+        ns = (10.0 if op == "clip" else 120.0) * frame.values(chosen)
+        return (2 if op == "clip" else 3) * rows * 8 * len(chosen), ns
+
+    return 0.0, 0.0
+
+
+def estimate(request: PreparationRequest, size: int, fmt: str, profile: Optional[Dict[str, Any]] = None,
+             streaming: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Peak memory (bytes, process included) and run time (seconds) of the job, for an input
+    object of `size` bytes in format `fmt`. `streaming` overrides request.streaming.
+    """
+    streaming = request.streaming if streaming is None else streaming
+    frame = _frame(request, size, fmt, profile)
+    # Steps the input scan runs shape the loaded frame instead of copying it
+    scan, steps = split_scan(request.pipeline)
+    for step in scan.steps if scan else []:
+        _step(frame, step.operator.lower(), step.params or {})
+    for column in frame.columns.values():
+        column[3] = False
+    input_bytes = frame.nbytes()
+    read_ns = size * (TRANSFER_NS_PER_BYTE + PARSE_NS_PER_BYTE.get(fmt, PARSE_NS_PER_BYTE["csv"]))
+
+    # In-memory resident set: the loaded frame stays referenced until the job ends, plus
+    # every column a step has rewritten, plus the step's temporaries
+    peak = size + input_bytes  # the downloaded object while it is parsed
+    step_ns, stateful = [], []
+    for step in steps:
+        op, params = step.operator.lower(), step.params or {}
+        before = frame.nbytes(fresh_only=True)
+        copies, ns = _step(frame, op, params)
+        peak = max(peak, input_bytes + before + copies)
+        step_ns.append(ns)
+        stateful.append(_is_stateful(op, params))
+
+    output_format = request.output_format or detect_format(request.output_path)
+    output_bytes = frame.nbytes()
+    write_ns = frame.values() * WRITE_NS_PER_VALUE.get(output_format, WRITE_NS_PER_VALUE["csv"])
+    upload_ns = output_bytes / EXPANSION.get(output_format, EXPANSION["csv"]) * TRANSFER_NS_PER_BYTE
+    # CSV is written slice by slice; the columnar writers build a whole Arrow table
+    writer = output_bytes if output_format in ("parquet", "arrow") else output_bytes * min(1.0, settings.CSV_WRITE_CHUNK_ROWS / max(frame.rows, 1))
+    peak = max(peak, input_bytes + frame.nbytes(fresh_only=True) + writer)
+
+    if streaming:
+        # Each stateful step re-reads the input and reruns the steps before it
+        fit_ns = sum(read_ns + sum(step_ns[:i]) for i, is_stateful in enumerate(stateful) if is_stateful)
+        seconds = (fit_ns + read_ns + sum(step_ns) + write_ns + upload_ns) / 1e9
+        share = min(1.0, (request.chunk_size or settings.STREAM_CHUNK_ROWS) / max(frame.rows, 1))
+        buffers = 2 * settings.MINIO_PART_SIZE * settings.MINIO_TRANSFER_CONCURRENCY
+        median = settings.STREAM_MEDIAN_SAMPLE_SIZE * 8 * len(frame.names("number"))
+        memory = (peak - size) * share + buffers + median
+    else:
+        seconds = (read_ns + sum(step_ns) + write_ns + upload_ns) / 1e9
+        memory = peak
+
+    return {
+        "basis": "profile" if profile is not None else "object_size",
+        "mode": "streaming" if streaming else "in_memory",
+        "rows": frame.rows,
+        "input_bytes": size,
+        "memory_bytes": int(PROCESS_BASELINE_BYTES + memory),
+        "seconds": round(seconds, 3),
+    }
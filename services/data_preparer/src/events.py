@@ -0,0 +1,181 @@
+"""
+Job state transitions and progress, pushed from the workers to the API processes.
+
+On PostgreSQL the job queue publishes every change with pg_notify inside the same
+transaction as the row update, and each API process holds one LISTEN connection
+that fans the events out to the long-poll and SSE clients waiting on that job.
+Other databases have no notification channel: there one shared poller per API
+process reads the state of all watched jobs in a single query per interval.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import bindparam, select as sql_select, text
+
+from .models import PreparedDataset
+from .config import settings
+
+CHANNEL = "job_events"
+
+
+# The columns job_snapshot reads: status reads and the poller select only these, not the
+# request payload and pipeline JSON of the full row
+SNAPSHOT_COLUMNS = (
+    PreparedDataset.job_id, PreparedDataset.status, PreparedDataset.progress,
+    PreparedDataset.output_bucket, PreparedDataset.output_path, PreparedDataset.error_message,
+    PreparedDataset.attempts, PreparedDataset.artifact_bucket, PreparedDataset.artifact_path,
+    PreparedDataset.metrics, PreparedDataset.queue_wait_seconds, PreparedDataset.output_manifest,
+    PreparedDataset.output_evicted_at,
+)
+
+
+# Built once: /status is the hottest query, and building and hashing the statement on every
+# call costs more than running it
+_SNAPSHOT_BY_JOB_ID = sql_select(*SNAPSHOT_COLUMNS).where(PreparedDataset.job_id == bindparam("job_id"))
+
+
+def read_snapshot(conn, job_id: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute(_SNAPSHOT_BY_JOB_ID, {"job_id": job_id}).first()
+    return job_snapshot(row) if row is not None else None
+
+
+def read_snapshots(db, job_ids) -> List[Dict[str, Any]]:
+    return [job_snapshot(row) for row in db.query(*SNAPSHOT_COLUMNS).filter(PreparedDataset.job_id.in_(job_ids)).all()]
+
+
+def job_snapshot(record) -> Dict[str, Any]:
+    """Client view of a job, from a PreparedDataset or a row of SNAPSHOT_COLUMNS."""
+    return {
+        "job_id": record.job_id,
+        "status": record.status,
+        "progress": record.progress or 0.0,
+        "output_bucket": record.output_bucket,
+        "output_path": record.output_path,
+        "error": record.error_message,
+        "attempts": record.attempts,
+        "artifact_bucket": record.artifact_bucket,
+        "artifact_path": record.artifact_path,
+        "output_manifest": record.output_manifest,
+        "output_evicted_at": record.output_evicted_at,
+        "metrics": _metrics(record),
+    }
+
+
+def _metrics(record) -> Optional[Dict[str, Any]]:
+    if record.metrics is None and record.queue_wait_seconds is None:
+        return None
+    return dict(record.metrics or {}, queue_wait_seconds=record.queue_wait_seconds)
+
+
+def publish(db, event: Dict[str, Any]):
+    """Queues a notification on the current transaction; it is delivered on commit."""
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                   {"channel": CHANNEL, "payload": json.dumps(event, default=str)})
+
+
+class _Waiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+
+class JobEventHub:
+    """
+    Per-process fan-out of job events to asyncio subscribers. The listener (or poller)
+    thread starts with the first subscription.
+    """
+    def __init__(self, engine, session_factory):
+        self.engine = engine
+        self.session_factory = session_factory
+        self._waiters: Dict[str, Set[_Waiter]] = {}
+        self._last: Dict[str, tuple] = {}  # job id -> (status, progress) last dispatched by the poller
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, job_id: str) -> _Waiter:
+        waiter = _Waiter(asyncio.get_running_loop())
+        with self._lock:
+            self._waiters.setdefault(job_id, set()).add(waiter)
+            if self._thread is None:
+                target = self._listen if self.engine.dialect.name == "postgresql" else self._poll
+                self._thread = threading.Thread(target=target, daemon=True, name="job-events")
+                self._thread.start()
+        return waiter
+
+    def unsubscribe(self, job_id: str, waiter: _Waiter):
+        with self._lock:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[job_id]
+                    self._last.pop(job_id, None)
+
+    def dispatch(self, event: Dict[str, Any]):
+        with self._lock:
+            waiters = list(self._waiters.get(event.get("job_id"), ()))
+        for waiter in waiters:
+            waiter.loop.call_soon_threadsafe(waiter.queue.put_nowait, event)
+
+    async def next_event(self, waiter: _Waiter, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(waiter.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _watched(self):
+        with self._lock:
+            return list(self._waiters)
+
+    def _poll_once(self, only_changes: bool = True):
+        job_ids = self._watched()
+        if not job_ids:
+            return
+        db = self.session_factory()
+        try:
+            events = read_snapshots(db, job_ids)
+        finally:
+            db.close()
+        for event in events:
+            state = (event["status"], event["progress"])
+            with self._lock:
+                changed = self._last.get(event["job_id"]) != state
+                if event["job_id"] in self._waiters:
+                    self._last[event["job_id"]] = state
+            if changed or not only_changes:
+                self.dispatch(event)
+
+    def _poll(self):
+        while True:
+            try:
+                self._poll_once()
+            except Exception as e:
+                print(f"Job event poller failed: {e}")
+            time.sleep(settings.JOB_EVENTS_POLL_INTERVAL)
+
+    def _listen(self):
+        while True:
+            try:
+                with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.exec_driver_sql(f"LISTEN {CHANNEL}")
+                    raw = conn.connection.driver_connection
+                    # Events sent while (re)connecting would be lost: resync from the table once
+                    self._poll_once(only_changes=False)
+                    while True:
+                        if select.select([raw], [], [], 5.0) == ([], [], []):
+                            continue
+                        raw.poll()
+                        while raw.notifies:
+                            notify = raw.notifies.pop(0)
+                            try:
+                                self.dispatch(json.loads(notify.payload))
+                            except ValueError:
+                                print(f"Ignoring malformed job event: {notify.payload[:200]}")
+            except Exception as e:
+                print(f"Job event listener disconnected: {e}; reconnecting")
+                time.sleep(settings.JOB_EVENTS_POLL_INTERVAL)
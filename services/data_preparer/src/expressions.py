@@ -0,0 +1,412 @@
+"""
+Declarative expression operators: row filters, column selection, derived columns,
+casts, clipping and winsorization.
+
+Conditions and derived columns are written as Python-syntax expressions over column
+names, e.g. "price * quantity" or "age >= 18 and country in ('DE', 'FR')". They are
+parsed once into a whitelisted syntax tree and compiled to Arrow compute expressions,
+the one engine that evaluates them everywhere, so a step gives the same result on a
+scanned input, on a chunk and on the rows sent to /apply. Nulls (and NaN read from
+pandas) propagate as in SQL: a filter drops the rows its condition is null for.
+
+A pipeline that starts with expression steps does not load its input and then trim it:
+the leading steps are compiled into one lazy Arrow dataset scan (ScanPlan). Its
+projection only decodes the columns the pipeline still needs, and its filter runs batch
+by batch while decoding (for Parquet, row groups whose statistics rule it out are
+skipped), so dropped columns and filtered-out rows never become a DataFrame.
+"""
+import ast
+import functools
+import json
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from .schemas import PipelineStep
+
+EXPRESSION_OPERATORS = {"filter", "select", "derive", "cast", "clip", "winsorize"}
+# Types `cast` accepts; category has no Arrow equivalent that converts like astype
+CAST_TYPES = {
+    "bool": pa.bool_(),
+    "int8": pa.int8(), "int16": pa.int16(), "int32": pa.int32(), "int64": pa.int64(),
+    "uint8": pa.uint8(), "uint16": pa.uint16(), "uint32": pa.uint32(), "uint64": pa.uint64(),
+    "float32": pa.float32(), "float64": pa.float64(),
+    "string": pa.string(),
+    "category": None,
+}
+
+_FUNCTIONS = {
+    "abs": (1, lambda x: pc.abs(x)),
+    "sqrt": (1, lambda x: pc.sqrt(_float(x))),
+    "log": (1, lambda x: pc.ln(_float(x))),
+    "exp": (1, lambda x: pc.exp(_float(x))),
+    "floor": (1, lambda x: pc.floor(x)),
+    "ceil": (1, lambda x: pc.ceil(x)),
+    "is_null": (1, lambda x: pc.is_null(x, nan_is_null=True)),
+    "not_null": (1, lambda x: pc.invert(pc.is_null(x, nan_is_null=True))),
+    "coalesce": (2, lambda x, y: pc.coalesce(x, y)),
+    "where": (3, lambda condition, x, y: pc.if_else(condition, x, y)),
+}
+_ARITHMETIC = {ast.Add: pc.add, ast.Sub: pc.subtract, ast.Mult: pc.multiply, ast.Pow: pc.power}
+_COMPARISONS = {ast.Eq: pc.equal, ast.NotEq: pc.not_equal, ast.Lt: pc.less, ast.LtE: pc.less_equal,
+                ast.Gt: pc.greater, ast.GtE: pc.greater_equal}
+
+
+def _float(value: pc.Expression) -> pc.Expression:
+    return value.cast(pa.float64())
+
+
+def _literal(node: ast.AST, text: str):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (bool, int, float, str)):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant) \
+            and isinstance(node.operand.value, (int, float)) and not isinstance(node.operand.value, bool):
+        return -node.operand.value
+    raise ValueError(f"Expected a literal value in {text!r}, got {ast.unparse(node)!r}")
+
+
+class Expression:
+    """A parsed expression; `columns` are the columns it reads."""
+    def __init__(self, text: str):
+        self.text = text
+        try:
+            self.tree = ast.parse(text.strip(), mode="eval").body
+        except SyntaxError as e:
+            raise ValueError(f"Invalid expression {text!r}: {e.msg}")
+        self.columns: List[str] = []
+        self._compile(self.tree, None)  # rejects unsupported syntax before anything runs
+
+    def arrow(self, env: Optional[Dict[str, pc.Expression]] = None) -> pc.Expression:
+        """The Arrow expression; `env` maps column names to the expressions that compute them."""
+        return self._compile(self.tree, env)
+
+    def evaluate(self, df: pd.DataFrame) -> pa.ChunkedArray:
+        """The value of the expression for every row of `df`."""
+        table = frame_table(df, self.columns)
+        with _type_errors():
+            return ds.dataset(table).to_table(columns={"value": self.arrow()}).column("value")
+
+    def _compile(self, node: ast.AST, env: Optional[Dict[str, pc.Expression]]) -> pc.Expression:
+        compile_ = lambda child: self._compile(child, env)
+
+        if isinstance(node, ast.Name):
+            return self._column(node.id, env)
+        if isinstance(node, ast.Constant):
+            if node.value is None or isinstance(node.value, (bool, int, float, str)):
+                return pc.scalar(node.value)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name, args = node.func.id, node.args
+            if name == "col" and len(args) == 1 and isinstance(args[0], ast.Constant) and isinstance(args[0].value, str):
+                return self._column(args[0].value, env)  # columns whose names are not identifiers
+            if name == "round" and len(args) in (1, 2):
+                return pc.round(compile_(args[0]), ndigits=int(_literal(args[1], self.text)) if len(args) == 2 else 0)
+            if name in _FUNCTIONS:
+                arity, function = _FUNCTIONS[name]
+                if len(args) != arity:
+                    raise ValueError(f"{name}() takes {arity} arguments in {self.text!r}")
+                return function(*(compile_(arg) for arg in args))
+            raise ValueError(f"Unknown function {name}() in {self.text!r}, expected one of {sorted(['col', 'round', *_FUNCTIONS])}")
+        elif isinstance(node, ast.BinOp):
+            left, right = compile_(node.left), compile_(node.right)
+            if isinstance(node.op, ast.Div):
+                # True division, as in pandas: integers divide to floats
+                return pc.divide(_float(left), _float(right))
+            if type(node.op) in _ARITHMETIC:
+                return _ARITHMETIC[type(node.op)](left, right)
+            if isinstance(node.op, ast.BitAnd):
+                return pc.and_kleene(left, right)
+            if isinstance(node.op, ast.BitOr):
+                return pc.or_kleene(left, right)
+        elif isinstance(node, ast.BoolOp):
+            combine = pc.and_kleene if isinstance(node.op, ast.And) else pc.or_kleene
+            return functools.reduce(combine, (compile_(value) for value in node.values))
+        elif isinstance(node, ast.UnaryOp):
+            operand = compile_(node.operand)
+            if isinstance(node.op, (ast.Not, ast.Invert)):
+                return pc.invert(operand)
+            if isinstance(node.op, ast.USub):
+                return pc.negate(operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+        elif isinstance(node, ast.IfExp):
+            return pc.if_else(compile_(node.test), compile_(node.body), compile_(node.orelse))
+        elif isinstance(node, ast.Compare):
+            # a < b < c is a < b and b < c
+            parts, left = [], node.left
+            for op, right in zip(node.ops, node.comparators):
+                parts.append(self._compare(op, left, right, env))
+                left = right
+            return functools.reduce(pc.and_kleene, parts)
+        raise ValueError(f"Unsupported syntax {ast.unparse(node)!r} in expression {self.text!r}")
+
+    def _compare(self, op: ast.cmpop, left: ast.AST, right: ast.AST, env) -> pc.Expression:
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            if not (isinstance(right, ast.Constant) and right.value is None):
+                raise ValueError(f"'is' only compares with None in {self.text!r}")
+            is_null = pc.is_null(self._compile(left, env), nan_is_null=True)
+            return is_null if isinstance(op, ast.Is) else pc.invert(is_null)
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+                raise ValueError(f"'in' expects a list of values in {self.text!r}")
+            values = pa.array([_literal(element, self.text) for element in right.elts])
+            operand = self._compile(left, env)
+            # is_in() is false for a null; as in SQL it is null, so `not in` drops the row as well
+            contained = pc.if_else(pc.is_null(operand), pc.scalar(pa.scalar(None, pa.bool_())),
+                                   pc.is_in(operand, value_set=values))
+            return contained if isinstance(op, ast.In) else pc.invert(contained)
+        if type(op) in _COMPARISONS:
+            return _COMPARISONS[type(op)](self._compile(left, env), self._compile(right, env))
+        raise ValueError(f"Unsupported comparison in expression {self.text!r}")
+
+    def _column(self, name: str, env: Optional[Dict[str, pc.Expression]]) -> pc.Expression:
+        if name not in self.columns:
+            self.columns.append(name)
+        if env is None:
+            return pc.field(name)
+        if name not in env:
+            raise ValueError(f"Column {name} not found (expression {self.text!r})")
+        return env[name]
+
+
+@contextmanager
+def _type_errors():
+    # e.g. a number compared with a text column: an error in the pipeline, not worth a retry
+    try:
+        yield
+    except (pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+        raise ValueError(f"Expression cannot be evaluated on these columns: {e}")
+
+
+@functools.lru_cache(maxsize=256)
+def parse(text: str) -> Expression:
+    """The parsed expression, cached: chunked and online transforms parse each step once."""
+    return Expression(text)
+
+
+def _is_number(dtype) -> bool:
+    # number_columns for a single dtype: numbers other than bool, not sparse
+    return (pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+            and not isinstance(dtype, pd.SparseDtype))
+
+
+def frame_table(df: pd.DataFrame, columns: List[str]) -> pa.Table:
+    """The given columns of a frame as an Arrow table, NaN as null."""
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found: {missing}")
+    arrays = {}
+    for col in columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.SparseDtype):
+            values = values.sparse.to_dense()
+        try:
+            arrays[col] = pa.array(values, from_pandas=True)
+        except (pa.ArrowException, TypeError) as e:
+            raise ValueError(f"Column {col} cannot be used in an expression: {e}")
+    if not arrays:
+        # Constant expressions: one value per row
+        arrays["__rows__"] = pa.nulls(len(df))
+    return pa.table(arrays)
+
+
+def _series(values: pa.ChunkedArray, index: pd.Index) -> pd.Series:
+    series = values.to_pandas()
+    series.index = index
+    return series
+
+
+def _clip_columns(df: pd.DataFrame, params: Dict[str, Any]) -> List[str]:
+    if params.get("columns") is not None:
+        missing = [c for c in params["columns"] if c not in df.columns]
+        if missing:
+            raise ValueError(f"Columns not found: {missing}")
+        return list(params["columns"])
+    return [c for c in df.columns if _is_number(df.dtypes[c])]
+
+
+def cast_column(values: pd.Series, dtype: str) -> pd.Series:
+    if dtype == "category":
+        return values.astype("category")
+    # Unsafe Arrow cast, as in a scan: floats truncate, nulls stay null
+    if isinstance(values.dtype, pd.SparseDtype):
+        values = values.sparse.to_dense()
+    try:
+        array = pc.cast(pa.array(values, from_pandas=True), CAST_TYPES[dtype], safe=False)
+    except (pa.ArrowException, TypeError) as e:
+        raise ValueError(f"Cannot cast column {values.name} to {dtype}: {e}")
+    series = array.to_pandas()
+    series.index, series.name = values.index, values.name
+    return series
+
+
+def winsorize_state(df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-column bounds at the lower/upper quantiles of the data."""
+    columns = _clip_columns(df, params)
+    q = [params.get("lower", 0.01), params.get("upper", 0.99)]
+    bounds = {}
+    for col in columns:
+        values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+        values = values[~np.isnan(values)]
+        bounds[col] = np.quantile(values, q).tolist() if len(values) else [np.nan, np.nan]
+    return {"columns": columns, "bounds": bounds}
+
+
+def transform(df: pd.DataFrame, op: str, params: Dict[str, Any], state: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Runs one expression step on a frame; winsorize needs its fitted `state`."""
+    if op == "filter":
+        mask = parse(params["condition"]).evaluate(df)
+        if not pa.types.is_boolean(mask.type):
+            raise ValueError(f"filter condition {params['condition']!r} is not a boolean expression")
+        # take() rather than a boolean index: the result is a frame of its own, not a view later steps would warn about
+        return df.take(np.flatnonzero(mask.fill_null(False).to_numpy()))
+
+    if op == "select":
+        if params.get("columns") is not None:
+            missing = [c for c in params["columns"] if c not in df.columns]
+            if missing:
+                raise ValueError(f"select: columns not found: {missing}")
+            return df.take(df.columns.get_indexer(params["columns"]), axis=1)
+        return df.drop(columns=[c for c in params["drop"] if c in df.columns])
+
+    if op == "derive":
+        df[params["column"]] = _series(parse(params["expression"]).evaluate(df), df.index)
+        return df
+
+    if op == "cast":
+        for col, dtype in params["columns"].items():
+            if col not in df.columns:
+                raise ValueError(f"cast: column {col} not found")
+            df[col] = cast_column(df[col], dtype)
+        return df
+
+    if op == "clip":
+        for col in _clip_columns(df, params):
+            df[col] = df[col].clip(params.get("lower"), params.get("upper"))
+        return df
+
+    if op == "winsorize":
+        for col, (lower, upper) in state["bounds"].items():
+            if col in df.columns and not pd.isna(lower):
+                df[col] = df[col].clip(lower, upper)
+        return df
+
+    raise ValueError(f"Unknown operator {op}")
+
+
+def _pushable(op: str, params: Dict[str, Any]) -> bool:
+    """Steps a scan can run: row-wise, and with every column they touch named in the params."""
+    if op == "cast":
+        return "category" not in params["columns"].values()
+    if op == "clip":
+        return params.get("columns") is not None
+    return op in ("filter", "select", "derive")
+
+
+class ScanPlan:
+    """
+    The leading expression steps of a pipeline, run by the input read as one Arrow scan.
+    bind() composes them against the input's columns into a projection (output column ->
+    expression over input columns) and a filter, so their order does not matter to Arrow.
+    """
+    def __init__(self, steps: List[PipelineStep]):
+        self.steps = steps
+        self.columns_read: Optional[List[str]] = None  # input columns the scan decodes, set by bind()
+
+    @property
+    def key(self) -> str:
+        return json.dumps([{"operator": s.operator.lower(), "params": s.params or {}} for s in self.steps],
+                          sort_keys=True, default=str)
+
+    def bind(self, names: List[str]) -> Tuple[Dict[str, pc.Expression], Optional[pc.Expression]]:
+        """(projection, filter) over an input with columns `names`."""
+        env = {name: pc.field(name) for name in names}
+        reads: Dict[str, Set[str]] = {name: {name} for name in names}
+        condition, condition_reads = None, set()
+
+        def inputs(expression: Expression) -> Set[str]:
+            return set().union(*(reads[c] for c in expression.columns))
+
+        for step in self.steps:
+            op, params = step.operator.lower(), step.params or {}
+            if op == "filter":
+                expression = parse(params["condition"])
+                value = expression.arrow(env)
+                condition = value if condition is None else pc.and_kleene(condition, value)
+                condition_reads |= inputs(expression)
+            elif op == "derive":
+                expression = parse(params["expression"])
+                env[params["column"]] = expression.arrow(env)
+                reads[params["column"]] = inputs(expression)
+            elif op == "select":
+                if params.get("columns") is not None:
+                    missing = [c for c in params["columns"] if c not in env]
+                    if missing:
+                        raise ValueError(f"select: columns not found: {missing}")
+                    keep = list(params["columns"])
+                else:
+                    keep = [c for c in env if c not in set(params["drop"])]
+                env = {c: env[c] for c in keep}
+                reads = {c: reads[c] for c in keep}
+            elif op in ("cast", "clip"):
+                columns = params["columns"] if op == "clip" else list(params["columns"])
+                missing = [c for c in columns if c not in env]
+                if missing:
+                    raise ValueError(f"{op}: columns not found: {missing}")
+                for col in columns:
+                    if op == "cast":
+                        env[col] = env[col].cast(CAST_TYPES[params["columns"][col]], safe=False)
+                    else:
+                        env[col] = _clip(env[col], params.get("lower"), params.get("upper"))
+
+        used = set().union(condition_reads, *reads.values())
+        self.columns_read = [name for name in names if name in used]
+        return env, condition
+
+    def to_table(self, dataset: ds.Dataset, names: List[str]) -> pa.Table:
+        projection, condition = self.bind(names)
+        with _type_errors():
+            return dataset.to_table(columns=projection, filter=condition)
+
+    def to_batches(self, dataset: ds.Dataset, names: List[str], batch_size: int) -> Iterator[pa.RecordBatch]:
+        projection, condition = self.bind(names)
+        produced, empty = False, None
+        with _type_errors():
+            for batch in dataset.to_batches(columns=projection, filter=condition, batch_size=batch_size):
+                if batch.num_rows:
+                    produced = True
+                    yield batch
+                elif empty is None:
+                    empty = batch
+        if not produced and empty is not None:
+            yield empty  # every row was filtered out: the output still gets its columns
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The same steps on a frame already in memory (inputs a scan cannot read, CSV chunks)."""
+        self.bind(list(df.columns))
+        for step in self.steps:
+            df = transform(df, step.operator.lower(), step.params or {})
+        return df
+
+
+def _clip(value: pc.Expression, lower, upper) -> pc.Expression:
+    # skip_nulls=False: a null stays null instead of becoming the bound
+    if upper is not None:
+        value = pc.min_element_wise(value, pc.scalar(upper), skip_nulls=False)
+    if lower is not None:
+        value = pc.max_element_wise(value, pc.scalar(lower), skip_nulls=False)
+    return value
+
+
+def split_scan(steps: List[PipelineStep]) -> Tuple[Optional[ScanPlan], List[PipelineStep]]:
+    """The leading steps a scan can run, as a ScanPlan (None if there are none), and the rest."""
+    count = 0
+    for step in steps:
+        if not _pushable(step.operator.lower(), step.params or {}):
+            break
+        count += 1
+    return (ScanPlan(steps[:count]) if count else None), steps[count:]
@@ -0,0 +1,219 @@
+"""
+Incremental preparation of inputs that only grow.
+
+An incremental job only reads what was added to its input since the last run into the
+same output prefix: the new objects under an input prefix (a path ending in "/"), or the
+bytes appended to a CSV object. The first run fits the pipeline; every run transforms its
+new rows and writes them as one more output partition. The manifest, {prefix}_manifest.json,
+lists the partitions, the input objects (and bytes) they cover and the fitted state. It is
+written last, once the partition is uploaded: a failed run leaves nothing the next run skips.
+
+With statistics="update", the running moments and min/max of the scalers and of the mean
+imputer absorb the new rows before these are transformed, so each partition is scaled
+with the statistics of all rows seen up to it. Earlier partitions are not rewritten.
+"""
+import hashlib
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from minio.error import S3Error
+
+from .schemas import PreparationRequest
+from .streaming import FittedStep, streaming_processor
+from .artifacts import _json_default
+from .minio_client import minio_client, detect_format, FORMAT_EXTENSIONS
+from . import metrics
+from .config import settings
+
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_VERSION = 1
+HEADER_BYTES = 64 * 1024  # read to parse the header of an appended-to CSV object
+
+
+class ManifestConflict(Exception):
+    """Another run committed to the same output first. Retryable: the retry reads its manifest."""
+
+
+def _output_format(request: PreparationRequest) -> str:
+    return request.output_format or "csv"
+
+
+def _pipeline_key(request: PreparationRequest) -> str:
+    # What the partitions of one output must have in common
+    payload = {
+        "input": [request.input_data.bucket, request.input_data.path, request.input_data.columns],
+        "pipeline": [{"operator": step.operator.lower(), "params": step.params or {}} for step in request.pipeline],
+        "format": _output_format(request),
+        "statistics": request.incremental.statistics,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def output_prefix(request: PreparationRequest) -> str:
+    """Key prefix of the partitions and manifest of an incremental job, in the processed bucket."""
+    if request.output_path:
+        return request.output_path.rstrip("/") + "/"
+    # The same input and pipeline always continue the same output
+    return f"{settings.INCREMENTAL_PREFIX}/{_pipeline_key(request)[:16]}/"
+
+
+def read_manifest(bucket: str, path: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(manifest, its object version), or (None, None) before the first run."""
+    try:
+        version, _, _ = minio_client.object_info(bucket, path)
+    except S3Error as e:
+        if e.code == "NoSuchKey":
+            return None, None
+        raise
+    # Overwritten meanwhile: the conditional commit against `version` fails and the job is retried
+    buffer, _ = minio_client.read_object(bucket, path)
+    return json.loads(bytes(buffer)), version
+
+
+def _delta(request: PreparationRequest, seen: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], Optional[Callable]]:
+    """
+    The input objects this run covers, {path: {version, size}}, and a chunk source over
+    their rows not processed yet (None if there are none). `seen` is the manifest's sources.
+    """
+    bucket, path = request.input_data.bucket, request.input_data.path
+    columns, chunk_rows = request.input_data.columns, request.chunk_size
+
+    if path.endswith("/"):
+        objects = minio_client.list_objects(bucket, path)
+        changed = [name for name, version, _ in objects if name in seen and seen[name]["version"] != version]
+        if changed:
+            raise ValueError(f"Objects processed by an earlier run were modified: {changed[:5]}; "
+                             "incremental runs expect new data in new objects")
+        new = [(name, version, size) for name, version, size in objects if name not in seen]
+        if not new:
+            return {}, None
+
+        def source():
+            for name, _, _ in new:
+                yield from minio_client.iter_dataframe_chunks(bucket, name, chunk_rows, columns)
+        return {name: {"version": version, "size": size} for name, version, size in new}, source
+
+    version, size, content_type = minio_client.object_info(bucket, path)
+    if detect_format(path, content_type) != "csv":
+        raise ValueError("The input of an incremental job must be a prefix of objects, or a CSV object rows are appended to")
+    previous = seen.get(path)
+    if previous is not None and previous["version"] == version:
+        return {}, None
+    offset = previous["size"] if previous is not None else 0
+    if size < offset:
+        raise ValueError(f"{bucket}/{path} shrank since the last run: incremental runs expect rows to be appended")
+
+    names = None
+    if offset:
+        head, boundary = minio_client.read_ranges(bucket, path, [(0, min(HEADER_BYTES, size)), (offset - 1, 1)], version)
+        if boundary != b"\n":
+            raise ValueError(f"{bucket}/{path} was rewritten since the last run, not appended to")
+        names = list(pd.read_csv(io.BytesIO(head), nrows=0).columns)
+    # Pinned to the version just stat'ed: rows appended meanwhile are left for the next run
+    source = lambda: minio_client.iter_csv_chunks_from(bucket, path, offset, names, chunk_rows, columns, version)
+    return {path: {"version": version, "size": size}}, source
+
+
+def _commit(bucket: str, path: str, manifest: Dict[str, Any], expected_version: Optional[str], partition: str):
+    data = json.dumps(manifest, default=_json_default, separators=(",", ":")).encode()
+    # One conditional PUT: of two runs that read the same manifest, only the first commits
+    if not minio_client.put_bytes_if(data, bucket, path, expected_version, content_type="application/json"):
+        # The partition is not listed anywhere: remove it so it does not linger
+        minio_client.remove_object(bucket, partition)
+        raise ManifestConflict(f"{bucket}/{path} was updated by another run")
+
+
+def run_incremental(job_id: str, request: PreparationRequest,
+                    progress: Optional[Callable[[float], None]] = None) -> Tuple[List[FittedStep], List[str], str]:
+    """
+    Runs one incremental job: fits the pipeline on the first run, transforms the new rows
+    into a new partition and commits the manifest. Returns the fitted steps, the columns
+    they were fitted on and the path of the manifest in the processed bucket.
+    """
+    report = progress or (lambda fraction: None)
+    bucket = settings.MINIO_BUCKET_PROCESSED
+    prefix = output_prefix(request)
+    manifest_path = prefix + MANIFEST_NAME
+    key = _pipeline_key(request)
+
+    manifest, manifest_version = read_manifest(bucket, manifest_path)
+    if manifest is not None and manifest["pipeline_key"] != key:
+        raise ValueError(f"{bucket}/{prefix} holds the output of another input, pipeline or output format; "
+                         "use a new output_path")
+    sources, source = _delta(request, manifest["sources"] if manifest else {})
+
+    if manifest is None:
+        if source is None:
+            raise ValueError(f"No input under {request.input_data.bucket}/{request.input_data.path}")
+        print(f"Incremental job {job_id}: first run into {bucket}/{prefix}, fitting on {len(sources)} input objects")
+        running: List[Optional[Dict[str, Any]]] = []
+        with metrics.stage("fit"):
+            fitted = streaming_processor.fit(source, request.pipeline, lambda done: report(0.9 * done), running=running)
+        input_columns = None
+        partitions = []
+    else:
+        fitted = [FittedStep(s["operator"], s["params"], s["state"]) for s in manifest["fitted"]]
+        running = manifest["running"]
+        input_columns = manifest["input_columns"]
+        partitions = manifest["partitions"]
+        if source is None:
+            print(f"Incremental job {job_id}: nothing new since the last run into {bucket}/{prefix}")
+            return fitted, input_columns, manifest_path
+        print(f"Incremental job {job_id}: {len(sources)} new or grown input objects, partition {len(partitions)}")
+        if request.incremental.statistics == "update":
+            with metrics.stage("fit"):
+                fitted = streaming_processor.refit(source, fitted, running, lambda done: report(0.9 * done))
+
+    columns, rows = [], {"in": 0, "out": 0}
+
+    def count_input(chunks):
+        for chunk in chunks:
+            if not columns:
+                columns.extend(chunk.columns)
+            rows["in"] += len(chunk)
+            metrics.count(rows_in=len(chunk))
+            yield chunk
+
+    def count_output(chunks):
+        for chunk in chunks:
+            rows["out"] += len(chunk)
+            metrics.count(rows_out=len(chunk))
+            yield chunk
+
+    fmt = _output_format(request)
+    partition = f"{prefix}part-{len(partitions):05d}-{job_id[:8]}.{FORMAT_EXTENSIONS[fmt]}"
+    with metrics.stage("transform"):
+        chunks = streaming_processor.transform(count_input(source()), fitted)
+        minio_client.save_dataframe_chunks(count_output(chunks), bucket, partition, fmt=fmt,
+                                           compression=request.compression, row_group_size=request.row_group_size)
+    report(0.9)
+
+    now = datetime.now(timezone.utc).isoformat()
+    input_columns = input_columns if input_columns is not None else list(columns)
+    partitions = partitions + [{
+        "path": partition,
+        "job_id": job_id,
+        "rows_in": rows["in"],
+        "rows": rows["out"],
+        "sources": sorted(sources),
+        "created_at": now,
+    }]
+    _commit(bucket, manifest_path, {
+        "version": MANIFEST_VERSION,
+        "pipeline_key": key,
+        "input": {"bucket": request.input_data.bucket, "path": request.input_data.path},
+        "format": fmt,
+        "statistics": request.incremental.statistics,
+        "input_columns": input_columns,
+        "fitted": [{"operator": s.operator, "params": s.params, "state": s.state} for s in fitted],
+        "running": running,
+        "sources": {**(manifest["sources"] if manifest else {}), **sources},
+        "partitions": partitions,
+        "rows": sum(p["rows"] for p in partitions),
+        "updated_at": now,
+    }, manifest_version, partition)
+    return fitted, input_columns, manifest_path
@@ -0,0 +1,251 @@
+"""
+Node-local cache of parsed input objects.
+
+A parsed input is written once as an uncompressed Arrow IPC file under INPUT_CACHE_DIR,
+named after its bucket, path and version (ETag). Later loads of the same object version
+open the file memory-mapped: no download and no CSV parsing, and every worker process
+on the node reads the same pages from the OS page cache.
+
+Files are written under a temporary name and renamed, so readers never see a partial
+file. Recency is the file mtime, refreshed on every hit, which lets all processes share
+one LRU: the oldest files beyond INPUT_CACHE_MAX_BYTES are deleted. A process that still
+has a deleted file mapped keeps reading it until it closes it.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from . import metrics
+from .config import settings
+
+_SUFFIX = ".arrow"
+_STALE_TEMP_SECONDS = 3600  # temp files of crashed writers
+
+
+def _is_default_index(df: pd.DataFrame) -> bool:
+    index = df.index
+    return isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1
+
+
+def project_names(names: List[str], columns: Optional[List[str]], fmt: str) -> List[str]:
+    """Column projection as the format's reader does it: read_csv keeps the file order."""
+    if columns is None:
+        return list(names)
+    missing = [c for c in columns if c not in names]
+    if missing:
+        raise ValueError(f"Columns not found in the input: {missing}")
+    if fmt == "csv":
+        return [c for c in names if c in set(columns)]
+    return list(columns)
+
+
+def _project(table: pa.Table, columns: Optional[List[str]], fmt: str) -> pa.Table:
+    return table if columns is None else table.select(project_names(table.column_names, columns, fmt))
+
+
+class InputCache:
+    def __init__(self, directory: Optional[str], max_bytes: int, min_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self.hits = 0
+        self.misses = 0
+        self._evict_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _file(self, bucket: str, path: str, version: str) -> str:
+        key = hashlib.sha256(f"{bucket}/{path}@{version}".encode()).hexdigest()[:32]
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def accepts(self, size: int, fmt: str) -> bool:
+        # npz inputs are sparse frames, already compact and quick to decode
+        return bool(self.directory) and fmt != "npz" and self.min_bytes <= size <= self.max_bytes
+
+    def _open(self, bucket: str, path: str, version: str) -> Optional[pa.Table]:
+        file = self._file(bucket, path, version)
+        try:
+            # Zero-copy: the table's buffers point into the mapping
+            table = pa.ipc.open_file(pa.memory_map(file)).read_all()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, pa.ArrowInvalid) as e:
+            print(f"Input cache: unreadable {file}, ignoring it: {e}")
+            self.misses += 1
+            return None
+        try:
+            os.utime(file)  # most recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return table
+
+    def table(self, bucket: str, path: str, version: str) -> Optional[pa.Table]:
+        """The cached object version as a memory-mapped Arrow table, or None."""
+        return self._open(bucket, path, version)
+
+    def read(self, bucket: str, path: str, version: str, fmt: str,
+             columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """The cached frame of this object version, or None."""
+        table = self._open(bucket, path, version)
+        if table is None:
+            return None
+        with metrics.stage("cache_read") as record:
+            df = _project(table, columns, fmt).to_pandas()
+            record["rows"] = len(df)
+        return df
+
+    def chunks(self, bucket: str, path: str, version: str, fmt: str, chunk_rows: int,
+               columns: Optional[List[str]] = None) -> Optional[Iterator[pd.DataFrame]]:
+        """The cached object as frames of at most `chunk_rows` rows, or None."""
+        table = self._open(bucket, path, version)
+        if table is None:
+            return None
+
+        def iterate():
+            offset = 0
+            for batch in _project(table, columns, fmt).to_batches(max_chunksize=chunk_rows):
+                chunk = batch.to_pandas()
+                # Row labels continue across chunks, as with read_csv(chunksize=...)
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+        return iterate()
+
+    def store(self, bucket: str, path: str, version: str, df: pd.DataFrame):
+        """Spills a whole parsed input. Frames Arrow cannot hold as they are are skipped."""
+        if not _is_default_index(df):
+            return
+        with self._writer(bucket, path, version) as write:
+            write(df)
+
+    def tee(self, bucket: str, path: str, version: str, chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        Passes the chunks of a streamed input through while spilling them. The file is only
+        kept if the whole input went through and every chunk had the dtypes of the first.
+        """
+        writer = self._writer(bucket, path, version)
+        first = None
+        with writer as write:
+            for chunk in chunks:
+                if writer.active:
+                    if first is None:
+                        first = chunk.dtypes
+                    if not chunk.dtypes.equals(first):
+                        writer.abort("chunk dtypes differ")
+                    else:
+                        write(chunk)
+                yield chunk
+
+    def _writer(self, bucket: str, path: str, version: str) -> "_SpillWriter":
+        return _SpillWriter(self, self._file(bucket, path, version))
+
+    def evict(self):
+        """Deletes the least recently used files beyond max_bytes, and stale temp files."""
+        if not self.directory or not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            files, total, now = [], 0, time.time()
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another process
+                if entry.name.endswith(_SUFFIX):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+                elif entry.name.endswith(".tmp") and now - stat.st_mtime > _STALE_TEMP_SECONDS:
+                    self._remove(entry.path)
+            for _, size, file in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                self._remove(file)
+                total -= size
+        finally:
+            self._evict_lock.release()
+
+    @staticmethod
+    def _remove(file: str):
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        files = [e for e in os.scandir(self.directory) if e.name.endswith(_SUFFIX)] if self.directory else []
+        lookups = self.hits + self.misses
+        return {
+            "enabled": bool(self.directory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "files": len(files),
+            "bytes": sum(e.stat().st_size for e in files),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class _SpillWriter:
+    """Writes frames to a temporary IPC file; on a clean exit it replaces the cache file."""
+    def __init__(self, cache: InputCache, file: str):
+        self.cache = cache
+        self.file = file
+        self.temp = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.writer = None
+        self.schema = None
+        self.active = True
+
+    def __enter__(self):
+        return self.write
+
+    def write(self, df: pd.DataFrame):
+        if not self.active:
+            return
+        try:
+            with metrics.stage("spill") as record:
+                table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+                if self.writer is None:
+                    self.schema = table.schema
+                    self.writer = pa.ipc.new_file(self.temp, table.schema)  # uncompressed, so it can be mapped
+                self.writer.write_table(table)
+                record["rows"] = len(df)
+        except (pa.ArrowException, TypeError, ValueError, OSError) as e:
+            # e.g. object columns mixing numbers and text, or a full disk
+            self.abort(str(e))
+
+    def abort(self, reason: str):
+        if self.active:
+            print(f"Input cache: not caching {os.path.basename(self.file)}: {reason}")
+        self.active = False
+        self._close()
+        InputCache._remove(self.temp)
+
+    def _close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except (pa.ArrowException, OSError):
+                pass
+            self.writer = None
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None or not self.active:
+            # Failed or abandoned half way (e.g. a streamed job closed the generator)
+            self.active = False
+            self._close()
+            InputCache._remove(self.temp)
+            return False
+        self._close()
+        if os.path.exists(self.temp):
+            os.replace(self.temp, self.file)
+            self.cache.evict()
+        return False
+
+
+input_cache = InputCache(settings.INPUT_CACHE_DIR, settings.INPUT_CACHE_MAX_BYTES, settings.INPUT_CACHE_MIN_BYTES)
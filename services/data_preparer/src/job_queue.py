@@ -0,0 +1,502 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, Dict, Any, List, Set
+
+from .models import PreparedDataset
+from .schemas import PreparationRequest
+from .cache import result_cache
+from .database import SessionLocal
+from .events import publish
+from .metrics import job_columns
+from .config import settings
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _seconds_since(moment: Optional[datetime], now: datetime) -> Optional[float]:
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)  # SQLite drops the offset
+    return max((now - moment).total_seconds(), 0.0)
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+_EVENT_FIELDS = {
+    "status": "status", "progress": "progress", "attempts": "attempts", "error_message": "error",
+    "output_bucket": "output_bucket", "output_path": "output_path",
+    "artifact_bucket": "artifact_bucket", "artifact_path": "artifact_path",
+}
+
+
+def _completed(output_bucket: str, output_path: str, artifact_bucket: Optional[str], artifact_path: Optional[str],
+               metrics: Optional[Dict[str, Any]], output_manifest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "status": "COMPLETED",
+        "progress": 1.0,
+        "output_bucket": output_bucket,
+        "output_path": output_path,
+        "artifact_bucket": artifact_bucket,
+        "artifact_path": artifact_path,
+        "output_manifest": output_manifest,
+        "error_message": None,
+        **job_columns(metrics),
+    }
+
+
+def _cache_result(db, job: "ClaimedJob", output_bucket: str, output_path: str):
+    """Indexes the output of a completed job in the result cache. Both queues complete jobs through here."""
+    if job.cache_key:
+        result_cache.store(db, job.cache_key, job.job_id, job.request, output_bucket, output_path)
+        result_cache.evict(db)
+
+
+def _event(job_id: str, values: Dict[str, Any]) -> Dict[str, Any]:
+    """The client-visible part of a state change."""
+    event = {"job_id": job_id}
+    event.update({_EVENT_FIELDS[k]: v for k, v in values.items() if k in _EVENT_FIELDS})
+    if event.get("error") and len(event["error"]) > 1000:
+        # pg_notify payloads are limited to 8000 bytes; /status has the full message
+        event["error"] = event["error"][:1000] + "..."
+    return event
+
+
+class ClaimedJob:
+    def __init__(self, job_id: str, request: PreparationRequest, attempts: int, cache_key: Optional[Tuple[str, str]] = None,
+                 batch_id: Optional[str] = None):
+        self.job_id = job_id
+        self.request = request
+        self.attempts = attempts
+        self.cache_key = cache_key
+        self.batch_id = batch_id
+
+
+# (job id, request, cache key) of a job to queue
+QueuedJob = Tuple[str, PreparationRequest, Optional[Tuple[str, str]]]
+# (job id, request, output/artifact location fields) of a job answered from the result cache
+CachedJob = Tuple[str, PreparationRequest, Dict[str, Any]]
+
+
+class SqlJobQueue:
+    """
+    Durable job queue on top of the prepared_datasets table.
+
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers on
+    any number of nodes can poll concurrently; the claim itself is a conditional UPDATE,
+    which keeps it safe on SQLite (no row locks) as well. Every state change after the
+    claim is conditioned on the claiming worker, so a worker whose job was reclaimed
+    cannot overwrite the result of the new owner.
+    """
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def submit(self, job_id: str, request: PreparationRequest, cache_key: Optional[Tuple[str, str]] = None):
+        db = self.session_factory()
+        try:
+            db.add(self._record(job_id, request, cache_key))
+            db.commit()
+        finally:
+            db.close()
+
+    def submit_batch(self, batch_id: str, jobs: List[QueuedJob], cached: Optional[List[CachedJob]] = None):
+        """Inserts all jobs of a batch, queued and already answered from the cache, in one transaction."""
+        db = self.session_factory()
+        try:
+            db.add_all([self._record(job_id, request, cache_key, batch_id) for job_id, request, cache_key in jobs])
+            db.add_all([
+                PreparedDataset(
+                    job_id=job_id,
+                    batch_id=batch_id,
+                    input_bucket=request.input_data.bucket,
+                    input_path=request.input_data.path,
+                    pipeline_config=[step.model_dump() for step in request.pipeline],
+                    status="COMPLETED",
+                    progress=1.0,
+                    **location
+                )
+                for job_id, request, location in cached or []
+            ])
+            db.commit()
+        finally:
+            db.close()
+
+    def _record(self, job_id: str, request: PreparationRequest, cache_key: Optional[Tuple[str, str]] = None,
+                batch_id: Optional[str] = None) -> PreparedDataset:
+        return PreparedDataset(
+            job_id=job_id,
+            batch_id=batch_id,
+            input_bucket=request.input_data.bucket,
+            input_path=request.input_data.path,
+            pipeline_config=[step.model_dump() for step in request.pipeline], # Store detailed config
+            request_payload=request.model_dump(),
+            cache_key=cache_key[0] if cache_key else None,
+            input_version=cache_key[1] if cache_key else None,
+            status="PENDING",
+            attempts=0,
+            available_at=_now()
+        )
+
+    def claim(self, worker_id: str) -> Optional[ClaimedJob]:
+        db = self.session_factory()
+        try:
+            record = (
+                db.query(PreparedDataset)
+                .filter(PreparedDataset.status == "PENDING", PreparedDataset.available_at <= _now())
+                .order_by(PreparedDataset.available_at, PreparedDataset.id)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if record is None:
+                db.rollback()
+                return None
+            claimed = self._claim_records(db, [record], worker_id)
+            return claimed[0] if claimed else None
+        finally:
+            db.close()
+
+    def claim_siblings(self, job: ClaimedJob, worker_id: str, limit: int) -> List[ClaimedJob]:
+        """
+        Claims up to `limit` more ready jobs of the same batch on the same input, so that
+        one worker can load the input once and share pipeline prefixes between them.
+        """
+        if not job.batch_id or limit <= 0:
+            return []
+        db = self.session_factory()
+        try:
+            records = (
+                db.query(PreparedDataset)
+                .filter(PreparedDataset.batch_id == job.batch_id,
+                        PreparedDataset.status == "PENDING",
+                        PreparedDataset.available_at <= _now(),
+                        PreparedDataset.input_bucket == job.request.input_data.bucket,
+                        PreparedDataset.input_path == job.request.input_data.path)
+                .order_by(PreparedDataset.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not records:
+                db.rollback()
+                return []
+            return self._claim_records(db, records, worker_id)
+        finally:
+            db.close()
+
+    def _claim_records(self, db, records: List[PreparedDataset], worker_id: str) -> List[ClaimedJob]:
+        now = _now()
+        candidates = []
+        for record in records:
+            attempts = (record.attempts or 0) + 1
+            cache_key = (record.cache_key, record.input_version) if record.cache_key else None
+            candidates.append((record.id, record.job_id, record.request_payload, attempts, cache_key, record.batch_id,
+                               _seconds_since(record.available_at, now)))
+
+        won = []
+        for record_id, job_id, payload, attempts, cache_key, batch_id, queue_wait in candidates:
+            claimed = (
+                db.query(PreparedDataset)
+                .filter(PreparedDataset.id == record_id, PreparedDataset.status == "PENDING")
+                .update({
+                    "status": "PROCESSING",
+                    "worker_id": worker_id,
+                    "heartbeat_at": now,
+                    "attempts": attempts,
+                    "progress": 0.0,
+                    "queue_wait_seconds": queue_wait,
+                }, synchronize_session=False)
+            )
+            if claimed == 1:
+                publish(db, _event(job_id, {"status": "PROCESSING", "attempts": attempts, "progress": 0.0}))
+                won.append((job_id, payload, attempts, cache_key, batch_id))
+        db.commit()
+
+        jobs = []
+        for job_id, payload, attempts, cache_key, batch_id in won:
+            if not payload:
+                self._finish(db, job_id, worker_id, {"status": "FAILED", "error_message": "Job has no stored request"})
+                continue
+            jobs.append(ClaimedJob(job_id, PreparationRequest(**payload), attempts, cache_key, batch_id))
+        return jobs
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        db = self.session_factory()
+        try:
+            return self._finish(db, job_id, worker_id, {"heartbeat_at": _now()}, notify=False)
+        finally:
+            db.close()
+
+    def progress(self, job_id: str, worker_id: str, fraction: float) -> bool:
+        db = self.session_factory()
+        try:
+            return self._finish(db, job_id, worker_id, {"progress": fraction, "heartbeat_at": _now()})
+        finally:
+            db.close()
+
+    def complete(self, job: ClaimedJob, worker_id: str, output_bucket: str, output_path: str,
+                 artifact_bucket: Optional[str] = None, artifact_path: Optional[str] = None,
+                 metrics: Optional[Dict[str, Any]] = None, output_manifest: Optional[Dict[str, Any]] = None) -> bool:
+        db = self.session_factory()
+        try:
+            done = self._finish(db, job.job_id, worker_id, _completed(output_bucket, output_path, artifact_bucket, artifact_path,
+                                                                      metrics, output_manifest))
+            if done:
+                _cache_result(db, job, output_bucket, output_path)
+            return done
+        finally:
+            db.close()
+
+    def fail(self, job: ClaimedJob, worker_id: str, error: str, retryable: bool = True,
+             metrics: Optional[Dict[str, Any]] = None, status: str = "FAILED") -> str:
+        """
+        Schedules a retry with exponential backoff, or ends the job for good in `status`
+        (FAILED, or TIMEOUT, OOM, CANCELLED: never retried). Returns the new status.
+        """
+        if retryable and status == "FAILED" and job.attempts < settings.JOB_MAX_ATTEMPTS:
+            values = {"status": "PENDING", "worker_id": None, "error_message": error, "progress": 0.0,
+                      "available_at": _now() + _backoff(job.attempts)}
+        else:
+            values = {"status": status, "error_message": error}
+        values.update(job_columns(metrics))
+        db = self.session_factory()
+        try:
+            self._finish(db, job.job_id, worker_id, values)
+            return values["status"]
+        finally:
+            db.close()
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancels a job: a PENDING one at once, while a PROCESSING one is flagged for its worker,
+        which stops it at its next checkpoint (see supervision.py). Returns the status of the
+        job afterwards, None if there is no such job.
+        """
+        db = self.session_factory()
+        try:
+            values = {"status": "CANCELLED", "error_message": "Job was cancelled", "worker_id": None}
+            cancelled = (
+                db.query(PreparedDataset)
+                .filter(PreparedDataset.job_id == job_id, PreparedDataset.status == "PENDING")
+                .update(values, synchronize_session=False)
+            )
+            if cancelled:
+                publish(db, _event(job_id, values))
+            else:
+                (
+                    db.query(PreparedDataset)
+                    .filter(PreparedDataset.job_id == job_id, PreparedDataset.status == "PROCESSING",
+                            PreparedDataset.cancel_requested_at.is_(None))
+                    .update({"cancel_requested_at": _now()}, synchronize_session=False)
+                )
+            db.commit()
+            return db.query(PreparedDataset.status).filter(PreparedDataset.job_id == job_id).scalar()
+        finally:
+            db.close()
+
+    def cancel_requested(self, job_ids: List[str]) -> Set[str]:
+        """The jobs among `job_ids` still PROCESSING whose cancellation was requested."""
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(PreparedDataset.job_id)
+                .filter(PreparedDataset.job_id.in_(job_ids), PreparedDataset.status == "PROCESSING",
+                        PreparedDataset.cancel_requested_at.isnot(None))
+                .all()
+            )
+            return {row.job_id for row in rows}
+        finally:
+            db.close()
+
+    def reclaim_stalled(self) -> int:
+        """Puts PROCESSING jobs whose worker stopped heartbeating back in the queue."""
+        db = self.session_factory()
+        try:
+            cutoff = _now() - timedelta(seconds=settings.WORKER_STALL_TIMEOUT)
+            stalled = (
+                db.query(PreparedDataset)
+                .filter(PreparedDataset.status == "PROCESSING", PreparedDataset.heartbeat_at < cutoff)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for record in stalled:
+                print(f"Reclaiming job {record.job_id} from stalled worker {record.worker_id}")
+                if record.cancel_requested_at is not None:
+                    record.status = "CANCELLED"
+                    record.error_message = "Job was cancelled"
+                elif (record.attempts or 0) >= settings.JOB_MAX_ATTEMPTS:
+                    record.status = "FAILED"
+                    record.error_message = "Worker stopped responding"
+                else:
+                    record.status = "PENDING"
+                    record.available_at = _now()
+                    record.progress = 0.0
+                record.worker_id = None
+                publish(db, _event(record.job_id, {"status": record.status, "error_message": record.error_message,
+                                                   "progress": record.progress}))
+            db.commit()
+            return len(stalled)
+        finally:
+            db.close()
+
+    def _finish(self, db, job_id: str, worker_id: str, values: Dict[str, Any], notify: bool = True) -> bool:
+        updated = (
+            db.query(PreparedDataset)
+            .filter(PreparedDataset.job_id == job_id,
+                    PreparedDataset.worker_id == worker_id,
+                    PreparedDataset.status == "PROCESSING")
+            .update(values, synchronize_session=False)
+        )
+        if updated == 1 and notify:
+            publish(db, _event(job_id, values))
+        db.commit()
+        return updated == 1
+
+
+class InMemoryJobQueue:
+    """
+    Process-local stand-in with the same semantics as SqlJobQueue, for tests and local runs.
+    State changes go straight to `events` (a JobEventHub), if given. The result cache index
+    stays in the database of `session_factory`, like with SqlJobQueue.
+    """
+    def __init__(self, events=None, session_factory=SessionLocal):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.events = events
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: str, request: PreparationRequest, cache_key: Optional[Tuple[str, str]] = None,
+               batch_id: Optional[str] = None):
+        with self._lock:
+            self.jobs[job_id] = {
+                "job_id": job_id, "request": request, "cache_key": cache_key, "batch_id": batch_id, "status": "PENDING",
+                "attempts": 0, "worker_id": None, "heartbeat_at": None, "available_at": _now(), "progress": 0.0,
+                "output_bucket": None, "output_path": None, "artifact_bucket": None, "artifact_path": None,
+                "output_manifest": None, "error_message": None, "queue_wait_seconds": None, "metrics": None,
+                "cancel_requested_at": None,
+            }
+
+    def submit_batch(self, batch_id: str, jobs: List[QueuedJob], cached: Optional[List[CachedJob]] = None):
+        for job_id, request, cache_key in jobs:
+            self.submit(job_id, request, cache_key, batch_id)
+        for job_id, request, location in cached or []:
+            self.submit(job_id, request, None, batch_id)
+            self.jobs[job_id].update(status="COMPLETED", progress=1.0, **location)
+
+    def claim(self, worker_id: str) -> Optional[ClaimedJob]:
+        with self._lock:
+            now = _now()
+            ready = [j for j in self.jobs.values() if j["status"] == "PENDING" and j["available_at"] <= now]
+            if not ready:
+                return None
+            job = min(ready, key=lambda j: j["available_at"])
+        claimed = self._claim([job], worker_id)
+        return claimed[0] if claimed else None
+
+    def claim_siblings(self, job: ClaimedJob, worker_id: str, limit: int) -> List[ClaimedJob]:
+        if not job.batch_id or limit <= 0:
+            return []
+        with self._lock:
+            now = _now()
+            input_data = job.request.input_data
+            ready = [j for j in self.jobs.values()
+                     if j["batch_id"] == job.batch_id and j["status"] == "PENDING" and j["available_at"] <= now
+                     and (j["request"].input_data.bucket, j["request"].input_data.path) == (input_data.bucket, input_data.path)]
+        return self._claim(ready[:limit], worker_id)
+
+    def _claim(self, candidates: List[Dict[str, Any]], worker_id: str) -> List[ClaimedJob]:
+        claimed = []
+        with self._lock:
+            now = _now()
+            for job in candidates:
+                if job["status"] == "PENDING":
+                    job.update(status="PROCESSING", worker_id=worker_id, heartbeat_at=now, attempts=job["attempts"] + 1, progress=0.0,
+                               queue_wait_seconds=_seconds_since(job["available_at"], now))
+                    claimed.append(job)
+        for job in claimed:
+            self._notify(job["job_id"], {"status": "PROCESSING", "attempts": job["attempts"], "progress": 0.0})
+        return [ClaimedJob(j["job_id"], j["request"], j["attempts"], j["cache_key"], j["batch_id"]) for j in claimed]
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        return self._finish(job_id, worker_id, {"heartbeat_at": _now()}, notify=False)
+
+    def progress(self, job_id: str, worker_id: str, fraction: float) -> bool:
+        return self._finish(job_id, worker_id, {"progress": fraction, "heartbeat_at": _now()})
+
+    def complete(self, job: ClaimedJob, worker_id: str, output_bucket: str, output_path: str,
+                 artifact_bucket: Optional[str] = None, artifact_path: Optional[str] = None,
+                 metrics: Optional[Dict[str, Any]] = None, output_manifest: Optional[Dict[str, Any]] = None) -> bool:
+        done = self._finish(job.job_id, worker_id, _completed(output_bucket, output_path, artifact_bucket, artifact_path,
+                                                              metrics, output_manifest))
+        if done and job.cache_key:
+            db = self.session_factory()
+            try:
+                _cache_result(db, job, output_bucket, output_path)
+            finally:
+                db.close()
+        return done
+
+    def fail(self, job: ClaimedJob, worker_id: str, error: str, retryable: bool = True,
+             metrics: Optional[Dict[str, Any]] = None, status: str = "FAILED") -> str:
+        if retryable and status == "FAILED" and job.attempts < settings.JOB_MAX_ATTEMPTS:
+            values = {"status": "PENDING", "worker_id": None, "error_message": error, "progress": 0.0,
+                      "available_at": _now() + _backoff(job.attempts)}
+        else:
+            values = {"status": status, "error_message": error}
+        values.update(job_columns(metrics))
+        self._finish(job.job_id, worker_id, values)
+        return values["status"]
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        values = {"status": "CANCELLED", "error_message": "Job was cancelled", "worker_id": None}
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            cancelled = job["status"] == "PENDING"
+            if cancelled:
+                job.update(values)
+            elif job["status"] == "PROCESSING" and job["cancel_requested_at"] is None:
+                job["cancel_requested_at"] = _now()
+            status = job["status"]
+        if cancelled:
+            self._notify(job_id, values)
+        return status
+
+    def cancel_requested(self, job_ids: List[str]) -> Set[str]:
+        with self._lock:
+            return {job_id for job_id in job_ids if job_id in self.jobs and self.jobs[job_id]["status"] == "PROCESSING"
+                    and self.jobs[job_id]["cancel_requested_at"] is not None}
+
+    def reclaim_stalled(self) -> int:
+        with self._lock:
+            cutoff = _now() - timedelta(seconds=settings.WORKER_STALL_TIMEOUT)
+            stalled = [j for j in self.jobs.values() if j["status"] == "PROCESSING" and j["heartbeat_at"] < cutoff]
+            for job in stalled:
+                if job["cancel_requested_at"] is not None:
+                    job.update(status="CANCELLED", error_message="Job was cancelled", worker_id=None)
+                elif job["attempts"] >= settings.JOB_MAX_ATTEMPTS:
+                    job.update(status="FAILED", error_message="Worker stopped responding", worker_id=None)
+                else:
+                    job.update(status="PENDING", available_at=_now(), worker_id=None, progress=0.0)
+        for job in stalled:
+            self._notify(job["job_id"], {"status": job["status"], "error_message": job["error_message"],
+                                         "progress": job["progress"]})
+        return len(stalled)
+
+    def _finish(self, job_id: str, worker_id: str, values: Dict[str, Any], notify: bool = True) -> bool:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["worker_id"] != worker_id or job["status"] != "PROCESSING":
+                return False
+            job.update(values)
+        if notify:
+            self._notify(job_id, values)
+        return True
+
+    def _notify(self, job_id: str, values: Dict[str, Any]):
+        if self.events is not None:
+            self.events.dispatch(_event(job_id, values))
@@ -0,0 +1,247 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from minio.error import S3Error
+import pandas as pd
+
+from .schemas import PreparationRequest, PipelineStep
+from .processing import processor
+from .streaming import FittedStep, streaming_processor
+from .expressions import ScanPlan, split_scan
+from .artifacts import FittedPipeline, artifact_store
+from .incremental import run_incremental
+from .minio_client import minio_client, detect_format, FORMAT_EXTENSIONS
+from .supervision import JobInterrupted, JobProcessError, checkpoint
+from . import metrics, partitioning
+from .config import settings
+
+# Errors caused by the data, the pipeline or the job limits: retrying would fail the same way
+NON_RETRYABLE_ERRORS = (ValueError, TypeError, KeyError, MemoryError, JobInterrupted)
+NON_RETRYABLE_S3_CODES = {"NoSuchKey", "NoSuchBucket", "AccessDenied"}
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, JobProcessError):
+        return error.retryable
+    if isinstance(error, S3Error):
+        return error.code not in NON_RETRYABLE_S3_CODES
+    return not isinstance(error, NON_RETRYABLE_ERRORS)
+
+
+def _output_location(job_id: str, request: PreparationRequest):
+    output_format = request.output_format or detect_format(request.output_path)
+    output_filename = f"processed_{job_id}.{FORMAT_EXTENSIONS[output_format]}"
+    output_path = request.output_path or output_filename
+    if request.partitioning is not None:
+        # The job's output is the manifest, which lists the partitions next to it
+        output_path = partitioning.output_prefix(job_id, request) + partitioning.MANIFEST_NAME
+    output_options = {"fmt": output_format, "compression": request.compression, "row_group_size": request.row_group_size}
+    return settings.MINIO_BUCKET_PROCESSED, output_path, output_options
+
+
+def _save_output(job_id: str, request: PreparationRequest, df: pd.DataFrame, output_bucket: str, output_path: str,
+                 output_options: dict) -> Optional[dict]:
+    """Writes an in-memory output; returns the manifest of a partitioned one."""
+    if request.partitioning is None:
+        minio_client.save_dataframe(df, output_bucket, output_path, **output_options)
+        return None
+    return partitioning.write_frame(job_id, df, output_bucket, partitioning.output_prefix(job_id, request),
+                                    request.partitioning, **output_options)
+
+
+def _scanned(scan: Optional[ScanPlan]) -> List[FittedStep]:
+    # Steps run by the input scan learn nothing, but /apply reruns them on new rows
+    return [FittedStep(s.operator.lower(), s.params or {}, None) for s in scan.steps] if scan else []
+
+
+def _save_artifact(job_id: str, fitted: list, input_columns: List[str], output_bucket: str, output_path: str,
+                   manifest: Optional[dict] = None) -> Dict[str, Any]:
+    with metrics.stage("artifact"):
+        artifact_bucket, artifact_path = artifact_store.save(job_id, FittedPipeline(fitted, input_columns, job_id))
+    return {
+        "output_bucket": output_bucket,
+        "output_path": output_path,
+        "artifact_bucket": artifact_bucket,
+        "artifact_path": artifact_path,
+        "output_manifest": manifest,
+    }
+
+
+def run_preparation(job_id: str, request: PreparationRequest,
+                    progress: Optional[Callable[[float], None]] = None) -> Dict[str, Any]:
+    """
+    Loads the input, runs the pipeline and saves the output of one job, along with
+    the fitted pipeline that /apply reuses on new data. `progress` receives the
+    completed fraction of the job (0..1) at each milestone.
+    Returns the locations of the output object and of the fitted pipeline artifact, and the
+    manifest of a partitioned output.
+    """
+    report = progress or (lambda fraction: None)
+    if request.incremental is not None:
+        # Only the rows added since the last run, into a new partition listed by the output manifest
+        fitted, input_columns, manifest_path = run_incremental(job_id, request, report)
+        report(0.95)
+        return _save_artifact(job_id, fitted, input_columns, settings.MINIO_BUCKET_PROCESSED, manifest_path)
+
+    output_bucket, output_path, output_options = _output_location(job_id, request)
+    manifest = None
+    # Leading filter/select/derive/cast/clip steps run in the input read
+    scan, steps = split_scan(request.pipeline)
+    offset = len(scan.steps) if scan else 0  # index of steps[0] in the pipeline, for the operator metrics
+
+    if request.streaming:
+        # Chunked mode: fit passes over the object, then transform and multipart-upload chunk by chunk
+        print(f"Streaming data from {request.input_data.bucket}/{request.input_data.path}")
+        source = lambda: minio_client.iter_dataframe_chunks(
+            request.input_data.bucket, request.input_data.path, request.chunk_size, request.input_data.columns, scan
+        )
+        # Each fit pass reads the whole input: the passes split 90% of the progress bar
+        with metrics.stage("fit"):
+            fitted = streaming_processor.fit(source, steps, lambda done: report(0.9 * done))
+        input_columns = []
+
+        def capture_columns(chunks):
+            for chunk in chunks:
+                if not input_columns:
+                    input_columns.extend(chunk.columns)
+                metrics.count(rows_in=len(chunk))
+                yield chunk
+
+        def count_output(chunks):
+            for chunk in chunks:
+                metrics.count(rows_out=len(chunk))
+                yield chunk
+
+        # Reading, transforming and writing are interleaved chunk by chunk: one stage
+        with metrics.stage("transform"):
+            chunks = count_output(streaming_processor.transform(capture_columns(source()), fitted, offset))
+            if request.partitioning is None:
+                minio_client.save_dataframe_chunks(chunks, output_bucket, output_path, **output_options)
+            else:
+                manifest = partitioning.write_chunks(job_id, chunks, output_bucket, partitioning.output_prefix(job_id, request),
+                                                     request.partitioning, **output_options)
+        fitted = _scanned(scan) + fitted
+    else:
+        # 1. Load Data
+        print(f"Loading data from {request.input_data.bucket}/{request.input_data.path}")
+        df = minio_client.load_dataframe(request.input_data.bucket, request.input_data.path, request.input_data.columns,
+                                         compact=request.compact_dtypes, scan=scan)
+        metrics.count(rows_in=len(df))
+        report(0.4)
+        checkpoint()
+
+        # 2. Process Data
+        fitted = _scanned(scan)
+        input_columns = list(df.columns)
+        with metrics.stage("process", rows=len(df)):
+            df_clean = processor.process(df, steps, request.n_jobs, fitted=fitted, offset=offset)
+        report(0.7)
+        checkpoint()
+
+        # 3. Save Data
+        manifest = _save_output(job_id, request, df_clean, output_bucket, output_path, output_options)
+        metrics.count(rows_out=len(df_clean))
+
+    if scan is not None:
+        # Rows sent to /apply need the input columns the scan read, not the ones it produced
+        input_columns = scan.columns_read
+    report(0.95)
+    return _save_artifact(job_id, fitted, input_columns, output_bucket, output_path, manifest)
+
+
+class _PrefixNode:
+    """Node of a trie of pipelines: the steps on the path from the root are shared by every job below."""
+    def __init__(self):
+        self.children: Dict[str, Tuple[PipelineStep, "_PrefixNode"]] = {}
+        self.jobs: List[Tuple[str, PreparationRequest]] = []  # jobs whose pipeline ends here
+
+    def add(self, job_id: str, request: PreparationRequest, steps: List[PipelineStep]):
+        node = self
+        for step in steps:
+            key = json.dumps({"operator": step.operator.lower(), "params": step.params or {}}, sort_keys=True, default=str)
+            if key not in node.children:
+                node.children[key] = (step, _PrefixNode())
+            node = node.children[key][1]
+        node.jobs.append((job_id, request))
+
+    def all_jobs(self) -> List[str]:
+        jobs = [job_id for job_id, _ in self.jobs]
+        for _, child in self.children.values():
+            jobs.extend(child.all_jobs())
+        return jobs
+
+
+def run_preparation_group(jobs: List[Tuple[str, PreparationRequest]],
+                          progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Union[Dict[str, Any], Exception]]:
+    """
+    Runs several jobs of a batch together: each distinct input (and input scan, see
+    expressions.ScanPlan) is loaded once, and the remaining steps form a prefix trie whose
+    shared steps run once, e.g. one imputation feeding several scalers. Runs of steps that do not branch are processed in one call, so they
+    are still compiled and fused together.
+    Returns, per job id, the result run_preparation would return, or the exception that failed the job.
+    """
+    report = progress or (lambda job_id, fraction: None)
+    results: Dict[str, Union[Dict[str, Any], Exception]] = {}
+    inputs: Dict[tuple, List[Tuple[str, PreparationRequest]]] = {}
+    for job_id, request in jobs:
+        if request.streaming:
+            # Chunked jobs never hold the input in memory, so they cannot share it
+            try:
+                results[job_id] = run_preparation(job_id, request, lambda f, job_id=job_id: report(job_id, f))
+            except Exception as e:
+                results[job_id] = e
+            continue
+        location = request.input_data
+        scan, _ = split_scan(request.pipeline)
+        key = (location.bucket, location.path, tuple(location.columns) if location.columns is not None else None,
+               request.compact_dtypes, scan.key if scan else None)
+        inputs.setdefault(key, []).append((job_id, request))
+
+    for (bucket, path, columns, compact, _), members in inputs.items():
+        print(f"Loading data from {bucket}/{path} for {len(members)} jobs")
+        scan, _ = split_scan(members[0][1].pipeline)
+        try:
+            df = minio_client.load_dataframe(bucket, path, list(columns) if columns is not None else None, compact, scan)
+        except Exception as e:
+            results.update({job_id: e for job_id, _ in members})
+            continue
+        metrics.count(rows_in=len(df))
+        for job_id, _ in members:
+            report(job_id, 0.4)
+
+        root = _PrefixNode()
+        offset = len(scan.steps) if scan else 0
+        for job_id, request in members:
+            root.add(job_id, request, request.pipeline[offset:])
+        n_jobs = max((request.n_jobs or 0) for _, request in members) or None
+        input_columns = scan.columns_read if scan else list(df.columns)
+        _run_prefix_tree(root, df, _scanned(scan), input_columns, n_jobs, results, report, offset)
+    return results
+
+
+def _run_prefix_tree(node: _PrefixNode, df: pd.DataFrame, fitted: list, input_columns: List[str],
+                     n_jobs: Optional[int], results: dict, report: Callable[[str, float], None], offset: int = 0):
+    for job_id, request in node.jobs:
+        try:
+            checkpoint()
+            output_bucket, output_path, output_options = _output_location(job_id, request)
+            manifest = _save_output(job_id, request, df, output_bucket, output_path, output_options)
+            metrics.count(rows_out=len(df))
+            report(job_id, 0.95)
+            results[job_id] = _save_artifact(job_id, fitted, input_columns, output_bucket, output_path, manifest)
+        except Exception as e:
+            results[job_id] = e
+
+    for step, child in node.children.values():
+        steps = [step]
+        while not child.jobs and len(child.children) == 1:
+            step, child = next(iter(child.children.values()))
+            steps.append(step)
+        child_fitted = list(fitted)
+        try:
+            # process() leaves its input untouched, so every branch starts from the same frame
+            with metrics.stage("process", rows=len(df)):
+                out = processor.process(df, steps, n_jobs, fitted=child_fitted, offset=offset)
+        except Exception as e:
+            results.update({job_id: e for job_id in child.all_jobs()})
+            continue
+        _run_prefix_tree(child, out, child_fitted, input_columns, n_jobs, results, report, offset + len(steps))
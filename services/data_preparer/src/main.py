@@ -1,107 +1,565 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from minio.error import S3Error
+from pydantic import ValidationError
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+import re
 import uuid
-import traceback
 
-from .schemas import PreparationRequest, PreparationResponse
-from .database import engine, Base, get_db
-from .models import PreparedDataset
-from .processing import processor
-from .minio_client import minio_client
+from .schemas import PreparationRequest, PreparationResponse, BatchPreparationRequest, BatchPreparationResponse, ApplyRequest, TransformRequest, UploadRequest
+from .database import engine, get_db, SessionLocal
+from .models import PreparedDataset, TERMINAL_STATUSES
+from .events import JobEventHub, read_snapshot
+from .cache import result_cache
+from .profiling import profile_store
+from .operators import PipelineError, validate_pipeline, streamable
+from .estimation import estimate
+from .metrics import prometheus_text
+from .online import transform_service, frame_from_records, frame_to_records, frame_from_arrow, frame_to_arrow, ARROW_STREAM
+from .minio_client import minio_client, detect_format, FORMAT_EXTENSIONS
+from .dtypes import densify
+from .job_queue import SqlJobQueue
+from .startup import startup
 from .config import settings
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables and buckets are set up in the background: the process is live at once, ready after
+    startup.start()
+    yield
 
-app = FastAPI(title="Data Preparer Service")
+app = FastAPI(title="Data Preparer Service", lifespan=lifespan)
 
-def process_data_task(job_id: str, request: PreparationRequest, db_session_factory):
+# Jobs are executed by the worker pool (python -m src.worker), not in the API process
+job_queue = SqlJobQueue(SessionLocal)
+# Pushes job state changes to long-poll and SSE clients (LISTEN/NOTIFY on PostgreSQL)
+job_events = JobEventHub(engine, SessionLocal)
+
+@app.get("/health")
+@app.get("/health/live")
+def health_check():
+    """Liveness: the process is up. Touches neither the database nor MinIO."""
+    return {"status": "healthy"}
+
+@app.get("/health/ready")
+def readiness_check(response: Response):
+    """Readiness: tables and buckets are set up and the database answers; 503 until then."""
+    state = startup.readiness()
+    if not state["ready"]:
+        response.status_code = 503
+    return state
+
+def _admit(request: PreparationRequest, versions: dict) -> Tuple[PreparationRequest, Optional[Dict[str, Any]]]:
     """
-    Background task to process data.
+    Validates the pipeline and estimates the job's memory and run time from the input object
+    and its cached profile. A job over the memory limit is switched to streaming mode when
+    its pipeline allows it. Returns the request to queue and its estimate (None if the
+    input could not be inspected). The input version goes into `versions` for the cache key.
     """
-    db = db_session_factory()
-    dataset_record = db.query(PreparedDataset).filter(PreparedDataset.job_id == job_id).first()
-    
     try:
-        dataset_record.status = "PROCESSING"
-        db.commit()
-
-        # 1. Load Data
-        print(f"Loading data from {request.input_data.bucket}/{request.input_data.path}")
-        df = minio_client.load_dataframe(request.input_data.bucket, request.input_data.path)
-        
-        # 2. Process Data
-        # Ensure we convert Pydantic models to dicts if needed, depending on how processing.py expects them
-        # processing.py expects List[PipelineStep] which is what request.pipeline is.
-        df_clean = processor.process(df, request.pipeline)
-        
-        # 3. Save Data
-        output_filename = f"processed_{job_id}.csv"
-        output_path = request.output_path or output_filename
-        output_bucket = settings.MINIO_BUCKET_PROCESSED
-        
-        s3_path = minio_client.save_dataframe(df_clean, output_bucket, output_path)
-        
-        # 4. Update DB
-        dataset_record.status = "COMPLETED"
-        dataset_record.output_bucket = output_bucket
-        dataset_record.output_path = output_path
-        db.commit()
-        print(f"Job {job_id} completed successfully.")
+        validate_pipeline(request.pipeline, request.streaming)
+    except PipelineError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    if request.incremental is not None:
+        # The input may be a prefix, and only the worker knows how much of it is new
+        return request, None
 
+    bucket, path = request.input_data.bucket, request.input_data.path
+    try:
+        version, size, content_type = minio_client.object_info(bucket, path)
+        versions[(bucket, path)] = version
+        fmt = detect_format(path, content_type)
+        profile = profile_store.cached(bucket, path, version, size, fmt)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchBucket"):
+            raise HTTPException(status_code=404, detail=f"Input {bucket}/{path} not found")
+        print(f"Cannot inspect input {bucket}/{path}: {e}")
+        return request, None
     except Exception as e:
-        print(f"Job {job_id} failed: {e}")
-        traceback.print_exc()
-        dataset_record.status = "FAILED"
-        dataset_record.error_message = str(e)
-        db.commit()
-    finally:
-        db.close()
+        # Object store unreachable: queue anyway, the worker retries
+        print(f"Cannot inspect input {bucket}/{path}: {e}")
+        return request, None
 
-@app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+    cost = estimate(request, size, fmt, profile)
+    limit = settings.JOB_MEMORY_LIMIT_MB and settings.JOB_MEMORY_LIMIT_MB * 2 ** 20
+    if (limit and cost["memory_bytes"] > limit and not request.streaming
+            and settings.ROUTE_OVERSIZED_TO_STREAMING and streamable(request.pipeline)):
+        routed = estimate(request, size, fmt, profile, streaming=True)
+        if routed["memory_bytes"] <= limit:
+            request = request.model_copy(update={"streaming": True})
+            cost = dict(routed, routed_to_streaming=True)
+    return request, cost
+
+def _over_limits(cost: Optional[Dict[str, Any]]) -> Optional[str]:
+    if cost is None:
+        return None
+    if settings.JOB_MEMORY_LIMIT_MB and cost["memory_bytes"] > settings.JOB_MEMORY_LIMIT_MB * 2 ** 20:
+        return (f"Estimated peak memory {cost['memory_bytes'] / 2 ** 20:.0f} MiB exceeds the "
+                f"{settings.JOB_MEMORY_LIMIT_MB} MiB job limit")
+    if settings.JOB_TIME_LIMIT_SECONDS and cost["seconds"] > settings.JOB_TIME_LIMIT_SECONDS:
+        return f"Estimated run time {cost['seconds']:.0f} s exceeds the {settings.JOB_TIME_LIMIT_SECONDS:.0f} s job limit"
+    return None
 
 @app.post("/prepare", response_model=PreparationResponse)
-def prepare_data(request: PreparationRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def prepare_data(request: PreparationRequest, db: Session = Depends(get_db)):
     """
     Main endpoint to trigger data preparation.
     """
     job_id = str(uuid.uuid4())
+    versions = {}
+    request, cost = _admit(request, versions)
+
+    # Same input version + same pipeline: answer with the earlier output
+    cache_key = result_cache.resolve(request, versions)
+    cached = result_cache.lookup(db, cache_key[0]) if cache_key else None
+    if cached:
+        source = db.query(PreparedDataset).filter(PreparedDataset.job_id == cached.job_id).first()
+        db.add(PreparedDataset(
+            job_id=job_id,
+            input_bucket=request.input_data.bucket,
+            input_path=request.input_data.path,
+            pipeline_config=[step.model_dump() for step in request.pipeline],
+            status="COMPLETED",
+            output_bucket=cached.output_bucket,
+            output_path=cached.output_path,
+            artifact_bucket=source.artifact_bucket if source else None,
+            artifact_path=source.artifact_path if source else None,
+            output_manifest=source.output_manifest if source else None
+        ))
+        db.commit()
+        return {
+            "job_id": job_id,
+            "status": "COMPLETED",
+            "output_location": {"bucket": cached.output_bucket, "path": cached.output_path}
+        }
     
-    # Create DB Record
-    new_dataset = PreparedDataset(
-        job_id=job_id,
-        input_bucket=request.input_data.bucket,
-        input_path=request.input_data.path,
-        pipeline_config=[step.model_dump() for step in request.pipeline], # Store detailed config
-        status="PENDING"
-    )
-    db.add(new_dataset)
-    db.commit()
-    
-    # Launch Background Task
-    # We pass SessionLocal class or a method to create a new session because `db` dependency is closed after request
-    from .database import SessionLocal
-    background_tasks.add_task(process_data_task, job_id, request, SessionLocal)
+    # Refuse jobs no worker can run before they take a worker's time
+    error = _over_limits(cost)
+    if error:
+        raise HTTPException(status_code=413, detail={"error": error, "estimate": cost})
+
+    # Create DB Record; a worker picks it up from the queue
+    job_queue.submit(job_id, request, cache_key)
     
     return {
         "job_id": job_id,
         "status": "PENDING",
-        "output_location": None
+        "output_location": None,
+        "estimate": cost
+    }
+
+@app.post("/prepare/batch", response_model=BatchPreparationResponse)
+def prepare_batch(request: BatchPreparationRequest, db: Session = Depends(get_db)):
+    """
+    Submits many preparations at once: several datasets, or pipeline variants of one dataset.
+    Each job is cached and tracked like a /prepare job; a worker runs the pending jobs of
+    one input together, loading it once and computing shared pipeline prefixes once.
+    """
+    if len(request.jobs) > settings.BATCH_MAX_JOBS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_JOBS} jobs per batch")
+    batch_id = str(uuid.uuid4())
+    versions = {}  # one stat per input object
+    queued, cached_jobs, jobs, refused = [], [], [], []
+    for index, job_request in enumerate(request.jobs):
+        job_id = str(uuid.uuid4())
+        try:
+            job_request, cost = _admit(job_request, versions)
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail={"job": index, "detail": e.detail})
+        cache_key = result_cache.resolve(job_request, versions)
+        cached = result_cache.lookup(db, cache_key[0]) if cache_key else None
+        if cached:
+            source = db.query(PreparedDataset).filter(PreparedDataset.job_id == cached.job_id).first()
+            cached_jobs.append((job_id, job_request, {
+                "output_bucket": cached.output_bucket,
+                "output_path": cached.output_path,
+                "artifact_bucket": source.artifact_bucket if source else None,
+                "artifact_path": source.artifact_path if source else None,
+                "output_manifest": source.output_manifest if source else None,
+            }))
+            jobs.append({
+                "job_id": job_id,
+                "status": "COMPLETED",
+                "output_location": {"bucket": cached.output_bucket, "path": cached.output_path}
+            })
+        else:
+            error = _over_limits(cost)
+            if error:
+                refused.append({"job": index, "error": error, "estimate": cost})
+            queued.append((job_id, job_request, cache_key))
+            jobs.append({"job_id": job_id, "status": "PENDING", "output_location": None, "estimate": cost})
+
+    if refused:
+        raise HTTPException(status_code=413, detail=refused)
+    job_queue.submit_batch(batch_id, queued, cached_jobs)
+    return {"batch_id": batch_id, "status": "PENDING" if queued else "COMPLETED", "jobs": jobs}
+
+@app.get("/batch/{batch_id}")
+def get_batch_status(batch_id: str, db: Session = Depends(get_db)):
+    records = (
+        db.query(PreparedDataset.job_id, PreparedDataset.status, PreparedDataset.progress,
+                 PreparedDataset.output_bucket, PreparedDataset.output_path, PreparedDataset.error_message)
+        .filter(PreparedDataset.batch_id == batch_id)
+        .order_by(PreparedDataset.id)
+        .all()
+    )
+    if not records:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    counts: Dict[str, int] = {}
+    for record in records:
+        counts[record.status] = counts.get(record.status, 0) + 1
+    if counts.get("COMPLETED", 0) == len(records):
+        status = "COMPLETED"
+    elif sum(counts.get(s, 0) for s in TERMINAL_STATUSES) == len(records):
+        # Failed, timed out, out of memory or cancelled
+        status = "FAILED" if not counts.get("COMPLETED") else "PARTIAL"
+    elif counts.get("PENDING", 0) == len(records):
+        status = "PENDING"
+    else:
+        status = "RUNNING"
+
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "counts": counts,
+        "progress": sum((r.progress or 0.0) for r in records) / len(records),
+        "jobs": [
+            {
+                "job_id": r.job_id,
+                "status": r.status,
+                "progress": r.progress or 0.0,
+                "output_bucket": r.output_bucket,
+                "output_path": r.output_path,
+                "error": r.error_message,
+            }
+            for r in records
+        ],
     }
 
+@app.get("/jobs")
+def list_jobs(status: Optional[str] = None, batch_id: Optional[str] = None,
+              limit: int = Query(settings.JOB_LIST_DEFAULT_LIMIT, ge=1, le=settings.JOB_LIST_MAX_LIMIT),
+              cursor: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Jobs, newest first, optionally of one status or batch. Pass `next_cursor` back as `cursor`
+    for the next page: pages are keyset-paginated on (created_at, id), so a deep page costs
+    the same as the first one and jobs submitted meanwhile do not shift the pages.
+    """
+    query = db.query(PreparedDataset.id, PreparedDataset.job_id, PreparedDataset.batch_id, PreparedDataset.status,
+                     PreparedDataset.progress, PreparedDataset.attempts, PreparedDataset.input_bucket,
+                     PreparedDataset.input_path, PreparedDataset.output_bucket, PreparedDataset.output_path,
+                     PreparedDataset.created_at, PreparedDataset.updated_at)
+    if status:
+        query = query.filter(PreparedDataset.status == status.upper())
+    if batch_id:
+        query = query.filter(PreparedDataset.batch_id == batch_id)
+    if cursor is not None:
+        # The stored created_at of the cursor row, not a round-tripped copy: SQLite compares them as text
+        created_at = db.query(PreparedDataset.created_at).filter(PreparedDataset.id == cursor).scalar_subquery()
+        query = query.filter(tuple_(PreparedDataset.created_at, PreparedDataset.id) < tuple_(created_at, cursor))
+    rows = query.order_by(PreparedDataset.created_at.desc(), PreparedDataset.id.desc()).limit(limit + 1).all()
+
+    page = rows[:limit]
+    return {
+        "jobs": [
+            {
+                "job_id": r.job_id,
+                "batch_id": r.batch_id,
+                "status": r.status,
+                "progress": r.progress or 0.0,
+                "attempts": r.attempts,
+                "input_bucket": r.input_bucket,
+                "input_path": r.input_path,
+                "output_bucket": r.output_bucket,
+                "output_path": r.output_path,
+                "created_at": r.created_at,
+                "updated_at": r.updated_at,
+            }
+            for r in page
+        ],
+        "next_cursor": page[-1].id if len(rows) > limit else None,
+    }
+
+@app.post("/cancel/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancels a job. A pending one ends as CANCELLED at once; a running one once its worker
+    has seen the request (every JOB_CANCEL_POLL_INTERVAL seconds) and the job reached its next
+    pipeline step or chunk, or is killed JOB_CANCEL_GRACE_SECONDS later. Follow /status or /events.
+    """
+    status = job_queue.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status in TERMINAL_STATUSES and status != "CANCELLED":
+        raise HTTPException(status_code=409, detail=f"Job already finished with status {status}")
+    return {"job_id": job_id, "status": status, "cancel_requested": status == "PROCESSING"}
+
+def _read_status(job_id: str) -> Optional[Dict[str, Any]]:
+    # A pooled connection without an ORM session: nothing to track for a read of plain columns
+    with engine.connect() as conn:
+        return read_snapshot(conn, job_id)
+
 @app.get("/status/{job_id}")
-def get_status(job_id: str, db: Session = Depends(get_db)):
-    record = db.query(PreparedDataset).filter(PreparedDataset.job_id == job_id).first()
-    if not record:
+async def get_status(job_id: str, wait: float = 0, since: Optional[str] = None):
+    """
+    Current state of a job. With `wait` (seconds, capped at STATUS_MAX_WAIT_SECONDS) the call
+    long-polls: it returns as soon as the status differs from `since` (default: the status
+    at call time), or with the unchanged state once `wait` has elapsed.
+    """
+    if wait <= 0:
+        snapshot = await run_in_threadpool(_read_status, job_id)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return snapshot
+
+    # Subscribe before reading, so a change between the read and the wait is not missed
+    waiter = job_events.subscribe(job_id)
+    try:
+        snapshot = await run_in_threadpool(_read_status, job_id)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        current = since or snapshot["status"]
+        if snapshot["status"] != current or snapshot["status"] in TERMINAL_STATUSES:
+            return snapshot
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, settings.STATUS_MAX_WAIT_SECONDS)
+        while True:
+            remaining = deadline - loop.time()
+            event = await job_events.next_event(waiter, remaining) if remaining > 0 else None
+            if event is None:
+                return snapshot
+            # Events carry every field that changed, so no second read is needed
+            snapshot.update(event)
+            if snapshot["status"] in TERMINAL_STATUSES:
+                # ... except for the job metrics and output manifest, which are too large for a notification
+                return await run_in_threadpool(_read_status, job_id) or snapshot
+            if snapshot["status"] != current:
+                return snapshot
+    finally:
+        job_events.unsubscribe(job_id, waiter)
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"event: job\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.get("/events/{job_id}")
+async def job_event_stream(job_id: str, request: Request):
+    """
+    Server-Sent Events stream of a job: its current state first, then every state
+    transition and progress update, ending once the job has finished.
+    """
+    waiter = job_events.subscribe(job_id)
+    snapshot = await run_in_threadpool(_read_status, job_id)
+    if snapshot is None:
+        job_events.unsubscribe(job_id, waiter)
         raise HTTPException(status_code=404, detail="Job not found")
-        
+
+    async def stream():
+        try:
+            yield _sse(snapshot)
+            while snapshot["status"] not in TERMINAL_STATUSES:
+                if await request.is_disconnected():
+                    break
+                event = await job_events.next_event(waiter, settings.SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                before = dict(snapshot)
+                snapshot.update(event)
+                if snapshot["status"] in TERMINAL_STATUSES:
+                    snapshot.update(await run_in_threadpool(_read_status, job_id) or {})  # with the job metrics
+                if snapshot != before:
+                    yield _sse(snapshot)
+        finally:
+            job_events.unsubscribe(job_id, waiter)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _artifact_location(job_id: str):
+    db = SessionLocal()
+    try:
+        record = (
+            db.query(PreparedDataset.status, PreparedDataset.artifact_bucket, PreparedDataset.artifact_path)
+            .filter(PreparedDataset.job_id == job_id)
+            .first()
+        )
+        if record is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if record.status != "COMPLETED" or not record.artifact_path:
+            raise HTTPException(status_code=409, detail="Job has no fitted pipeline to apply")
+        return record.artifact_bucket, record.artifact_path
+    finally:
+        db.close()
+
+@app.post("/apply/{job_id}")
+def apply_pipeline(job_id: str, request: ApplyRequest):
+    """
+    Transforms new data with the pipeline state fitted by a completed job, without refitting.
+    Inline `rows` come back in the response; `input_data` is written to the processed bucket.
+    """
+    pipeline = transform_service.fitted(job_id, _artifact_location)
+    try:
+        if request.rows is not None:
+            df = pipeline.transform(frame_from_records(request.rows))
+            return {"job_id": job_id, "rows": frame_to_records(df)}
+
+        df = pipeline.transform(minio_client.load_dataframe(
+            request.input_data.bucket, request.input_data.path, request.input_data.columns
+        ))
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    output_format = request.output_format or detect_format(request.output_path)
+    output_path = request.output_path or f"applied_{job_id}_{uuid.uuid4().hex[:8]}.{FORMAT_EXTENSIONS[output_format]}"
+    minio_client.save_dataframe(df, settings.MINIO_BUCKET_PROCESSED, output_path, fmt=output_format)
     return {
-        "job_id": record.job_id,
-        "status": record.status,
-        "output_bucket": record.output_bucket,
-        "output_path": record.output_path,
-        "error": record.error_message
+        "job_id": job_id,
+        "output_location": {"bucket": settings.MINIO_BUCKET_PROCESSED, "path": output_path}
     }
+
+def _run_transform(df, pipeline_id: Optional[str], job_id: Optional[str]):
+    if len(df) > settings.TRANSFORM_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"More than {settings.TRANSFORM_MAX_ROWS} rows: use /prepare")
+    try:
+        if job_id:
+            return transform_service.fitted(job_id, _artifact_location).transform(df)
+        if transform_service.steps(pipeline_id) is None:
+            # Plans are cached per process: the client resends the pipeline once
+            raise HTTPException(status_code=404, detail=f"Unknown pipeline_id {pipeline_id}, send the pipeline itself")
+        return transform_service.transform(df, pipeline_id)
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/transform")
+async def transform(request: Request, pipeline_id: Optional[str] = None, job_id: Optional[str] = None):
+    """
+    Synchronous preparation of a small payload, computed in-process and returned directly.
+
+    JSON body: {"rows": [...], "pipeline" | "pipeline_id" | "job_id": ...}.
+    Arrow IPC stream body (Content-Type application/vnd.apache.arrow.stream): rows as
+    record batches, pipeline_id or job_id as query parameters; the response is Arrow too.
+    """
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith(ARROW_STREAM):
+        if bool(pipeline_id) == bool(job_id):
+            raise HTTPException(status_code=422, detail="Provide exactly one of pipeline_id or job_id")
+        try:
+            df = await run_in_threadpool(frame_from_arrow, body)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid Arrow stream: {e}")
+        df = await run_in_threadpool(_run_transform, df, pipeline_id, job_id)
+        return Response(await run_in_threadpool(frame_to_arrow, df), media_type=ARROW_STREAM,
+                        headers={"X-Pipeline-Id": pipeline_id or ""})
+
+    try:
+        payload = TransformRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    if payload.pipeline is not None:
+        try:
+            validate_pipeline(payload.pipeline)
+        except PipelineError as e:
+            raise HTTPException(status_code=422, detail=e.errors)
+        pipeline_id = transform_service.register(payload.pipeline)
+    else:
+        pipeline_id = payload.pipeline_id
+
+    def run():
+        df = _run_transform(frame_from_records(payload.rows), pipeline_id, payload.job_id)
+        return json.dumps({"pipeline_id": pipeline_id, "rows": frame_to_records(df)}, default=str)
+
+    return Response(await run_in_threadpool(run), media_type="application/json")
+
+@app.get("/profile")
+def profile_dataset(bucket: str, path: str, mode: Literal["auto", "full", "sample"] = "auto", refresh: bool = False):
+    """
+    Column statistics and a preview of an object. Profiles are cached per object version,
+    so repeated calls only cost a stat of the object.
+    """
+    try:
+        return profile_store.get(bucket, path, mode, refresh)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchBucket"):
+            raise HTTPException(status_code=404, detail=f"Object {bucket}/{path} not found")
+        raise
+
+@app.get("/preview")
+def preview_dataset(bucket: str, path: str, limit: int = Query(20, ge=1, le=settings.PREVIEW_MAX_ROWS)):
+    """The first `limit` rows of an object, read from its head: cheap for any object size."""
+    try:
+        df = minio_client.head_dataframe(bucket, path, limit)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchBucket"):
+            raise HTTPException(status_code=404, detail=f"Object {bucket}/{path} not found")
+        raise
+    return {"bucket": bucket, "path": path, "columns": [str(c) for c in df.columns], "rows": frame_to_records(densify(df))}
+
+@app.post("/uploads")
+def create_upload(request: UploadRequest):
+    """
+    A presigned URL to PUT a raw dataset to: the client sends the file straight to the object
+    store, not through this service. /profile and /prepare then take the returned location.
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(request.filename)) or "data.csv"
+    path = f"{settings.UPLOAD_PREFIX}/{uuid.uuid4().hex}/{name}"
+    return {
+        "bucket": settings.MINIO_BUCKET_RAW,
+        "path": path,
+        "method": "PUT",
+        "url": minio_client.presigned_put_url(settings.MINIO_BUCKET_RAW, path),
+        "expires_in": settings.PRESIGNED_URL_EXPIRY_SECONDS,
+    }
+
+@app.get("/download/{job_id}")
+def download_output(job_id: str, partition: Optional[int] = Query(None, ge=0), db: Session = Depends(get_db)):
+    """
+    A presigned URL of a completed job's output, which the client streams from the object store.
+    For a partitioned output that is the manifest; `partition` selects one partition instead.
+    """
+    record = (
+        db.query(PreparedDataset.status, PreparedDataset.output_bucket, PreparedDataset.output_path,
+                 PreparedDataset.output_manifest, PreparedDataset.output_evicted_at)
+        .filter(PreparedDataset.job_id == job_id)
+        .first()
+    )
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if record.output_evicted_at is not None:
+        raise HTTPException(status_code=410, detail="Job output was evicted from the result cache; submit the job again")
+    if record.status != "COMPLETED" or not record.output_path:
+        raise HTTPException(status_code=409, detail="Job has no output to download")
+    path = record.output_path
+    if partition is not None:
+        partitions = (record.output_manifest or {}).get("partitions", [])
+        if partition >= len(partitions):
+            raise HTTPException(status_code=404, detail=f"Job output has {len(partitions)} partitions")
+        path = partitions[partition]["path"]
+    return {
+        "job_id": job_id,
+        "bucket": record.output_bucket,
+        "path": path,
+        "url": minio_client.presigned_get_url(record.output_bucket, path, os.path.basename(path)),
+        "expires_in": settings.PRESIGNED_URL_EXPIRY_SECONDS,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(db: Session = Depends(get_db)):
+    """Prometheus scrape endpoint: job counts and duration, queue wait and throughput histograms."""
+    return PlainTextResponse(prometheus_text(db), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats(db: Session = Depends(get_db)):
+    return result_cache.stats(db)
+
+@app.post("/cache/evict")
+def cache_evict(db: Session = Depends(get_db)):
+    return {"evicted": result_cache.evict(db)}
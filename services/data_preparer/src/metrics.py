@@ -0,0 +1,205 @@
+"""
+Per-job instrumentation and the Prometheus metrics of the job table.
+
+A worker runs each job inside `collecting(JobMetrics())`. The object store client, the
+execution plan and the job runner report into the active collector through `stage()`,
+`record_operator()` and `count()`, which do nothing outside a job (API requests, /apply).
+The summary is stored on the job row; /metrics aggregates the rows into histograms, so
+the numbers cover every worker process, not only the API process serving the scrape.
+"""
+import contextlib
+import resource
+import sys
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import case, func
+
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+ROWS_PER_SECOND_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+MB_PER_SECOND_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_current: ContextVar[Optional["JobMetrics"]] = ContextVar("job_metrics", default=None)
+
+
+def _rss_field(field: str) -> Optional[int]:
+    """VmRSS / VmHWM of this process in bytes (Linux only)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    # Sets VmHWM back to the current RSS, so the peak covers this job only (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    peak = _rss_field("VmHWM")
+    if peak is not None:
+        return peak
+    # Peak over the whole life of the process; kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class JobMetrics:
+    """Wall time per stage and per pipeline operator, rows and bytes in and out, peak RSS."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.peak_is_per_job = _reset_peak_rss()
+        self.stages: Dict[str, Dict[str, Any]] = {}  # in first-seen order
+        self.operators: Dict[tuple, Dict[str, Any]] = {}
+        self.totals = {"rows_in": 0, "rows_out": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def add_stage(self, name: str, seconds: float, counts: Dict[str, int]):
+        entry = self.stages.setdefault(name, {"name": name, "seconds": 0.0, "calls": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        for key, value in counts.items():
+            entry[key] = entry.get(key, 0) + value
+
+    def add_operator(self, steps: List[int], operator: str, seconds: float, rows_in: int, rows_out: int):
+        # Chunked and batch runs report the same step several times: sum them
+        entry = self.operators.setdefault((tuple(steps), operator), {
+            "steps": list(steps), "operator": operator, "seconds": 0.0, "calls": 0, "rows_in": 0, "rows_out": 0,
+        })
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        entry["rows_in"] += rows_in
+        entry["rows_out"] += rows_out
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "duration_seconds": round(time.perf_counter() - self.started, 6),
+            **self.totals,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "peak_rss_scope": "job" if self.peak_is_per_job else "process",
+            "stages": [dict(s, seconds=round(s["seconds"], 6)) for s in self.stages.values()],
+            "operators": [dict(o, seconds=round(o["seconds"], 6)) for o in self.operators.values()],
+        }
+
+
+@contextlib.contextmanager
+def collecting(metrics: JobMetrics) -> Iterator[JobMetrics]:
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str, **counts: int) -> Iterator[Dict[str, int]]:
+    """
+    Times the block as stage `name` of the current job. The yielded dict takes counts
+    known only at the end, e.g. record["bytes"] = n.
+    """
+    metrics = _current.get()
+    record = dict(counts)
+    if metrics is None:
+        yield record
+        return
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        metrics.add_stage(name, time.perf_counter() - start, record)
+
+
+def record_operator(steps: List[int], operator: str, seconds: float, rows_in: int, rows_out: int):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_operator(steps, operator, seconds, rows_in, rows_out)
+
+
+def operator_label(op: str, params: Dict[str, Any]) -> str:
+    return f"imputer[{params.get('strategy', 'most_frequent')}]" if op == "imputer" else op
+
+
+def count(**values: int):
+    """Adds to the job totals: rows_in, rows_out, bytes_in, bytes_out."""
+    metrics = _current.get()
+    if metrics is not None:
+        for key, value in values.items():
+            metrics.totals[key] += int(value)
+
+
+def job_columns(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The prepared_datasets columns set from a job summary."""
+    if not summary:
+        return {}
+    return {
+        "metrics": summary,
+        "duration_seconds": summary["duration_seconds"],
+        "rows_in": summary["rows_in"],
+        "bytes_in": summary["bytes_in"],
+        "bytes_out": summary["bytes_out"],
+    }
+
+
+# Prometheus exposition
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def _histogram(db, name: str, help_text: str, value, buckets, filters, label=None) -> List[str]:
+    columns = [func.sum(case((value <= b, 1), else_=0)) for b in buckets] + [func.count(), func.sum(value)]
+    query = db.query(*columns).filter(value.isnot(None), *filters)
+    if label is not None:
+        query = query.add_columns(label).group_by(label)
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for row in query.all():
+        counts, total, sum_ = row[:len(buckets)], row[len(buckets)], row[len(buckets) + 1]
+        if not total:
+            continue
+        labels = {"status": row[-1]} if label is not None else {}
+        for bound, n in zip(buckets, counts):
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=_number(bound)))} {int(n or 0)}")
+        lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {int(total)}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(sum_ or 0)}")
+        lines.append(f"{name}_count{_labels(labels)} {int(total)}")
+    return lines
+
+
+def prometheus_text(db) -> str:
+    """Job counts by status and histograms over the finished jobs, in the Prometheus text format."""
+    # Imported here: the collector side is used by the object store client, which needs no database
+    from .models import PreparedDataset, TERMINAL_STATUSES
+
+    lines = ["# HELP data_preparer_jobs Jobs by status.", "# TYPE data_preparer_jobs gauge"]
+    for status, n in db.query(PreparedDataset.status, func.count()).group_by(PreparedDataset.status).all():
+        lines.append(f"data_preparer_jobs{_labels({'status': status})} {n}")
+
+    finished = PreparedDataset.status.in_(TERMINAL_STATUSES)
+    completed = [PreparedDataset.status == "COMPLETED", PreparedDataset.duration_seconds > 0]
+    lines += _histogram(db, "data_preparer_job_duration_seconds", "Run time of the last attempt of finished jobs.",
+                        PreparedDataset.duration_seconds, DURATION_BUCKETS, [finished], label=PreparedDataset.status)
+    lines += _histogram(db, "data_preparer_job_queue_wait_seconds", "Time from ready to claimed by a worker (last attempt).",
+                        PreparedDataset.queue_wait_seconds, QUEUE_WAIT_BUCKETS, [])
+    lines += _histogram(db, "data_preparer_job_throughput_rows_per_second", "Input rows per second of completed jobs.",
+                        PreparedDataset.rows_in / PreparedDataset.duration_seconds, ROWS_PER_SECOND_BUCKETS, completed)
+    lines += _histogram(db, "data_preparer_job_throughput_megabytes_per_second",
+                        "Object store bytes read and written per second of completed jobs, in MB/s.",
+                        (PreparedDataset.bytes_in + PreparedDataset.bytes_out) / 1e6 / PreparedDataset.duration_seconds,
+                        MB_PER_SECOND_BUCKETS, completed)
+    return "\n".join(lines) + "\n"
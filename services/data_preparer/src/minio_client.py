@@ -1,43 +1,749 @@
 from minio import Minio
 from .config import settings
+from .dtypes import compact_dtypes, densify, has_sparse, memory_usage, sparse_matrix
+from .expressions import ScanPlan
+from .input_cache import input_cache, project_names
+from . import metrics
+import certifi
+import hashlib
 import io
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import os
+import tempfile
+import threading
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+FORMAT_EXTENSIONS = {"csv": "csv", "parquet": "parquet", "arrow": "arrow", "npz": "npz"}
+
+CONTENT_TYPES = {
+    "csv": "application/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "npz": "application/x-npz",
+}
+
+_EXTENSION_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+    ".npz": "npz",
+}
+
+_CONTENT_TYPE_FORMATS = {
+    "application/csv": "csv",
+    "text/csv": "csv",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/vnd.apache.arrow.file": "arrow",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/x-npz": "npz",
+}
+
+
+def detect_format(path: Optional[str], content_type: Optional[str] = None, default: str = "csv") -> str:
+    """
+    Picks the serialization format of an object from its extension, falling back to its content type.
+    """
+    ext = os.path.splitext(path or "")[1].lower()
+    if ext in _EXTENSION_FORMATS:
+        return _EXTENSION_FORMATS[ext]
+    if content_type:
+        return _CONTENT_TYPE_FORMATS.get(content_type.split(";")[0].strip().lower(), default)
+    return default
+
+
+class _ChunkedCSVStream(io.RawIOBase):
+    """
+    File-like view over an iterable of DataFrames, encoded as one CSV document.
+    Only the chunk currently being read is held in memory.
+    """
+    def __init__(self, chunks: Iterable[pd.DataFrame]):
+        self._chunks = iter(chunks)
+        self._buffer = memoryview(b"")
+        self._header = True
+        self.size = 0  # bytes read so far
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk.to_csv(index=False, header=self._header).encode('utf-8'))
+            self._header = False
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        self.size += n
+        return n
+
+
+class _MemoryReader(io.RawIOBase):
+    """Read-only file view over a bytearray, so parsers can consume it without another copy."""
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+class _RangedReader(io.RawIOBase):
+    """Seekable read-only file over ranged GETs of one object version: random access without a download."""
+    def __init__(self, client: "MinioClient", bucket: str, path: str, size: int, version: str):
+        self.client, self.bucket, self.path, self.size, self.version = client, bucket, path, size, version
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(base + offset, 0)
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self._pos)
+        if n <= 0:
+            return 0
+        data = self.client.read_ranges(self.bucket, self.path, [(self._pos, n)], self.version)[0]
+        b[:len(data)] = data
+        self._pos += len(data)
+        metrics.count(bytes_in=len(data))
+        return len(data)
+
+
+def _object_version(stat) -> str:
+    etag = (stat.etag or "").strip('"')
+    return f"{etag}:{stat.version_id}" if stat.version_id else etag
+
+
+def _pinned(version: Optional[str]) -> dict:
+    """get_object arguments that only read the object `version` (as returned by _object_version)."""
+    if not version:
+        return {}
+    etag, _, version_id = version.partition(":")
+    return {"version_id": version_id} if version_id else {"request_headers": {"If-Match": f'"{etag}"'}}
+
+
+def _npz_bytes(matrix: sp.csr_matrix, columns: List[str]) -> bytes:
+    # The arrays of scipy.sparse.save_npz (so load_npz reads it), plus the column names
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, format=np.array(b"csr"), shape=np.array(matrix.shape), data=matrix.data,
+                        indices=matrix.indices, indptr=matrix.indptr, columns=np.array([str(c) for c in columns]))
+    return buffer.getvalue()
+
+
+def _npz_frame(buffer, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    with np.load(io.BytesIO(buffer), allow_pickle=False) as npz:
+        matrix = sp.csr_matrix((npz["data"], npz["indices"], npz["indptr"]), shape=tuple(npz["shape"]))
+        names = [str(c) for c in npz["columns"]]
+    df = pd.DataFrame.sparse.from_spmatrix(matrix.tocsc(), columns=names)
+    return df[columns] if columns is not None else df
+
+
+def _csv_format(source, filesystem=None) -> ds.CsvFileFormat:
+    """Arrow CSV reading that types columns like read_csv: empty fields are null, dates stay text."""
+    convert = pcsv.ConvertOptions(strings_can_be_null=True)
+    schema = ds.CsvFileFormat(convert_options=convert).make_fragment(source, filesystem).physical_schema
+    types = {f.name: pa.string() for f in schema if pa.types.is_temporal(f.type)}
+    types.update({f.name: pa.float64() for f in schema if pa.types.is_null(f.type)})  # all-empty columns
+    if types:
+        convert = pcsv.ConvertOptions(strings_can_be_null=True, column_types=types)
+    return ds.CsvFileFormat(convert_options=convert)
+
+
+def _object_dataset(source, fmt: str, filesystem=None) -> ds.Dataset:
+    """An Arrow dataset over one object: its bytes (a pa.Buffer) or a local file."""
+    if fmt == "parquet":
+        file_format = ds.ParquetFileFormat()
+    elif fmt == "arrow":
+        file_format = ds.IpcFileFormat()
+    else:
+        file_format = _csv_format(source, filesystem)
+    fragment = file_format.make_fragment(source, filesystem)
+    return ds.FileSystemDataset([fragment], fragment.physical_schema, file_format)
+
+
+def _data_columns(schema: pa.Schema) -> List[str]:
+    """Column names without the index columns pandas stored along with the data."""
+    index = (schema.pandas_metadata or {}).get("index_columns", [])
+    return [name for name in schema.names if name not in {c for c in index if isinstance(c, str)}]
+
+
+def _iter_row_slices(df: pd.DataFrame, rows: int) -> Iterator[pd.DataFrame]:
+    for start in range(0, max(len(df), 1), rows):
+        yield df.iloc[start:start + rows]
+
+
+def _make_http_client() -> urllib3.PoolManager:
+    """
+    One connection pool per process, sized for the parallel part transfers.
+    block=True caps open connections at the pool size instead of opening throwaway ones.
+    """
+    timeout = settings.MINIO_TIMEOUT_SECONDS
+    return urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=min(timeout, 10), read=timeout),
+        maxsize=settings.MINIO_MAX_POOL_CONNECTIONS,
+        block=True,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+    )
 
 class MinioClient:
     def __init__(self):
+        self._http = _make_http_client()
         self.client = Minio(
             settings.MINIO_ENDPOINT,
             access_key=settings.MINIO_ACCESS_KEY,
             secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_SECURE
+            secure=settings.MINIO_SECURE,
+            http_client=self._http
         )
-        self._ensure_buckets()
+        # Signs URLs for the host clients see; the region is given so signing is offline
+        self.presigner = Minio(
+            settings.MINIO_PUBLIC_ENDPOINT or settings.MINIO_ENDPOINT,
+            access_key=settings.MINIO_ACCESS_KEY,
+            secret_key=settings.MINIO_SECRET_KEY,
+            secure=settings.MINIO_SECURE if settings.MINIO_PUBLIC_SECURE is None else settings.MINIO_PUBLIC_SECURE,
+            region=settings.MINIO_REGION
+        )
+        # Buckets are checked on first write, not at import time
+        self._buckets_ready = False
+        self._lock = threading.Lock()
+        self._transfers = ThreadPoolExecutor(max_workers=settings.MINIO_TRANSFER_CONCURRENCY, thread_name_prefix="minio-part")
+
+    def ensure_buckets(self):
+        if self._buckets_ready:
+            return
+        with self._lock:
+            if not self._buckets_ready:
+                self._ensure_buckets()
+                self._buckets_ready = True
 
     def _ensure_buckets(self):
         for bucket in [settings.MINIO_BUCKET_RAW, settings.MINIO_BUCKET_PROCESSED]:
             if not self.client.bucket_exists(bucket):
                 self.client.make_bucket(bucket)
 
-    def load_dataframe(self, bucket: str, path: str) -> pd.DataFrame:
-        response = self.client.get_object(bucket, path)
+    def read_object(self, bucket: str, path: str, stat=None):
+        """
+        Downloads a whole object into one preallocated buffer. Objects larger than
+        MINIO_DOWNLOAD_PART_SIZE are fetched as parallel byte ranges, all pinned to the
+        same version/ETag so a concurrent overwrite cannot produce a torn read.
+        Returns (buffer, content_type).
+        """
+        stat = stat or self.client.stat_object(bucket, path)
+        part_size = settings.MINIO_DOWNLOAD_PART_SIZE
+        buffer = bytearray(stat.size)
+        pinned = {"version_id": stat.version_id} if stat.version_id else {"request_headers": {"If-Match": f'"{stat.etag}"'}}
+
+        def fetch(offset: int):
+            length = min(part_size, stat.size - offset)
+            response = self.client.get_object(bucket, path, offset=offset, length=length, **pinned)
+            try:
+                view = memoryview(buffer)[offset:offset + length]
+                read = 0
+                while read < length:
+                    n = response.readinto(view[read:])
+                    if not n:
+                        raise IOError(f"Short read on {bucket}/{path} at offset {offset + read}")
+                    read += n
+            finally:
+                response.close()
+                response.release_conn()
+
+        offsets = range(0, stat.size, part_size)
+        with metrics.stage("download", bytes=stat.size):
+            if len(offsets) <= 1 or settings.MINIO_TRANSFER_CONCURRENCY <= 1:
+                for offset in offsets:
+                    fetch(offset)
+            else:
+                list(self._transfers.map(fetch, offsets))
+        metrics.count(bytes_in=stat.size)
+        return buffer, stat.content_type
+
+    def load_dataframe(self, bucket: str, path: str, columns: Optional[List[str]] = None,
+                       compact: bool = False, scan: Optional[ScanPlan] = None) -> pd.DataFrame:
+        """
+        Loads a CSV, Parquet or Arrow IPC object. With `columns`, only those columns are
+        decoded (Parquet and Arrow skip the other column chunks entirely). With `compact`,
+        numbers are downcast and text is stored as category or pyarrow strings.
+        With `scan`, the leading expression steps of the pipeline run while the object is
+        decoded: only the columns they keep are materialized, and only the rows they keep.
+        """
+        stat = self.client.stat_object(bucket, path)
+        fmt = detect_format(path, stat.content_type)
+        version = _object_version(stat)
+        cacheable = input_cache.accepts(stat.size, fmt)
+
+        df = self._scan(bucket, path, stat, fmt, version, cacheable, columns, scan) if scan is not None else None
+        if df is not None:
+            scan = None  # done
+        elif cacheable:
+            # A parsed copy of this object version on the local disk skips the download and the parse
+            df = input_cache.read(bucket, path, version, fmt, columns)
+        if df is None:
+            buffer, _ = self.read_object(bucket, path, stat)
+            with metrics.stage("parse") as record:
+                if fmt == "parquet":
+                    df = pq.read_table(pa.BufferReader(buffer), columns=columns, use_pandas_metadata=True).to_pandas()
+                elif fmt == "arrow":
+                    df = feather.read_table(pa.BufferReader(buffer), columns=columns).to_pandas()
+                elif fmt == "npz":
+                    df = _npz_frame(buffer, columns)
+                else:
+                    df = pd.read_csv(io.BufferedReader(_MemoryReader(buffer)), usecols=columns)
+                record["rows"] = len(df)
+            del buffer
+            if cacheable and columns is None:
+                # Only whole inputs: any later projection can then be served from the copy
+                input_cache.store(bucket, path, version, df)
+        if scan is not None:
+            with metrics.stage("scan", rows=len(df)):
+                df = scan.apply(df)
+
+        if compact:
+            before = memory_usage(df)
+            with metrics.stage("compact"):
+                df = compact_dtypes(df)
+            print(f"Compacted {bucket}/{path}: {before / 2**20:.1f} MiB -> {memory_usage(df) / 2**20:.1f} MiB in memory")
+        return df
+            
+    def _scan(self, bucket: str, path: str, stat, fmt: str, version: str, cacheable: bool,
+              columns: Optional[List[str]], scan: ScanPlan) -> Optional[pd.DataFrame]:
+        """
+        The object read through an Arrow scan running `scan`, or None if Arrow cannot read it
+        as load_dataframe would (npz; CSV with a column typed differently past the first block).
+        """
+        if fmt == "npz":
+            return None
+        table = input_cache.table(bucket, path, version) if cacheable else None
+        if table is not None:
+            dataset = ds.dataset(table)  # the mapped copy: nothing to decode
+        else:
+            buffer, _ = self.read_object(bucket, path, stat)
+            dataset = _object_dataset(pa.py_buffer(buffer), fmt)
+        names = project_names(_data_columns(dataset.schema), columns, fmt)
         try:
-            # Assuming CSV for now, extendable to content-type checks
-            return pd.read_csv(io.BytesIO(response.read()))
+            with metrics.stage("scan") as record:
+                df = scan.to_table(dataset, names).to_pandas()
+                record["rows"] = len(df)
+        except pa.ArrowInvalid as e:
+            if fmt != "csv" or table is not None:
+                raise
+            print(f"Scanning {bucket}/{path} with Arrow failed ({e}), loading it with read_csv")
+            return None
+        return df
+
+    def save_dataframe(self, df: pd.DataFrame, bucket: str, path: str, fmt: Optional[str] = None,
+                       compression: Optional[str] = None, row_group_size: Optional[int] = None):
+        """
+        Uploads a DataFrame as a multipart upload whose parts go out in parallel.
+        CSV is serialized slice by slice while earlier parts are uploading.
+        """
+        self.ensure_buckets()
+        fmt = fmt or detect_format(path)
+
+        if fmt == "csv":
+            return self.save_dataframe_chunks(_iter_row_slices(df, settings.CSV_WRITE_CHUNK_ROWS), bucket, path, fmt=fmt)
+        if fmt == "npz":
+            with metrics.stage("serialize", rows=len(df)):
+                data = _npz_bytes(sparse_matrix(df), list(df.columns))
+            return self.put_bytes(data, bucket, path, CONTENT_TYPES[fmt])
+        if has_sparse(df):
+            # Parquet and Arrow have no sparse columns: densify one row slice at a time
+            return self.save_dataframe_chunks(_iter_row_slices(df, settings.CSV_WRITE_CHUNK_ROWS), bucket, path, fmt=fmt,
+                                              compression=compression, row_group_size=row_group_size)
+
+        data_stream = io.BytesIO()
+        with metrics.stage("serialize", rows=len(df)):
+            if fmt == "parquet":
+                df.to_parquet(
+                    data_stream,
+                    index=False,
+                    compression=compression or settings.PARQUET_COMPRESSION,
+                    row_group_size=row_group_size or settings.PARQUET_ROW_GROUP_SIZE
+                )
+            else:
+                feather.write_feather(df, data_stream, compression=compression or settings.ARROW_COMPRESSION)
+
+        length = data_stream.tell()
+        data_stream.seek(0)
+        with metrics.stage("upload", bytes=length):
+            self.client.put_object(
+                bucket,
+                path,
+                data_stream,
+                length=length,
+                content_type=CONTENT_TYPES[fmt],
+                part_size=settings.MINIO_PART_SIZE,
+                num_parallel_uploads=settings.MINIO_TRANSFER_CONCURRENCY
+            )
+        metrics.count(bytes_out=length)
+        return f"s3://{bucket}/{path}"
+
+    def save_partitions(self, parts: List[Tuple[str, Callable[[], Union[pd.DataFrame, pa.Table]]]], bucket: str, fmt: str,
+                        compression: Optional[str] = None, row_group_size: Optional[int] = None) -> List[Tuple[int, int, str]]:
+        """
+        Writes one object per (path, frame) pair, encoding and uploading several at a time
+        (see encode_dataframe). Each frame is only built, by calling it, when its upload starts.
+        Returns (rows, bytes, sha256 of the bytes) per part, in order.
+        """
+        self.ensure_buckets()
+
+        def save(part):
+            path, frame = part
+            rows = frame()
+            data = encode_dataframe(rows, fmt, compression, row_group_size)
+            self.client.put_object(bucket, path, io.BytesIO(data), length=len(data), content_type=CONTENT_TYPES[fmt],
+                                   part_size=settings.MINIO_PART_SIZE)
+            return len(rows), len(data), hashlib.sha256(data).hexdigest()
+
+        # One stage: partitions are encoded while others upload
+        with metrics.stage("serialize_upload") as record:
+            results = list(self._transfers.map(save, parts))
+            record["bytes"] = sum(size for _, size, _ in results)
+        metrics.count(bytes_out=record["bytes"])
+        return results
+
+    def put_bytes(self, data: bytes, bucket: str, path: str, content_type: str = "application/octet-stream"):
+        self.ensure_buckets()
+        with metrics.stage("upload", bytes=len(data)):
+            self.client.put_object(bucket, path, io.BytesIO(data), length=len(data), content_type=content_type)
+        metrics.count(bytes_out=len(data))
+        return f"s3://{bucket}/{path}"
+
+    def put_bytes_if(self, data: bytes, bucket: str, path: str, version: Optional[str],
+                     content_type: str = "application/octet-stream") -> bool:
+        """
+        Writes the object only if its current version (as in object_version) is `version`, or
+        with None only if it does not exist, in one conditional PUT (If-Match / If-None-Match).
+        Returns False, writing nothing, if the object changed meanwhile.
+        """
+        self.ensure_buckets()
+        headers = {"Content-Type": content_type}
+        if version:
+            headers["If-Match"] = f'"{version.split(":")[0]}"'
+        else:
+            headers["If-None-Match"] = "*"
+        # put_object() would send these headers as x-amz-meta-* user metadata: the PUT goes to a
+        # presigned URL instead, with the condition as a plain header
+        url = self.client.presigned_put_object(bucket, path, expires=timedelta(minutes=5))
+        with metrics.stage("upload", bytes=len(data)):
+            # Not retried: a retry of a PUT that did land would fail its own condition
+            response = self._http.request("PUT", url, body=data, headers=headers, retries=False)
+        if response.status in (404, 409, 412):
+            # NoSuchKey (If-Match on a deleted object), ConditionalRequestConflict, PreconditionFailed
+            return False
+        if response.status >= 300:
+            raise OSError(f"PUT {bucket}/{path} failed with HTTP {response.status}: {response.data[:500]!r}")
+        metrics.count(bytes_out=len(data))
+        return True
+
+    def object_version(self, bucket: str, path: str) -> str:
+        """
+        Identifies the current content of an object: its ETag, plus the version id on versioned buckets.
+        """
+        return _object_version(self.client.stat_object(bucket, path))
+
+    def object_info(self, bucket: str, path: str) -> Tuple[str, int, Optional[str]]:
+        """(version as in object_version, size in bytes, content type) of an object."""
+        stat = self.client.stat_object(bucket, path)
+        return _object_version(stat), stat.size, stat.content_type
+
+    def read_ranges(self, bucket: str, path: str, ranges: List[Tuple[int, int]], version: Optional[str] = None) -> List[bytes]:
+        """Fetches (offset, length) byte ranges in parallel, all from the object `version` if given."""
+        pinned = _pinned(version)
+
+        def fetch(byte_range):
+            offset, length = byte_range
+            response = self.client.get_object(bucket, path, offset=offset, length=length, **pinned)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+        return list(self._transfers.map(fetch, ranges))
+
+    def presigned_put_url(self, bucket: str, path: str) -> str:
+        """URL a client can upload the object to with a plain HTTP PUT, until it expires."""
+        self.ensure_buckets()
+        return self.presigner.presigned_put_object(bucket, path, expires=timedelta(seconds=settings.PRESIGNED_URL_EXPIRY_SECONDS))
+
+    def presigned_get_url(self, bucket: str, path: str, filename: Optional[str] = None) -> str:
+        """URL a client can download the object from, as an attachment named `filename` if given."""
+        headers = {"response-content-disposition": f'attachment; filename="{filename}"'} if filename else None
+        return self.presigner.presigned_get_object(bucket, path, expires=timedelta(seconds=settings.PRESIGNED_URL_EXPIRY_SECONDS),
+                                                   response_headers=headers)
+
+    def head_dataframe(self, bucket: str, path: str, rows: int) -> pd.DataFrame:
+        """
+        The first `rows` rows of an object. For CSV only the first PREVIEW_RANGE_BYTES are
+        read (fewer rows come back if they do not fit). Of Parquet only the footer and the
+        first row group are fetched, of Arrow the footer and the first record batch.
+        """
+        stat = self.client.stat_object(bucket, path)
+        fmt = detect_format(path, stat.content_type)
+        if fmt in ("parquet", "arrow"):
+            source = pa.PythonFile(_RangedReader(self, bucket, path, stat.size, _object_version(stat)), mode="r")
+            if fmt == "parquet":
+                file = pq.ParquetFile(source)
+                batch, schema = next(file.iter_batches(batch_size=rows), None), file.schema_arrow
+            else:
+                file = pa.ipc.open_file(source)
+                batch, schema = file.get_batch(0) if file.num_record_batches else None, file.schema
+            return (batch.slice(0, rows) if batch is not None else schema.empty_table()).to_pandas()
+        if fmt != "csv":
+            chunks = self.iter_dataframe_chunks(bucket, path, rows)
+            try:
+                return next(chunks, pd.DataFrame())
+            finally:
+                chunks.close()
+
+        length = min(stat.size, settings.PREVIEW_RANGE_BYTES)
+        head = self.read_ranges(bucket, path, [(0, length)], _object_version(stat))[0] if length else b""
+        if length < stat.size:
+            head = head[:head.rfind(b"\n") + 1]  # whole lines only
+        return pd.read_csv(io.BytesIO(head), nrows=rows) if head else pd.DataFrame()
+
+    def remove_object(self, bucket: str, path: str):
+        self.client.remove_object(bucket, path)
+
+    def list_objects(self, bucket: str, prefix: str) -> List[Tuple[str, str, int]]:
+        """(path, version as in object_version, size) of the objects under `prefix`, in key order."""
+        objects = self.client.list_objects(bucket, prefix=prefix, recursive=True)
+        return sorted((o.object_name, _object_version(o), o.size) for o in objects if not o.is_dir)
+
+    def iter_dataframe_chunks(self, bucket: str, path: str, chunk_rows: int = None,
+                              columns: Optional[List[str]] = None, scan: Optional[ScanPlan] = None) -> Iterator[pd.DataFrame]:
+        """
+        Streams an object as DataFrames of at most `chunk_rows` rows.
+        CSV is parsed straight from the HTTP response; Parquet and Arrow need random access,
+        so they are spooled to a local temp file and read batch by batch from there.
+        With `scan`, Parquet and Arrow batches are scanned as in load_dataframe; CSV chunks
+        are parsed whole and the steps run on each.
+        """
+        chunk_rows = chunk_rows or settings.STREAM_CHUNK_ROWS
+        stat = self.client.stat_object(bucket, path)
+        fmt = detect_format(path, stat.content_type)
+
+        if fmt == "npz":
+            # Already compact in memory (sparse): no need to read it piecewise
+            yield from _iter_row_slices(self.load_dataframe(bucket, path, columns, scan=scan), chunk_rows)
+            return
+
+        version = _object_version(stat)
+        cacheable = input_cache.accepts(stat.size, fmt)
+        if scan is not None:
+            table = input_cache.table(bucket, path, version) if cacheable else None
+            if table is not None:
+                yield from _scanned_chunks(ds.dataset(table), fmt, columns, scan, chunk_rows)
+            else:
+                yield from self._download_chunks(bucket, path, stat, fmt, chunk_rows, columns, scan)
+            return
+        cached = input_cache.chunks(bucket, path, version, fmt, chunk_rows, columns) if cacheable else None
+        if cached is not None:
+            # Every fit pass of a streamed job re-reads its input: from the local copy after the first
+            yield from cached
+            return
+        chunks = self._download_chunks(bucket, path, stat, fmt, chunk_rows, columns)
+        if cacheable and columns is None:
+            chunks = input_cache.tee(bucket, path, version, chunks)
+        yield from chunks
+
+    def iter_csv_chunks_from(self, bucket: str, path: str, offset: int, names: Optional[List[str]] = None,
+                             chunk_rows: int = None, columns: Optional[List[str]] = None,
+                             version: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        Streams the rows of a CSV object from byte `offset`, which must start a line, parsed with
+        the header `names` (None: the range starts with the header): the rows appended to a
+        growing object since it was `offset` bytes long. With `version`, a newer version fails the read.
+        """
+        chunk_rows = chunk_rows or settings.STREAM_CHUNK_ROWS
+        response = self.client.get_object(bucket, path, offset=offset, **_pinned(version))
+        try:
+            with pd.read_csv(response, chunksize=chunk_rows, header=None if names else 0, names=names,
+                             usecols=columns) as reader:
+                for chunk in reader:
+                    yield chunk
         finally:
+            metrics.count(bytes_in=response.tell())
             response.close()
-            
-    def save_dataframe(self, df: pd.DataFrame, bucket: str, path: str):
-        csv_bytes = df.to_csv(index=False).encode('utf-8')
-        data_stream = io.BytesIO(csv_bytes)
-        
-        self.client.put_object(
-            bucket,
-            path,
-            data_stream,
-            length=len(csv_bytes),
-            content_type="application/csv"
-        )
+            response.release_conn()
+
+    def _download_chunks(self, bucket: str, path: str, stat, fmt: str, chunk_rows: int,
+                         columns: Optional[List[str]], scan: Optional[ScanPlan] = None) -> Iterator[pd.DataFrame]:
+        metrics.count(bytes_in=stat.size)
+        if fmt == "csv":
+            response = self.client.get_object(bucket, path)
+            try:
+                with pd.read_csv(response, chunksize=chunk_rows, usecols=columns) as reader:
+                    for chunk in reader:
+                        yield chunk if scan is None else scan.apply(chunk)
+            finally:
+                response.close()
+                response.release_conn()
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(tmp_dir, "input")
+            self.client.fget_object(bucket, path, local_path)
+            if scan is not None:
+                dataset = _object_dataset(local_path, fmt, pafs.LocalFileSystem())
+                yield from _scanned_chunks(dataset, fmt, columns, scan, chunk_rows)
+                return
+            if fmt == "parquet":
+                batches = pq.ParquetFile(local_path).iter_batches(batch_size=chunk_rows, columns=columns)
+            else:
+                table = pa.ipc.open_file(pa.memory_map(local_path)).read_all()
+                if columns is not None:
+                    table = table.select(columns)
+                batches = table.to_batches(max_chunksize=chunk_rows)
+            for batch in batches:
+                yield batch.to_pandas()
+
+    def save_dataframe_chunks(self, chunks: Iterable[pd.DataFrame], bucket: str, path: str, fmt: Optional[str] = None,
+                              compression: Optional[str] = None, row_group_size: Optional[int] = None):
+        """
+        Writes an iterable of DataFrames as a single object using a multipart upload.
+        Columnar formats are assembled in a local temp file first, one chunk at a time.
+        """
+        self.ensure_buckets()
+        fmt = fmt or detect_format(path)
+
+        if fmt == "csv":
+            stream = _ChunkedCSVStream(chunks)
+            # Slices are encoded while earlier parts upload: one stage for both
+            with metrics.stage("serialize_upload") as record:
+                self.client.put_object(
+                    bucket,
+                    path,
+                    stream,
+                    length=-1,
+                    part_size=settings.MINIO_PART_SIZE,
+                    num_parallel_uploads=settings.MINIO_TRANSFER_CONCURRENCY,
+                    content_type=CONTENT_TYPES[fmt]
+                )
+                record["bytes"] = stream.size
+            metrics.count(bytes_out=stream.size)
+            return f"s3://{bucket}/{path}"
+
+        if fmt == "npz":
+            # Held as one sparse matrix: memory follows the non-zeros
+            columns, parts = None, []
+            for chunk in chunks:
+                columns = columns if columns is not None else list(chunk.columns)
+                parts.append(sparse_matrix(chunk[columns]))
+            matrix = sp.vstack(parts, format="csr") if parts else sp.csr_matrix((0, 0))
+            return self.put_bytes(_npz_bytes(matrix, columns or []), bucket, path, CONTENT_TYPES[fmt])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(tmp_dir, "output")
+            writer = schema = None
+            try:
+                for chunk in chunks:
+                    # Later chunks are cast to the schema of the first one
+                    table = pa.Table.from_pandas(densify(chunk), schema=schema, preserve_index=False)
+                    if writer is None:
+                        schema = table.schema
+                        if fmt == "parquet":
+                            writer = pq.ParquetWriter(local_path, table.schema,
+                                                      compression=compression or settings.PARQUET_COMPRESSION)
+                        else:
+                            options = pa.ipc.IpcWriteOptions(compression=_ipc_compression(compression))
+                            writer = pa.ipc.new_file(local_path, table.schema, options=options)
+                    if fmt == "parquet":
+                        writer.write_table(table, row_group_size=row_group_size or settings.PARQUET_ROW_GROUP_SIZE)
+                    else:
+                        writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if writer is None:
+                # No chunks at all: upload an empty object of the right format
+                self.save_dataframe(pd.DataFrame(), bucket, path, fmt=fmt)
+            else:
+                size = os.path.getsize(local_path)
+                with metrics.stage("upload", bytes=size):
+                    self.client.fput_object(
+                        bucket,
+                        path,
+                        local_path,
+                        content_type=CONTENT_TYPES[fmt],
+                        part_size=settings.MINIO_PART_SIZE,
+                        num_parallel_uploads=settings.MINIO_TRANSFER_CONCURRENCY
+                    )
+                metrics.count(bytes_out=size)
         return f"s3://{bucket}/{path}"
 
+
+def _scanned_chunks(dataset: ds.Dataset, fmt: str, columns: Optional[List[str]], scan: ScanPlan,
+                    chunk_rows: int) -> Iterator[pd.DataFrame]:
+    offset = 0
+    names = project_names(_data_columns(dataset.schema), columns, fmt)
+    for batch in scan.to_batches(dataset, names, chunk_rows):
+        chunk = batch.to_pandas()
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+
+def encode_dataframe(data: Union[pd.DataFrame, pa.Table], fmt: str, compression: Optional[str] = None,
+                     row_group_size: Optional[int] = None) -> bytes:
+    """
+    The bytes save_dataframe would upload for a DataFrame, built in memory. Parquet and
+    Arrow also take an Arrow table, whose encoding runs without the GIL.
+    """
+    stream = io.BytesIO()
+    if isinstance(data, pd.DataFrame):
+        if fmt == "npz":
+            return _npz_bytes(sparse_matrix(data), list(data.columns))
+        if fmt == "csv":
+            data.to_csv(stream, index=False)
+            return stream.getvalue()
+        # Parquet and Arrow have no sparse columns
+        data = pa.Table.from_pandas(densify(data), preserve_index=False)
+    if fmt == "parquet":
+        pq.write_table(data, stream, compression=compression or settings.PARQUET_COMPRESSION,
+                       row_group_size=row_group_size or settings.PARQUET_ROW_GROUP_SIZE)
+    else:
+        feather.write_feather(data, stream, compression=compression or settings.ARROW_COMPRESSION)
+    return stream.getvalue()
+
+
+def _ipc_compression(compression: Optional[str]) -> Optional[str]:
+    compression = compression or settings.ARROW_COMPRESSION
+    return None if compression == "uncompressed" else compression
+
 minio_client = MinioClient()
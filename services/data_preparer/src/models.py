@@ -1,18 +1,70 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Index, Float
 from sqlalchemy.sql import func
 from .database import Base
 
+TERMINAL_STATUSES = {"COMPLETED", "FAILED", "TIMEOUT", "OOM", "CANCELLED"}
+
 class PreparedDataset(Base):
     __tablename__ = "prepared_datasets"
 
     id = Column(Integer, primary_key=True, index=True)
     job_id = Column(String, unique=True, index=True)
+    batch_id = Column(String, nullable=True, index=True)  # set for jobs submitted through /prepare/batch
     input_bucket = Column(String)
     input_path = Column(String)
     output_bucket = Column(String)
-    output_path = Column(String)
+    output_path = Column(String)  # the manifest of a partitioned output
+    output_manifest = Column(JSON, nullable=True)  # partitions, row counts, sizes, checksums (see partitioning.py)
+    output_evicted_at = Column(DateTime(timezone=True), nullable=True)  # output deleted by result cache eviction; location cleared
     pipeline_config = Column(JSON)
-    status = Column(String, default="PENDING") # PENDING, PROCESSING, COMPLETED, FAILED
+    status = Column(String, default="PENDING") # PENDING, PROCESSING, COMPLETED, FAILED, TIMEOUT, OOM, CANCELLED
     error_message = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    artifact_bucket = Column(String, nullable=True)  # fitted pipeline state, reused by /apply
+    artifact_path = Column(String, nullable=True)
+
+    # Job queue
+    request_payload = Column(JSON, nullable=True)  # full PreparationRequest, so any worker can run the job
+    cache_key = Column(String, nullable=True)
+    input_version = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    progress = Column(Float, default=0.0)  # 0..1, reported by the worker
+    available_at = Column(DateTime(timezone=True), server_default=func.now())  # retry backoff: not claimable before
+    cancel_requested_at = Column(DateTime(timezone=True), nullable=True)  # /cancel of a running job, picked up by its worker
+
+    # Instrumentation of the last attempt (see metrics.py); the scalars feed the /metrics histograms
+    queue_wait_seconds = Column(Float, nullable=True)  # ready -> claimed by a worker
+    duration_seconds = Column(Float, nullable=True)  # run time measured by the worker
+    rows_in = Column(BigInteger, nullable=True)
+    bytes_in = Column(BigInteger, nullable=True)  # read from the object store
+    bytes_out = Column(BigInteger, nullable=True)  # written to the object store, artifact included
+    metrics = Column(JSON, nullable=True)  # per-stage and per-operator timings, row and byte counts, peak RSS
+
+    __table_args__ = (
+        Index("ix_prepared_datasets_queue", "status", "available_at"),
+        # GET /jobs: newest first, optionally by status, keyset-paginated on (created_at, id)
+        Index("ix_prepared_datasets_status_created", "status", "created_at", "id"),
+        Index("ix_prepared_datasets_created", "created_at", "id"),
+    )
+
+class ResultCacheEntry(Base):
+    """
+    Content-addressed index of finished outputs: one row per (input object version, pipeline, output options).
+    """
+    __tablename__ = "result_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True)
+    job_id = Column(String, index=True)  # job that produced the output
+    input_bucket = Column(String)
+    input_path = Column(String)
+    input_version = Column(String)  # ETag (and version id when versioning is on)
+    output_bucket = Column(String)
+    output_path = Column(String)
+    output_etag = Column(String, nullable=True)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
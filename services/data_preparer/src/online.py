@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .schemas import PipelineStep
+from .processing import DataProcessor, ExecutionPlan, processor
+from .artifacts import FittedPipeline, artifact_store
+from .dtypes import densify
+from .config import settings
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def pipeline_id(steps: List[PipelineStep]) -> str:
+    canonical = json.dumps([{"operator": s.operator.lower(), "params": s.params or {}} for s in steps],
+                           sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _nan_nulls(df: pd.DataFrame) -> pd.DataFrame:
+    # Nulls arrive as None in text columns; read_csv would have produced NaN
+    text_cols = df.select_dtypes(include=['object']).columns
+    if not text_cols.empty:
+        df[text_cols] = df[text_cols].where(df[text_cols].notna(), np.nan)
+    return df
+
+
+def frame_from_records(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    return _nan_nulls(pd.DataFrame.from_records(rows))
+
+
+def frame_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    # NaN is not valid JSON
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def frame_from_arrow(body: bytes) -> pd.DataFrame:
+    return _nan_nulls(pa.ipc.open_stream(pa.BufferReader(body)).read_pandas())
+
+
+def frame_to_arrow(df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(densify(df), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class _LRU:
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class TransformService:
+    """
+    In-process execution of small payloads for the synchronous /transform endpoint.
+
+    Pipelines are registered under a content hash, and the execution plan compiled for
+    a (pipeline, input schema) pair is kept, so a repeated call goes straight to
+    execution: no object store, no database, no recompilation. Plans hold no
+    per-run state and are shared between concurrent requests.
+    """
+    def __init__(self, processor: DataProcessor, max_plans: int):
+        self.processor = processor
+        self._pipelines = _LRU(max_plans)
+        self._plans = _LRU(max_plans)
+        self._artifacts = _LRU(max_plans)  # job id -> (bucket, path) of its fitted pipeline
+
+    def register(self, steps: List[PipelineStep]) -> str:
+        key = pipeline_id(steps)
+        if self._pipelines.get(key) is None:
+            self._pipelines.put(key, list(steps))
+        return key
+
+    def steps(self, key: str) -> Optional[List[PipelineStep]]:
+        return self._pipelines.get(key)
+
+    def plan(self, key: str, dtypes: pd.Series) -> ExecutionPlan:
+        steps = self._pipelines.get(key)
+        if steps is None:
+            raise KeyError(f"Unknown pipeline {key}")
+        schema = (key, tuple((col, str(dtype)) for col, dtype in dtypes.items()))
+        plan = self._plans.get(schema)
+        if plan is None:
+            # Small payloads: threads would only add latency
+            plan = self.processor.compile(steps, dtypes, n_jobs=1)
+            self._plans.put(schema, plan)
+        return plan
+
+    def transform(self, df: pd.DataFrame, key: str) -> pd.DataFrame:
+        # The frame was just decoded from the request, so the plan may work on it directly
+        return self.plan(key, df.dtypes).execute(df)
+
+    def fitted(self, job_id: str, locate: Callable[[str], Optional[Tuple[str, str]]]) -> Optional[FittedPipeline]:
+        """
+        Fitted pipeline of a completed job. `locate` (a database lookup) only runs the first
+        time: artifacts never change once written.
+        """
+        location = self._artifacts.get(job_id)
+        if location is None:
+            location = locate(job_id)
+            if location is None:
+                return None
+            self._artifacts.put(job_id, location)
+        return artifact_store.load(*location)
+
+transform_service = TransformService(processor, settings.TRANSFORM_PLAN_CACHE_SIZE)
@@ -0,0 +1,237 @@
+"""
+Typed registry of the pipeline operators.
+
+Every operator maps to a pydantic model of the params it accepts, so a pipeline with an
+unknown operator, a misspelled param or a value sklearn/pandas would reject is refused
+when it is submitted instead of after its input has been downloaded and parsed.
+Params are only checked: the steps are stored and run exactly as they were sent.
+"""
+from typing import Any, Dict, List, Literal, Optional, Tuple, Type, Union
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+from .schemas import PipelineStep
+from .streaming import SPARSE_DUMMIES_PARAMS
+from .expressions import CAST_TYPES, parse
+
+
+class OperatorParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+
+class FillnaParams(OperatorParams):
+    value: Union[bool, int, float, str, Dict[str, Any]] = 0 # Scalar, or per-column values
+
+
+class ImputerParams(OperatorParams):
+    strategy: Literal["mean", "median", "most_frequent", "constant_zero"] = "most_frequent"
+
+
+class DropNaParams(OperatorParams):
+    axis: Literal[0, 1, "index", "rows", "columns"] = 0
+    how: Optional[Literal["any", "all"]] = None
+    thresh: Optional[int] = Field(default=None, ge=0)
+    subset: Optional[List[str]] = None
+    ignore_index: bool = False
+
+    @model_validator(mode="after")
+    def check_how(self):
+        if self.how is not None and self.thresh is not None:
+            raise ValueError("how and thresh cannot be set together")
+        return self
+
+
+class StandardScalerParams(OperatorParams):
+    with_mean: bool = True
+    with_std: bool = True
+    copy_: bool = Field(default=True, alias="copy")
+
+
+class MinMaxScalerParams(OperatorParams):
+    feature_range: Tuple[float, float] = (0, 1)
+    clip: bool = False
+    copy_: bool = Field(default=True, alias="copy")
+
+    @field_validator("feature_range")
+    @classmethod
+    def check_range(cls, value):
+        if value[0] >= value[1]:
+            raise ValueError("the minimum of feature_range must be smaller than its maximum")
+        return value
+
+
+class _IndicatorParams(OperatorParams):
+    dtype: Optional[str] = None # Of the indicator columns, e.g. int, bool, float32
+
+    @field_validator("dtype")
+    @classmethod
+    def check_dtype(cls, value):
+        if value is not None:
+            try:
+                np.dtype(value)
+            except TypeError:
+                raise ValueError(f"{value!r} is not a NumPy dtype")
+        return value
+
+
+class OneHotParams(_IndicatorParams):
+    columns: Optional[List[str]] = None
+    prefix: Optional[Union[str, List[str], Dict[str, str]]] = None
+    prefix_sep: str = "_"
+    dummy_na: bool = False
+    drop_first: bool = False
+    sparse: bool = False # Sparse indicator columns (see max_categories)
+    max_categories: Optional[int] = Field(default=None, ge=1) # Most frequent values per column; the rest share one column
+    other_label: str = "other"
+
+    @model_validator(mode="after")
+    def check_sparse_params(self):
+        if self.sparse or self.max_categories:
+            unsupported = self.model_fields_set - SPARSE_DUMMIES_PARAMS
+            if unsupported:
+                raise ValueError(f"one_hot with sparse or max_categories does not support {sorted(unsupported)}")
+        return self
+
+
+class HashEncoderParams(_IndicatorParams):
+    columns: Optional[List[str]] = None
+    n_features: int = Field(default=32, ge=1)
+    prefix_sep: str = "_"
+    sparse: bool = True
+
+
+class FrequencyEncoderParams(OperatorParams):
+    columns: Optional[List[str]] = None
+    normalize: bool = True
+
+
+class TargetEncoderParams(OperatorParams):
+    target: str
+    columns: Optional[List[str]] = None
+    smoothing: float = Field(default=10.0, ge=0)
+
+
+def _check_expression(value: str) -> str:
+    parse(value)  # ValueError on unsupported syntax
+    return value
+
+
+class FilterParams(OperatorParams):
+    condition: str # e.g. "age >= 18 and country in ('DE', 'FR')"; rows where it is false or null are dropped
+
+    _check_condition = field_validator("condition")(_check_expression)
+
+
+class SelectParams(OperatorParams):
+    columns: Optional[List[str]] = None # Columns to keep, in this order
+    drop: Optional[List[str]] = None # Or: columns to remove
+
+    @model_validator(mode="after")
+    def check_one(self):
+        if (self.columns is None) == (self.drop is None):
+            raise ValueError("select needs either columns or drop")
+        return self
+
+
+class DeriveParams(OperatorParams):
+    column: str # Added, or replaced if it exists
+    expression: str # e.g. "price * quantity", "log(income + 1)", "where(age < 18, 0, 1)"
+
+    _check_derived = field_validator("expression")(_check_expression)
+
+
+class CastParams(OperatorParams):
+    columns: Dict[str, Literal[tuple(CAST_TYPES)]] = Field(min_length=1) # Column -> type; floats cast to int truncate
+
+
+class ClipParams(OperatorParams):
+    columns: Optional[List[str]] = None # Default: all number columns
+    lower: Optional[float] = None
+    upper: Optional[float] = None
+
+    @model_validator(mode="after")
+    def check_bounds(self):
+        if self.lower is None and self.upper is None:
+            raise ValueError("clip needs lower and/or upper")
+        if self.lower is not None and self.upper is not None and self.lower > self.upper:
+            raise ValueError("lower must not exceed upper")
+        return self
+
+
+class WinsorizeParams(OperatorParams):
+    columns: Optional[List[str]] = None # Default: all number columns
+    lower: float = Field(default=0.01, ge=0, le=1) # Quantiles the values are clipped to, fitted on the data
+    upper: float = Field(default=0.99, ge=0, le=1)
+
+    @model_validator(mode="after")
+    def check_quantiles(self):
+        if self.lower >= self.upper:
+            raise ValueError("lower must be smaller than upper")
+        return self
+
+
+OPERATORS: Dict[str, Type[OperatorParams]] = {
+    "fillna": FillnaParams,
+    "imputer": ImputerParams,
+    "drop_na": DropNaParams,
+    "standard_scaler": StandardScalerParams,
+    "minmax_scaler": MinMaxScalerParams,
+    "one_hot": OneHotParams,
+    "get_dummies": OneHotParams,
+    "hash_encoder": HashEncoderParams,
+    "frequency_encoder": FrequencyEncoderParams,
+    "target_encoder": TargetEncoderParams,
+    "filter": FilterParams,
+    "select": SelectParams,
+    "derive": DeriveParams,
+    "cast": CastParams,
+    "clip": ClipParams,
+    "winsorize": WinsorizeParams,
+}
+
+
+class PipelineError(ValueError):
+    """A pipeline that cannot run; `errors` has one entry per offending step."""
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__("; ".join(f"step {e['step']} ({e['operator']}): {e['error']}" for e in errors))
+        self.errors = errors
+
+
+def _messages(error: ValidationError) -> List[str]:
+    messages = []
+    for e in error.errors():
+        location = ".".join(str(part) for part in e["loc"])
+        messages.append(f"{location}: {e['msg']}" if location else e["msg"])
+    return messages
+
+
+def validate_pipeline(steps: List[PipelineStep], streaming: bool = False):
+    """Raises PipelineError unless every step is a known operator with valid params."""
+    errors = []
+    for index, step in enumerate(steps):
+        op = step.operator.lower()
+        model = OPERATORS.get(op)
+        if model is None:
+            errors.append({"step": index, "operator": step.operator,
+                           "error": f"Unknown operator, expected one of {sorted(OPERATORS)}"})
+            continue
+        try:
+            params = model.model_validate(step.params or {})
+        except ValidationError as e:
+            errors.extend({"step": index, "operator": step.operator, "error": message} for message in _messages(e))
+            continue
+        if streaming and op == "drop_na" and params.axis in (1, "columns"):
+            errors.append({"step": index, "operator": step.operator,
+                           "error": "drop_na over columns needs the whole dataset and is not supported in streaming mode"})
+    if errors:
+        raise PipelineError(errors)
+
+
+def streamable(steps: List[PipelineStep]) -> bool:
+    """Whether the pipeline can run in streaming mode."""
+    try:
+        validate_pipeline(steps, streaming=True)
+    except PipelineError:
+        return False
+    return True
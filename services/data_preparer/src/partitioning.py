@@ -0,0 +1,166 @@
+"""
+Partitioned job outputs (PreparationRequest.partitioning), for parallel training.
+
+The output is written as `count` objects, {prefix}part-00000.{ext} and so on, plus a
+manifest, {prefix}_manifest.json, holding the schema and the row count, size and SHA-256
+of every partition. Process i of n of a trainer reads the manifest and fetches only its
+own partitions. Without `by` the partitions are contiguous row ranges whose sizes differ
+by at most one row. With `by` a row goes to partition
+hash_pandas_object(row[by], index=False) % count, numbers hashed as float64, so the rows
+sharing a key land in one partition, in their output order, whether the column is int or
+float in a chunk (a chunk with a null in an int column has it as float). The same output and options always give the same
+partitions. The manifest is uploaded last, once every partition is in place.
+"""
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .schemas import PartitionOptions, PreparationRequest
+from .dtypes import densify
+from .minio_client import minio_client, FORMAT_EXTENSIONS
+
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def output_prefix(job_id: str, request: PreparationRequest) -> str:
+    """Key prefix of the partitions and manifest of a job, in the processed bucket."""
+    if request.output_path:
+        return request.output_path.rstrip("/") + "/"
+    return f"processed_{job_id}/"
+
+
+def is_manifest(path: str) -> bool:
+    return path.endswith("/" + MANIFEST_NAME)
+
+
+def _partition_of(data: Union[pd.DataFrame, pa.Table], options: PartitionOptions) -> np.ndarray:
+    columns = data.column_names if isinstance(data, pa.Table) else data.columns
+    missing = [c for c in options.by if c not in columns]
+    if missing:
+        raise ValueError(f"Partitioning columns not in the output: {missing}")
+    keys = data.select(options.by).to_pandas() if isinstance(data, pa.Table) else densify(data[options.by])
+    for column in keys.columns:
+        if pd.api.types.is_numeric_dtype(keys[column]) and not pd.api.types.is_bool_dtype(keys[column]):
+            keys[column] = keys[column].astype("float64")
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return (hashes % np.uint64(options.count)).astype(np.int64)
+
+
+def _parts(data: Union[pd.DataFrame, pa.Table], options: PartitionOptions,
+           partition: Optional[np.ndarray] = None) -> Callable[[int], Union[pd.DataFrame, pa.Table]]:
+    """The rows of partition i of `data`; `partition` holds the partition of every row in hash mode."""
+    if partition is None:
+        bounds = np.arange(options.count + 1) * len(data) // options.count
+        order = None
+    else:
+        # Stable: rows keep their output order within a partition
+        order = np.argsort(partition, kind="stable")
+        bounds = np.searchsorted(partition[order], np.arange(options.count + 1))
+
+    def part(i: int):
+        start, stop = bounds[i], bounds[i + 1]
+        if isinstance(data, pa.Table):
+            return data.slice(start, stop - start) if order is None else data.take(order[start:stop])
+        rows = data.iloc[start:stop] if order is None else data.take(order[start:stop])
+        return rows.reset_index(drop=True)
+    return part
+
+
+def _schema(df: pd.DataFrame) -> List[Dict[str, str]]:
+    schema = pa.Schema.from_pandas(densify(df.iloc[:0]), preserve_index=False)
+    return [{"name": field.name, "type": str(field.type)} for field in schema]
+
+
+def write_frame(job_id: str, df: pd.DataFrame, bucket: str, prefix: str, options: PartitionOptions, fmt: str,
+                compression: Optional[str] = None, row_group_size: Optional[int] = None) -> Dict[str, Any]:
+    """Writes the partitions of an in-memory output and its manifest. Returns the manifest."""
+    partition = _partition_of(df, options) if options.by else None
+    data = df
+    if fmt in ("parquet", "arrow"):
+        # Converted once: the partitions are slices of the table, encoded in parallel without the GIL
+        data = pa.Table.from_pandas(densify(df), preserve_index=False)
+    return _write(job_id, bucket, prefix, options, fmt, compression, row_group_size, _schema(df),
+                  _parts(data, options, partition))
+
+
+def write_chunks(job_id: str, chunks: Iterable[pd.DataFrame], bucket: str, prefix: str, options: PartitionOptions,
+                 fmt: str, compression: Optional[str] = None, row_group_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Writes the partitions of a chunked output and its manifest. Range partitions need the
+    total row count, so the chunks are spooled to a local Arrow file first; partitions are
+    then cut from the memory-mapped file as they are uploaded.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, "output.arrow")
+        writer = schema = None
+        partition = []
+        try:
+            for chunk in chunks:
+                # Later chunks are cast to the schema of the first one
+                table = pa.Table.from_pandas(densify(chunk), schema=schema, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pa.ipc.new_file(local_path, schema)
+                writer.write_table(table)
+                if options.by:
+                    # From the cast table: a key hashes the same in every chunk
+                    partition.append(_partition_of(table, options))
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            return write_frame(job_id, pd.DataFrame(), bucket, prefix, options, fmt, compression, row_group_size)
+
+        with pa.memory_map(local_path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            part = _parts(table, options, np.concatenate(partition) if options.by else None)
+            if fmt in ("csv", "npz"):
+                frame = lambda i: part(i).to_pandas()
+            else:
+                frame = part
+            return _write(job_id, bucket, prefix, options, fmt, compression, row_group_size,
+                          _schema(table.slice(0, 0).to_pandas()), frame)
+
+
+def _write(job_id: str, bucket: str, prefix: str, options: PartitionOptions, fmt: str, compression: Optional[str],
+           row_group_size: Optional[int], schema: List[Dict[str, str]],
+           frame: Callable[[int], Union[pd.DataFrame, pa.Table]]) -> Dict[str, Any]:
+    paths = [f"{prefix}part-{i:05d}.{FORMAT_EXTENSIONS[fmt]}" for i in range(options.count)]
+    saved = minio_client.save_partitions([(path, lambda i=i: frame(i)) for i, path in enumerate(paths)],
+                                         bucket, fmt, compression, row_group_size)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "job_id": job_id,
+        "format": fmt,
+        "partitioning": {
+            "count": options.count,
+            "by": options.by,
+            "method": "hash" if options.by else "range",
+        },
+        "schema": schema,
+        "rows": sum(rows for rows, _, _ in saved),
+        "bytes": sum(size for _, size, _ in saved),
+        "partitions": [
+            {"index": i, "path": path, "rows": rows, "bytes": size, "sha256": sha256}
+            for i, (path, (rows, size, sha256)) in enumerate(zip(paths, saved))
+        ],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    data = json.dumps(manifest, separators=(",", ":")).encode()
+    minio_client.put_bytes(data, bucket, prefix + MANIFEST_NAME, content_type="application/json")
+    return manifest
+
+
+def remove_output(bucket: str, manifest_path: str):
+    """Deletes a partitioned output: its partitions, then the manifest."""
+    buffer, _ = minio_client.read_object(bucket, manifest_path)
+    for partition in json.loads(bytes(buffer))["partitions"]:
+        minio_client.remove_object(bucket, partition["path"])
+    minio_client.remove_object(bucket, manifest_path)
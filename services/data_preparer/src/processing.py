@@ -1,22 +1,369 @@
+import time
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
-from sklearn.preprocessing import StandardScaler, MinMaxScaler, OneHotEncoder
-from sklearn.impute import SimpleImputer
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 from .schemas import PipelineStep
+from .expressions import EXPRESSION_OPERATORS, transform as transform_expression, winsorize_state
+from .streaming import (FittedStep, StepFitter, ENCODERS, block_dtype, number_columns, sorted_categories,
+                        sparse_dummies)
+from .metrics import operator_label, record_operator
+from .supervision import checkpoint
+from .config import settings
+
+# Operators that can be fused into a single pass over a contiguous float block
+NUMERIC_OPERATORS = {"standard_scaler", "minmax_scaler"}
+NUMERIC_IMPUTER_STRATEGIES = {"mean", "median", "constant_zero"}
+TEXT_DTYPES = ['object', 'string', 'category']
+
+
+def _is_numeric_op(op: str, params: Dict[str, Any]) -> bool:
+    if op in NUMERIC_OPERATORS:
+        return True
+    return op == "imputer" and params.get("strategy", "most_frequent") in NUMERIC_IMPUTER_STRATEGIES
+
+
+def _is_number(dtype) -> bool:
+    # Mirrors number_columns: select_dtypes(include=['number']) without sparse columns
+    return (pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+            and not isinstance(dtype, pd.SparseDtype))
+
+
+def _is_fusable(dtype) -> bool:
+    # NumPy integers and float32/float64; extension and float16 columns keep the per-step path
+    return isinstance(dtype, np.dtype) and (dtype.kind in "iu" or dtype in (np.float32, np.float64))
+
+
+def _most_frequent(values: pd.Series):
+    counts = values.value_counts(dropna=True)
+    counts = counts[counts > 0]
+    if counts.empty:
+        return np.nan
+    # SimpleImputer breaks ties by taking the smallest value
+    candidates = counts[counts == counts.max()].index
+    try:
+        return min(candidates)
+    except TypeError:
+        return candidates[0]
+
+
+def _changes_schema(op: str, params: Dict[str, Any]) -> bool:
+    """Whether the output columns/dtypes of a step can only be known from the data."""
+    if op in ENCODERS:
+        return True
+    if op == "fillna":
+        # A non-numeric fill value can turn an all-NaN float column into object
+        value = params.get("value", 0)
+        return not isinstance(value, (int, float)) or isinstance(value, bool)
+    if op == "drop_na":
+        return params.get("axis", 0) in (1, "columns")
+    # Rows only: the other expression steps add, drop or retype columns
+    return op in EXPRESSION_OPERATORS and op != "filter"
+
+
+def _fitted_list(estimator, attr: str) -> list:
+    return getattr(estimator, attr).tolist() if estimator is not None else []
+
+
+def _estimator_state(op: str, params: Dict[str, Any], columns: List[str], estimator) -> Dict[str, Any]:
+    """Fitted statistics of a sklearn estimator (None: no columns matched) in the FittedStep state format."""
+    if op == "imputer":
+        fill = _fitted_list(estimator, "statistics_")
+        return {"columns": columns, "strategy": params.get("strategy", "most_frequent"), "fill": dict(zip(columns, fill))}
+    if op == "standard_scaler":
+        return {
+            "columns": columns,
+            "mean": _fitted_list(estimator, "mean_") if params.get("with_mean", True) else None,
+            "scale": _fitted_list(estimator, "scale_") if params.get("with_std", True) else None,
+        }
+    low, high = params.get("feature_range", (0, 1))
+    return {
+        "columns": columns,
+        "scale": _fitted_list(estimator, "scale_"),
+        "min": _fitted_list(estimator, "min_"),
+        "clip": bool(params.get("clip", False)),
+        "feature_range": [low, high],
+    }
+
+
+class FusedNumericStage:
+    """
+    Runs a run of adjacent numeric operators over one contiguous float block.
+    The block is extracted once, every operator works in place on its column subset,
+    and the result is written back to the frame once. The block is float32 when
+    sklearn would compute in float32 too (all columns float32 or narrow integers).
+
+    All fused operators are per-column, so with `n_jobs` > 1 the block is split into
+    contiguous column ranges that run on a thread pool (NumPy releases the GIL).
+    Each column sees exactly the same computation as in the serial run.
+    """
+    def __init__(self, columns: List[str], ops: List[tuple], n_jobs: int = 1, dtype=np.float64):
+        self.columns = columns
+        self.ops = ops  # (operator, params, column indices into the block, step index)
+        self.n_jobs = n_jobs
+        self.dtype = np.dtype(dtype)
+
+    def describe(self):
+        """(step indices, operator names) for the per-operator timings."""
+        return [op[3] for op in self.ops], "+".join(operator_label(op, params) for op, params, _, _ in self.ops)
+
+    def execute(self, df: pd.DataFrame, fitted: Optional[Dict[int, FittedStep]] = None) -> pd.DataFrame:
+        # Fortran order keeps each column contiguous, like DataFrame.to_numpy() hands sklearn
+        block = np.asfortranarray(df[self.columns].to_numpy(dtype=self.dtype))
+        width = len(self.columns)
+        touched = np.zeros(width, dtype=bool)
+        estimators = [] if fitted is not None else None
+
+        ranges = self._column_ranges(width)
+        if len(ranges) == 1:
+            self._run_ops(block, self.ops, touched, estimators)
+        else:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                futures = [pool.submit(self._run_ops, block[:, start:stop], self._slice_ops(start, stop),
+                                       touched[start:stop], estimators, start)
+                           for start, stop in ranges]
+                for future in futures:
+                    future.result()
+        if fitted is not None:
+            self._record(fitted, estimators)
+
+        # Imputers and scalers hand back floats; columns only zero-filled keep their dtype
+        float_cols = [c for c, t in zip(self.columns, touched) if t or df[c].dtype == self.dtype]
+        if float_cols:
+            df[float_cols] = block[:, [self.columns.index(c) for c in float_cols]]
+        for i, col in enumerate(self.columns):
+            if not touched[i] and df[col].dtype.kind == "f" and df[col].dtype != self.dtype:
+                df[col] = block[:, i].astype(df[col].dtype)
+        return df
+
+    def _column_ranges(self, width: int) -> List[tuple]:
+        blocks = max(1, min(self.n_jobs, width // settings.PARALLEL_MIN_COLUMNS_PER_BLOCK))
+        bounds = np.linspace(0, width, blocks + 1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _slice_ops(self, start: int, stop: int) -> List[tuple]:
+        sliced = []
+        for op, params, idx, step_index in self.ops:
+            local = [i - start for i in idx if start <= i < stop]
+            if local:
+                sliced.append((op, params, local, step_index))
+        return sliced
+
+    def _record(self, fitted: Dict[int, FittedStep], estimators: List[tuple]):
+        """Merges the estimators fitted on each column range into one state per step."""
+        for op, params, idx, step_index in self.ops:
+            columns = [self.columns[i] for i in idx]
+            if op == "imputer" and params["strategy"] == "constant_zero":
+                fitted[step_index] = FittedStep(op, params, None)
+                continue
+            parts = sorted((offset, local, est) for index, offset, local, est in estimators if index == step_index)
+            if len(parts) <= 1:
+                state = _estimator_state(op, params, columns, parts[0][2] if parts else None)
+            else:
+                # Column ranges are contiguous and ordered, so the per-range states concatenate
+                states = [_estimator_state(op, params, columns, est) for _, _, est in parts]
+                state = dict(states[0], columns=columns)
+                for key in ("mean", "scale", "min"):
+                    if state.get(key) is not None:
+                        state[key] = [v for part in states for v in part[key]]
+                if op == "imputer":
+                    fill = [v for part in states for v in part["fill"].values()]
+                    state["fill"] = dict(zip(columns, fill))
+            fitted[step_index] = FittedStep(op, params, state)
+
+    @staticmethod
+    def _run_ops(block: np.ndarray, ops: List[tuple], touched: np.ndarray,
+                 estimators: Optional[list] = None, offset: int = 0):
+        """
+        Applies the operators in place on `block` (which may be a column slice of the full block).
+        Fitted estimators are appended to `estimators` as (step index, offset, columns, estimator).
+        """
+        # scikit-learn takes about a second to import: loaded by the first job, not at startup
+        from sklearn.impute import SimpleImputer
+        from sklearn.preprocessing import MinMaxScaler, StandardScaler
+        width = block.shape[1]
+        for op, params, idx, step_index in ops:
+            if not idx:
+                continue
+            full = len(idx) == width
+            sub = block if full else np.asfortranarray(block[:, idx])
+
+            if op == "imputer" and params["strategy"] == "constant_zero":
+                sub[np.isnan(sub)] = 0
+                result = sub
+            else:
+                if op == "imputer":
+                    estimator = SimpleImputer(strategy=params["strategy"], copy=False)
+                elif op == "standard_scaler":
+                    estimator = StandardScaler(**{"copy": False, **params})
+                else:
+                    estimator = MinMaxScaler(**{"copy": False, **params})
+                result = estimator.fit_transform(sub)
+                touched[idx] = True
+                if estimators is not None:
+                    estimators.append((step_index, offset, idx, estimator))
+                if result.shape[1] != len(idx):
+                    # SimpleImputer drops all-NaN columns; the step-wise path fails the same way
+                    raise ValueError("Columns must be same length as key")
+
+            if full:
+                if result is not block:
+                    block[...] = result
+            else:
+                block[:, idx] = result
+
+
+class StepStage:
+    """Runs a single step through the regular per-step implementation."""
+    def __init__(self, processor: "DataProcessor", step: PipelineStep, index: int = 0):
+        self.processor = processor
+        self.step = step
+        self.index = index
+
+    def describe(self):
+        return [self.index], operator_label(self.step.operator.lower(), self.step.params or {})
+
+    def execute(self, df: pd.DataFrame, fitted: Optional[Dict[int, FittedStep]] = None) -> pd.DataFrame:
+        if fitted is None:
+            return self.processor._apply_step(df, self.step)
+        state = {}
+        df = self.processor._apply_step(df, self.step, state)
+        fitted[self.index] = FittedStep(self.step.operator.lower(), self.step.params or {}, state or None)
+        return df
+
+
+class DeferredStage:
+    """Compiles the remaining steps once the schema produced by the previous step is known."""
+    def __init__(self, processor: "DataProcessor", steps: List[PipelineStep], n_jobs: int = 1, offset: int = 0):
+        self.processor = processor
+        self.steps = steps
+        self.n_jobs = n_jobs
+        self.offset = offset
+
+    def execute(self, df: pd.DataFrame, fitted: Optional[Dict[int, FittedStep]] = None) -> pd.DataFrame:
+        return self.processor.compile(self.steps, df.dtypes, self.n_jobs, self.offset).execute(df, fitted)
+
+
+class ExecutionPlan:
+    def __init__(self, stages: list):
+        self.stages = stages
+
+    def execute(self, df: pd.DataFrame, fitted: Optional[Dict[int, FittedStep]] = None) -> pd.DataFrame:
+        """Runs the stages; with `fitted`, the state learned by each step is stored there under its index."""
+        for stage in self.stages:
+            checkpoint()
+            if isinstance(stage, DeferredStage):
+                df = stage.execute(df, fitted)  # its own plan reports the steps
+                continue
+            start, rows = time.perf_counter(), len(df)
+            df = stage.execute(df, fitted)
+            steps, operator = stage.describe()
+            record_operator(steps, operator, time.perf_counter() - start, rows, len(df))
+        return df
+
 
 class DataProcessor:
-    def process(self, df: pd.DataFrame, steps: List[PipelineStep]) -> pd.DataFrame:
+    def process(self, df: pd.DataFrame, steps: List[PipelineStep], n_jobs: Optional[int] = None,
+                fitted: Optional[List[FittedStep]] = None, offset: int = 0) -> pd.DataFrame:
+        """
+        Fits and runs the pipeline. If a `fitted` list is passed, it receives one FittedStep
+        per step, which can transform new data exactly like this run did. `offset` is the
+        index of the first of `steps` in the whole pipeline, for the operator metrics.
+        """
+        # Stages replace whole columns rather than writing into them, so a shallow
+        # copy is enough to leave the caller's frame untouched
+        plan = self.compile(steps, df.dtypes, n_jobs, offset)
+        if fitted is None:
+            return plan.execute(df.copy(deep=False))
+        states: Dict[int, FittedStep] = {}
+        result = plan.execute(df.copy(deep=False), states)
+        fitted.extend(states[i] for i in sorted(states))
+        return result
+
+    def process_stepwise(self, df: pd.DataFrame, steps: List[PipelineStep]) -> pd.DataFrame:
+        """Reference implementation: one `_apply_step` per step. Used to check and benchmark the compiled plan."""
         df_processed = df.copy()
-        
+
         for step in steps:
             df_processed = self._apply_step(df_processed, step)
-            
+
         return df_processed
 
-    def _apply_step(self, df: pd.DataFrame, step: PipelineStep) -> pd.DataFrame:
+    def compile(self, steps: List[PipelineStep], dtypes: pd.Series, n_jobs: Optional[int] = None,
+                offset: int = 0) -> ExecutionPlan:
+        """
+        Turns a pipeline into an execution plan for a frame with the given dtypes.
+
+        Column sets are resolved once from a simulated schema, and adjacent numeric
+        operators (mean/median/constant_zero imputer, scalers) are fused into one
+        FusedNumericStage. Steps whose output schema depends on the data
+        (e.g. one_hot) end the plan with a DeferredStage for the rest of the pipeline.
+        `n_jobs` threads run the fused stages column-block parallel (default: PROCESSING_N_JOBS).
+        `offset` is the index of the first of `steps` in the whole pipeline.
+        """
+        n_jobs = n_jobs or settings.PROCESSING_N_JOBS
+        dtypes = dict(dtypes.items())
+        stages = []
+        pending: List[tuple] = []  # (step index, step)
+
+        def flush():
+            if pending:
+                stages.extend(self._fuse(pending, dtypes, n_jobs))
+                pending.clear()
+
+        for i, step in enumerate(steps):
+            op = step.operator.lower()
+            params = step.params or {}
+
+            if _is_numeric_op(op, params):
+                pending.append((offset + i, step))
+                continue
+
+            if op == "imputer":
+                # most_frequent only touches text and category columns, so it commutes with
+                # the pending numeric run and does not break the fusion (dtypes are unchanged)
+                stages.append(StepStage(self, step, offset + i))
+                continue
+
+            flush()
+            stages.append(StepStage(self, step, offset + i))
+            if _changes_schema(op, params):
+                if i + 1 < len(steps):
+                    stages.append(DeferredStage(self, steps[i + 1:], n_jobs, offset + i + 1))
+                break
+        flush()
+        return ExecutionPlan(stages)
+
+    def _fuse(self, steps: List[tuple], dtypes: Dict[str, Any], n_jobs: int = 1) -> list:
+        """Resolves the column set of each numeric (index, step) and groups them into one block stage."""
+        number_cols = [c for c, dtype in dtypes.items() if _is_number(dtype)]
+        if not all(_is_fusable(dtypes[c]) for c in number_cols):
+            # Extension dtypes: keep the exact per-step semantics
+            return [StepStage(self, step, index) for index, step in steps]
+
+        # Every numeric operator selects all number columns, so one block dtype holds for the whole run
+        dtype = block_dtype([dtypes[c] for c in number_cols]) if number_cols else np.dtype('float64')
+        resolved = []
+        for index, step in steps:
+            op = step.operator.lower()
+            params = step.params or {}
+            if op != "imputer" or params["strategy"] != "constant_zero":
+                for col in number_cols:
+                    dtypes[col] = dtype
+            resolved.append((op, params, number_cols, index))
+
+        block_cols = number_cols if resolved else []
+        ops = [(op, params, list(range(len(cols))), index) for op, params, cols, index in resolved]
+        return [FusedNumericStage(block_cols, ops, n_jobs, dtype)]
+
+    def _apply_step(self, df: pd.DataFrame, step: PipelineStep, state: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Runs one step. If a `state` dict is passed, the statistics the step learned are stored in it."""
+        from sklearn.impute import SimpleImputer
+        from sklearn.preprocessing import MinMaxScaler, StandardScaler
         op = step.operator.lower()
         params = step.params or {}
-        
+        record = state is not None
+
         if op == "fillna":
             value = params.get("value", 0)
             value = params.get("value", 0)
@@ -24,52 +371,94 @@ class DataProcessor:
 
         elif op == "imputer":
             strategy = params.get("strategy", "most_frequent")
-            
+
             if strategy == "most_frequent":
-                # Apply to non-numeric columns (categorical)
-                cat_cols = df.select_dtypes(include=['object', 'category']).columns
-                if not cat_cols.empty:
-                    imputer = SimpleImputer(strategy='most_frequent')
-                    df[cat_cols] = imputer.fit_transform(df[cat_cols])
-            
+                # Apply to non-numeric columns (categorical). Not SimpleImputer: it misses the None
+                # of text read from Parquet, which FittedStep (streaming, /apply) does fill
+                fill = {}
+                for col in df.select_dtypes(include=['object', 'string', 'category']).columns:
+                    fill[col] = _most_frequent(df[col])
+                    if not pd.isna(fill[col]):
+                        df[col] = df[col].fillna(fill[col])
+                if record:
+                    columns = [c for c in df.columns if c in fill]
+                    state.update({"columns": columns, "strategy": strategy, "fill": {c: fill[c] for c in columns}})
+
             elif strategy in ["mean", "median"]:
                 # Apply to numeric columns
-                num_cols = df.select_dtypes(include=['number']).columns
-                if not num_cols.empty:
+                num_cols = number_columns(df)
+                imputer = None
+                if num_cols:
                     imputer = SimpleImputer(strategy=strategy)
                     df[num_cols] = imputer.fit_transform(df[num_cols])
+                if record:
+                    state.update(_estimator_state(op, params, list(num_cols), imputer))
 
             elif strategy == "constant_zero":
                  # Apply 0 to numeric columns only
-                num_cols = df.select_dtypes(include=['number']).columns
-                if not num_cols.empty:
+                num_cols = number_columns(df)
+                if num_cols:
                     df[num_cols] = df[num_cols].fillna(0)
-            
+
             return df
-            
+
         elif op == "drop_na":
-            return df.dropna(**params)
-            
+            result = df.dropna(**params)
+            if record and params.get("axis", 0) in (1, "columns"):
+                # Which columns survive depends on the data: keep the same ones on new data
+                state["columns"] = list(result.columns)
+            return result
+
         elif op == "standard_scaler":
             # Apply to numeric columns only
             scaler = StandardScaler(**params)
-            numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-            if not numeric_cols.empty:
+            numeric_cols = number_columns(df)
+            if numeric_cols:
                 df[numeric_cols] = scaler.fit_transform(df[numeric_cols])
+            if record:
+                state.update(_estimator_state(op, params, numeric_cols, scaler if numeric_cols else None))
             return df
-            
+
         elif op == "minmax_scaler":
             scaler = MinMaxScaler(**params)
-            numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-            if not numeric_cols.empty:
+            numeric_cols = number_columns(df)
+            if numeric_cols:
                 df[numeric_cols] = scaler.fit_transform(df[numeric_cols])
+            if record:
+                state.update(_estimator_state(op, params, numeric_cols, scaler if numeric_cols else None))
             return df
-            
+
+        elif op in ("hash_encoder", "frequency_encoder", "target_encoder") or (op in ("get_dummies", "one_hot") and sparse_dummies(params)):
+            # Same fit as in streaming mode, over the whole frame
+            fitter = StepFitter(op, params)
+            fitter.update(df)
+            fitted = FittedStep(op, params, fitter.finalize())
+            if record:
+                state.update(fitted.state)
+            return fitted.transform(df)
+
         elif op == "get_dummies" or op == "one_hot":
+            if record:
+                # Same default column selection as pd.get_dummies
+                columns = params.get("columns")
+                if columns is None:
+                    columns = list(df.select_dtypes(include=TEXT_DTYPES).columns)
+                state["columns"] = list(columns)
+                state["categories"] = {c: sorted_categories(df[c].dropna().unique()) for c in columns}
+            # Dummies for the values present, as for text columns, not for every declared category
+            for col in df.select_dtypes(include=['category']).columns:
+                if params.get("columns") is None or col in params["columns"]:
+                    df[col] = df[col].cat.remove_unused_categories()
             return pd.get_dummies(df, **params)
-            
+
+        elif op in EXPRESSION_OPERATORS:
+            fitted = winsorize_state(df, params) if op == "winsorize" else None
+            if record and fitted is not None:
+                state.update(fitted)
+            return transform_expression(df, op, params, fitted)
+
         else:
-            print(f"Warning: Unknown operator {op}")
-            return df
+            # Rejected at submission (operators.validate_pipeline); only reached by direct callers
+            raise ValueError(f"Unknown operator {op}")
 
 processor = DataProcessor()
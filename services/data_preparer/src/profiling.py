@@ -0,0 +1,289 @@
+"""
+Dataset profiles: per-column dtype, null counts, distinct count estimates, min/max/mean
+and approximate quantiles, plus a preview of the first rows.
+
+A profile takes one streaming pass over the object, or, for large CSVs, a few random
+byte ranges of it. It is cached per object version, in memory and in the processed
+bucket, so any API process can answer a repeated request without touching the data.
+"""
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from minio.error import S3Error
+
+from .streaming import ReservoirAccumulator
+from .online import frame_to_records
+from .minio_client import minio_client, detect_format
+from .config import settings
+
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+PROFILE_VERSION = 1
+
+
+def _number(value) -> Optional[float]:
+    # JSON has no NaN
+    return None if value is None or pd.isna(value) else float(value)
+
+
+def _leading_zeros(x: np.ndarray) -> np.ndarray:
+    """Leading zero bits of non-zero uint64 values."""
+    zeros = np.zeros(x.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = x < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[empty] += shift
+        x = np.where(empty, x << np.uint64(shift), x)
+    return zeros
+
+
+class HyperLogLog:
+    """Distinct count sketch: 2**precision one-byte registers, about 1.04 / sqrt(2**precision) relative error."""
+    def __init__(self, precision: Optional[int] = None):
+        self.precision = precision or settings.PROFILE_HLL_PRECISION
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+
+    def add(self, values: pd.Series):
+        values = values.dropna()
+        if values.empty:
+            return
+        if values.dtype == object:
+            values = values.astype(str)
+        hashes = pd.util.hash_array(values.to_numpy())
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        # The bit below the remaining 64 - p bits bounds the rank when they are all zero
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        np.maximum.at(self.registers, index, _leading_zeros(rest) + 1)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            estimate = m * np.log(m / empty)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+
+class _ColumnProfile:
+    def __init__(self):
+        self.dtypes: List[str] = []
+        self.count = 0
+        self.nulls = 0
+        self.hll = HyperLogLog()
+        self.numeric = True
+        self.min = self.max = None
+        self.sum = 0.0
+        self.n_numeric = 0
+
+    def update(self, values: pd.Series):
+        dtype = str(values.dtype)
+        if dtype not in self.dtypes:
+            self.dtypes.append(dtype)
+        nulls = int(values.isna().sum())
+        self.count += len(values)
+        self.nulls += nulls
+        self.hll.add(values)
+        is_number = pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype)
+        if not is_number:
+            # A chunk of text turns the column into text: its statistics would be meaningless
+            self.numeric = self.numeric and nulls == len(values)
+            return
+        numbers = values.to_numpy(dtype='float64', na_value=np.nan)
+        numbers = numbers[~np.isnan(numbers)]
+        if len(numbers):
+            self.min = numbers.min() if self.min is None else min(self.min, numbers.min())
+            self.max = numbers.max() if self.max is None else max(self.max, numbers.max())
+            self.sum += float(numbers.sum())
+            self.n_numeric += len(numbers)
+
+    def dtype(self) -> str:
+        if len(self.dtypes) == 1:
+            return self.dtypes[0]
+        # e.g. int64 in one chunk and float64 (with nulls) in another
+        return "float64" if self.numeric else "object"
+
+
+class Profiler:
+    """Accumulates a profile over the chunks of a dataset."""
+    def __init__(self, sample_size: Optional[int] = None, preview_rows: Optional[int] = None):
+        self.columns: Dict[str, _ColumnProfile] = {}
+        self.reservoir = ReservoirAccumulator(sample_size or settings.PROFILE_SAMPLE_SIZE)
+        self.preview_rows = preview_rows or settings.PROFILE_PREVIEW_ROWS
+        self.preview: Optional[pd.DataFrame] = None
+        self.rows = 0
+
+    def update(self, chunk: pd.DataFrame):
+        if self.preview is None:
+            self.preview = chunk.head(self.preview_rows)
+        self.rows += len(chunk)
+        numeric = []
+        for col in chunk.columns:
+            profile = self.columns.setdefault(col, _ColumnProfile())
+            profile.update(chunk[col])
+            if profile.numeric and pd.api.types.is_numeric_dtype(chunk[col].dtype) and not pd.api.types.is_bool_dtype(chunk[col].dtype):
+                numeric.append(col)
+        if numeric:
+            self.reservoir.update(chunk[numeric])
+
+    def result(self, rows: Optional[float] = None) -> Dict[str, Any]:
+        """The profile; with `rows` (estimated total rows), counts are scaled up from the rows seen."""
+        scale = rows / self.rows if rows is not None and self.rows else 1.0
+        columns = []
+        for name, p in self.columns.items():
+            numeric = p.numeric and p.n_numeric > 0
+            non_null = p.count - p.nulls
+            distinct = min(p.hll.count(), non_null)
+            if scale > 1 and distinct > non_null / 2:
+                # Mostly distinct in the sample (IDs, measurements): assume the ratio holds for the whole file.
+                # Low-cardinality columns are already saturated in the sample
+                distinct *= scale
+            columns.append({
+                "name": str(name),
+                "dtype": p.dtype(),
+                "count": int(round((p.count - p.nulls) * scale)),
+                "nulls": int(round(p.nulls * scale)),
+                "null_fraction": p.nulls / p.count if p.count else 0.0,
+                "distinct": int(round(distinct)),
+                "min": _number(p.min) if numeric else None,
+                "max": _number(p.max) if numeric else None,
+                "mean": p.sum / p.n_numeric if numeric else None,
+                "quantiles": dict(zip(map(str, QUANTILES), map(_number, self.reservoir.quantiles(name, QUANTILES))))
+                             if numeric else None,
+            })
+        total_rows = int(round(self.rows * scale))
+        return {
+            "rows": total_rows,
+            "columns": columns,
+            "missing_values": sum(c["nulls"] for c in columns),
+            "preview": frame_to_records(self.preview) if self.preview is not None else [],
+        }
+
+
+def _sample_csv(bucket: str, path: str, size: int, version: str) -> Tuple[pd.DataFrame, float]:
+    """
+    Reads the first range of the file (header and preview rows) plus one random range in each of
+    PROFILE_SAMPLE_RANGES - 1 equal strata of the rest, keeping the whole lines of each.
+    Returns the sampled rows and the estimated row count of the file.
+    Assumes no quoted newlines inside fields.
+    """
+    n, length = settings.PROFILE_SAMPLE_RANGES, settings.PROFILE_SAMPLE_RANGE_BYTES
+    # Seeded by the version: the same object always yields the same sample
+    rng = np.random.default_rng(int(hashlib.sha256(version.encode()).hexdigest()[:16], 16))
+    stratum = (size - length) // (n - 1)
+    ranges = [(0, length)] + [(length + i * stratum + int(rng.integers(0, stratum - length + 1)), length)
+                              for i in range(n - 1)]
+    parts = minio_client.read_ranges(bucket, path, ranges, version)
+
+    header, _, first = parts[0].partition(b"\n")
+    lines = [first[:first.rfind(b"\n") + 1]]
+    for part in parts[1:]:
+        body = part[part.find(b"\n") + 1:]  # drop the partial first line
+        lines.append(body[:body.rfind(b"\n") + 1])
+    body = b"".join(lines)
+    sample = pd.read_csv(io.BytesIO(header + b"\n" + body))
+    rows = (size - len(header) - 1) / (len(body) / len(sample)) if len(sample) else 0.0
+    return sample, rows
+
+
+def _resolve_mode(mode: str, fmt: str, size: int) -> str:
+    if mode == "auto":
+        mode = "sample" if fmt == "csv" and size > settings.PROFILE_FULL_SCAN_MAX_BYTES else "full"
+    if mode == "sample" and (fmt != "csv" or size <= 2 * settings.PROFILE_SAMPLE_RANGES * settings.PROFILE_SAMPLE_RANGE_BYTES):
+        # Columnar formats are read column chunk by column chunk anyway; small files are cheaper whole
+        mode = "full"
+    return mode
+
+
+def _key(bucket: str, path: str, version: str, mode: str) -> str:
+    return hashlib.sha256(f"{PROFILE_VERSION}:{bucket}/{path}@{version}:{mode}".encode()).hexdigest()[:32]
+
+
+class ProfileStore:
+    """
+    Computes profiles and caches them per object version: the most recent ones in memory,
+    all of them in the processed bucket under PROFILE_PREFIX.
+    """
+    def __init__(self, client, max_cached: int):
+        self.client = client
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, bucket: str, path: str, mode: str = "auto", refresh: bool = False) -> Dict[str, Any]:
+        version, size, content_type = self.client.object_info(bucket, path)
+        fmt = detect_format(path, content_type)
+        mode = _resolve_mode(mode, fmt, size)
+
+        key = _key(bucket, path, version, mode)
+        object_path = f"{settings.PROFILE_PREFIX}/{key}.json"
+        if not refresh:
+            profile = self._lookup(key)
+            if profile is not None:
+                return dict(profile, cached=True)
+
+        start = time.perf_counter()
+        if mode == "sample":
+            sample, rows = _sample_csv(bucket, path, size, version)
+            profiler = Profiler()
+            profiler.update(sample)
+            profile = profiler.result(rows=rows)
+            profile["sampled_rows"] = len(sample)
+        else:
+            profiler = Profiler()
+            for chunk in self.client.iter_dataframe_chunks(bucket, path):
+                profiler.update(chunk)
+            profile = profiler.result()
+        profile.update({
+            "bucket": bucket,
+            "path": path,
+            "version": version,
+            "format": fmt,
+            "size": size,
+            "mode": mode,
+            "exact_counts": mode == "full",
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+        print(f"Profiled {bucket}/{path} ({mode}) in {profile['elapsed_ms']} ms")
+        self.client.put_bytes(json.dumps(profile).encode(), settings.MINIO_BUCKET_PROCESSED, object_path,
+                              content_type="application/json")
+        self._remember(key, profile)
+        return dict(profile, cached=False)
+
+    def cached(self, bucket: str, path: str, version: str, size: int, fmt: str) -> Optional[Dict[str, Any]]:
+        """The stored profile of this object version, if any; never reads the object itself."""
+        for mode in dict.fromkeys(("full", _resolve_mode("auto", fmt, size))):
+            profile = self._lookup(_key(bucket, path, version, mode))
+            if profile is not None:
+                return profile
+        return None
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            profile = self._cache.get(key)
+            if profile is not None:
+                self._cache.move_to_end(key)
+                return profile
+        try:
+            buffer, _ = self.client.read_object(settings.MINIO_BUCKET_PROCESSED, f"{settings.PROFILE_PREFIX}/{key}.json")
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            return None
+        profile = json.loads(bytes(buffer))
+        self._remember(key, profile)
+        return profile
+
+    def _remember(self, key: str, profile: Dict[str, Any]):
+        with self._lock:
+            self._cache[key] = profile
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+profile_store = ProfileStore(minio_client, settings.PROFILE_CACHE_MAX_ENTRIES)
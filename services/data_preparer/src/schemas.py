@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Union, Dict, Any
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Union, Dict, Any, Literal
+from .config import settings
 
 class PipelineStep(BaseModel):
     operator: str  # e.g., "StandardScaler", "SimpleImputer"
@@ -8,13 +9,75 @@ class PipelineStep(BaseModel):
 class DataLocation(BaseModel):
     bucket: str
     path: str
+    columns: Optional[List[str]] = None # Column projection; Parquet/Arrow inputs only decode these
+
+class IncrementalOptions(BaseModel):
+    statistics: Literal["frozen", "update"] = "frozen" # Keep the state fitted by the first run, or fold new rows into the scaler/mean imputer moments and min/max
+
+class PartitionOptions(BaseModel):
+    count: int = Field(ge=1, le=settings.OUTPUT_MAX_PARTITIONS) # Number of output objects
+    by: Optional[List[str]] = Field(default=None, min_length=1) # Hash these output columns: equal keys land in the same partition; default: contiguous row ranges
 
 class PreparationRequest(BaseModel):
     input_data: DataLocation
     pipeline: List[PipelineStep]
     output_path: Optional[str] = None # Optional override
+    streaming: bool = False # Process the input in row chunks instead of loading it whole
+    chunk_size: Optional[int] = None # Rows per chunk in streaming mode
+    output_format: Optional[Literal["csv", "parquet", "arrow", "npz"]] = None # Defaults to the output_path extension, else csv; npz is a scipy CSR matrix (numeric outputs, e.g. sparse one_hot)
+    compression: Optional[str] = None # Parquet codec (snappy, zstd, gzip, ...) or Arrow IPC codec (lz4, zstd, uncompressed)
+    row_group_size: Optional[int] = None # Parquet rows per row group
+    n_jobs: Optional[int] = None # Threads for column-parallel scalers/imputers; defaults to PROCESSING_N_JOBS
+    use_cache: bool = True # Reuse the output of an identical earlier job on the same input version
+    compact_dtypes: bool = False # Downcast numbers (float32, small ints) and store text as category/pyarrow strings on load; in-memory mode only
+    incremental: Optional[IncrementalOptions] = None # Only process what was added to the input since the last run into output_path (a prefix); input path may be a prefix ending in "/"
+    partitioning: Optional[PartitionOptions] = None # Write the output as partitions plus a manifest under output_path (a prefix)
+
+    @model_validator(mode="after")
+    def check_incremental(self):
+        if self.incremental is not None:
+            if self.partitioning is not None:
+                raise ValueError("incremental and partitioning cannot be combined: each incremental run writes one partition")
+            self.streaming = True # Deltas are read chunk by chunk
+        return self
+
+class BatchPreparationRequest(BaseModel):
+    jobs: List[PreparationRequest] = Field(min_length=1) # Datasets and/or pipeline variants; jobs on the same input share its load
+
+class ApplyRequest(BaseModel):
+    rows: Optional[List[Dict[str, Any]]] = None # Small batch: transformed inline and returned in the response
+    input_data: Optional[DataLocation] = None # Larger batch: read from MinIO, result written back
+    output_path: Optional[str] = None
+    output_format: Optional[Literal["csv", "parquet", "arrow", "npz"]] = None
+
+    @model_validator(mode="after")
+    def check_input(self):
+        if (self.rows is None) == (self.input_data is None):
+            raise ValueError("Provide exactly one of rows or input_data")
+        return self
+
+class TransformRequest(BaseModel):
+    rows: List[Dict[str, Any]]
+    pipeline: Optional[List[PipelineStep]] = None # Fit and transform the rows themselves
+    pipeline_id: Optional[str] = None # A pipeline sent earlier, returned by every /transform response
+    job_id: Optional[str] = None # Transform only, with the state fitted by a completed /prepare job
+
+    @model_validator(mode="after")
+    def check_pipeline(self):
+        if sum(x is not None for x in (self.pipeline, self.pipeline_id, self.job_id)) != 1:
+            raise ValueError("Provide exactly one of pipeline, pipeline_id or job_id")
+        return self
+
+class UploadRequest(BaseModel):
+    filename: str = "data.csv" # Last part of the object key: its extension sets the format
 
 class PreparationResponse(BaseModel):
     job_id: str
     status: str
     output_location: Optional[DataLocation] = None
+    estimate: Optional[Dict[str, Any]] = None # Expected peak memory and run time of a queued job
+
+class BatchPreparationResponse(BaseModel):
+    batch_id: str
+    status: str
+    jobs: List[PreparationResponse]
@@ -0,0 +1,129 @@
+"""
+Infrastructure setup of the API and worker processes, run at startup instead of at import.
+
+Importing the service connects to nothing: the tables (and columns added to the models
+since they were created) and the buckets are created by `startup.run()`, which retries
+with exponential backoff while Postgres or MinIO are still coming up (containers started
+together, a database failover) instead of letting the process crash. The API runs it in
+a background thread, so /health/live answers at once and /health/ready only once setup
+has finished and the database answers. Workers run it before starting their processes.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from .database import engine, Base
+from .minio_client import minio_client
+from . import models  # noqa: F401  (registers the tables)
+from .config import settings
+
+
+def _create_tables():
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    _create_indexes(engine)
+
+
+def _add_missing_columns(bind):
+    """
+    create_all() only creates missing tables: columns added to the models after a table was
+    created are added here. Existing rows get the column's server default, else NULL.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    print(f"Startup: adding column {table.name}.{column.name}")
+                    for statement in _add_column(column, bind.dialect):
+                        conn.execute(text(statement))
+
+
+def _create_indexes(bind):
+    """create_all() skips the indexes of tables that already exist, e.g. those added for GET /jobs."""
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _add_column(column, dialect):
+    table, name = column.table.name, dialect.identifier_preparer.quote(column.name)
+    if dialect.name == "postgresql":
+        # IF NOT EXISTS: the API and the workers may start at the same time
+        return [f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {CreateColumn(column).compile(dialect=dialect)}"]
+    # SQLite allows constant defaults only when adding a column: an expression default is filled in afterwards
+    statements = [f"ALTER TABLE {table} ADD COLUMN {name} {column.type.compile(dialect=dialect)}"]
+    if column.server_default is not None:
+        default = column.server_default.arg
+        default = f"'{default}'" if isinstance(default, str) else default.compile(dialect=dialect)
+        statements.append(f"UPDATE {table} SET {name} = {default} WHERE {name} IS NULL")
+    return statements
+
+
+def _create_buckets():
+    minio_client.ensure_buckets()
+
+
+STEPS = [("database", _create_tables), ("object_store", _create_buckets)]
+
+
+class Startup:
+    def __init__(self):
+        self.done: Dict[str, bool] = {name: False for name, _ in STEPS}
+        self.errors: Dict[str, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        return all(self.done.values())
+
+    def run(self, max_attempts: Optional[int] = None) -> bool:
+        """
+        Runs the setup steps not done yet, each until it succeeds or `max_attempts`
+        (None: no limit) have failed. Returns whether all succeeded.
+        """
+        for name, step in STEPS:
+            attempt, delay = 0, settings.STARTUP_RETRY_INITIAL_SECONDS
+            while not self.done[name]:
+                attempt += 1
+                try:
+                    step()
+                except Exception as e:
+                    self.errors[name] = f"{type(e).__name__}: {e}"
+                    if max_attempts and attempt >= max_attempts:
+                        print(f"Startup: {name} setup failed after {attempt} attempts: {e}")
+                        return False
+                    print(f"Startup: {name} not available ({e}); retrying in {delay:.1f} s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, settings.STARTUP_RETRY_MAX_SECONDS)
+                else:
+                    self.done[name] = True
+                    self.errors.pop(name, None)
+        return True
+
+    def start(self):
+        """Runs setup in a daemon thread, once per process."""
+        with self._lock:
+            if self._thread is None and not self.complete:
+                self._thread = threading.Thread(target=self.run, daemon=True, name="startup")
+                self._thread.start()
+
+    def readiness(self) -> Dict[str, Any]:
+        """Whether the process can serve requests: setup finished and the database answers."""
+        checks = {name: "ok" if self.done[name] else self.errors.get(name, "pending") for name, _ in STEPS}
+        if self.done["database"]:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            except Exception as e:
+                checks["database"] = f"{type(e).__name__}: {e}"
+        return {"ready": all(value == "ok" for value in checks.values()), "checks": checks}
+
+
+startup = Startup()
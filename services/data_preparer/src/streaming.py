@@ -0,0 +1,667 @@
+import time
+import warnings
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+from .schemas import PipelineStep
+from .expressions import EXPRESSION_OPERATORS, transform as transform_expression
+from .metrics import operator_label, record_operator
+from .supervision import checkpoint
+from .config import settings
+
+# A zero-argument callable returning a fresh iterator over the input chunks.
+# Streaming fits need several passes over the data, so the source must be re-openable.
+ChunkSource = Callable[[], Iterator[pd.DataFrame]]
+
+SCALER_DTYPES = ['number']
+CATEGORICAL_DTYPES = ['object', 'string', 'category']
+# Operators that replace text columns with numbers
+ENCODERS = {"get_dummies", "one_hot", "hash_encoder", "frequency_encoder", "target_encoder"}
+# one_hot params understood by the sparse / top-k encoder (the others are pd.get_dummies options)
+SPARSE_DUMMIES_PARAMS = {"columns", "prefix_sep", "dtype", "sparse", "max_categories", "other_label"}
+
+
+def _handle_zeros_in_scale(scale: np.ndarray) -> np.ndarray:
+    # Same rule as sklearn: constant (or all-NaN) features are left unscaled
+    scale = scale.copy()
+    scale[~np.isfinite(scale) | (scale < 10 * np.finfo(np.float64).eps)] = 1.0
+    return scale
+
+
+def block_dtype(dtypes) -> np.dtype:
+    """Float dtype sklearn computes in for columns of these dtypes: float32 only if they all fit in it."""
+    try:
+        dtype = np.result_type(*dtypes)
+    except TypeError:  # extension dtypes
+        return np.dtype('float64')
+    return dtype if dtype == np.float32 else np.dtype('float64')
+
+
+def sorted_categories(values) -> list:
+    """Category vocabulary in the order pd.get_dummies emits the dummy columns."""
+    values = [v.item() if isinstance(v, np.generic) else v for v in values]
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=str)
+
+
+def number_columns(df: pd.DataFrame) -> List[str]:
+    """select_dtypes(include=['number']) without sparse columns, which numeric operators would densify."""
+    return [c for c in df.select_dtypes(include=['number']).columns if not isinstance(df.dtypes[c], pd.SparseDtype)]
+
+
+def sparse_dummies(params: Dict[str, Any]) -> bool:
+    """Whether one_hot runs the sparse / top-k encoder instead of pd.get_dummies."""
+    return bool(params.get("sparse") or params.get("max_categories"))
+
+
+def vocabulary(counts: pd.Series, max_categories: Optional[int] = None) -> Tuple[list, bool]:
+    """
+    Values to encode, in dummy column order, from their counts. With `max_categories` only the
+    most frequent ones are kept (ties: smallest value first). Also returns whether values were left out.
+    """
+    counts = counts[counts > 0]
+    values = sorted_categories(counts.index)
+    if not max_categories or len(values) <= max_categories:
+        return values, False
+    ranked = np.argsort(-counts.reindex(values).to_numpy(), kind="stable")[:max_categories]
+    return [values[i] for i in sorted(ranked)], True
+
+
+def indicator_frame(codes: np.ndarray, names: List[str], index: pd.Index, dtype, sparse: bool) -> pd.DataFrame:
+    """One indicator column per name; `codes` holds the column set for each row (-1: none)."""
+    dtype = np.dtype(dtype)
+    rows = np.flatnonzero(codes >= 0)
+    if sparse:
+        # Memory follows the non-zeros, not rows x columns
+        matrix = sp.csc_matrix((np.ones(len(rows), dtype=dtype), (rows, codes[rows])), shape=(len(codes), len(names)))
+        with warnings.catch_warnings():
+            # from_spmatrix declares a fill value of 0 even for bool (equal to False); converting
+            # the columns afterwards would take longer than building them
+            warnings.simplefilter("ignore", FutureWarning)
+            return pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=names)
+    values = np.zeros((len(codes), len(names)), dtype=dtype)
+    values[rows, codes[rows]] = 1
+    return pd.DataFrame(values, index=index, columns=names)
+
+
+def encode_dummies(df: pd.DataFrame, params: Dict[str, Any], state: Dict[str, Any]) -> pd.DataFrame:
+    """one_hot with sparse output and/or a top-k vocabulary whose other values share one column."""
+    unsupported = set(params) - SPARSE_DUMMIES_PARAMS
+    if unsupported:
+        raise ValueError(f"one_hot with sparse or max_categories does not support {sorted(unsupported)}")
+    sep = params.get("prefix_sep", "_")
+    columns = [c for c in state["columns"] if c in df.columns]
+    parts = []
+    for col in columns:
+        vocab = state["categories"][col]
+        names = [f"{col}{sep}{v}" for v in vocab]
+        codes = pd.Categorical(df[col], categories=vocab).codes.astype(np.int64)
+        if state.get("other", {}).get(col):
+            codes[(codes < 0) & df[col].notna().to_numpy()] = len(vocab)
+            names.append(f"{col}{sep}{params.get('other_label', 'other')}")
+        parts.append(indicator_frame(codes, names, df.index, params.get("dtype", bool), bool(params.get("sparse"))))
+    return pd.concat([df.drop(columns=columns)] + parts, axis=1)
+
+
+def encode_hashed(df: pd.DataFrame, params: Dict[str, Any], columns: List[str]) -> pd.DataFrame:
+    """Hashing trick: each value sets one of n_features indicator columns, with no vocabulary to store."""
+    n_features = int(params.get("n_features", 32))
+    sep = params.get("prefix_sep", "_")
+    columns = [c for c in columns if c in df.columns]
+    parts = []
+    for col in columns:
+        values = df[col]
+        present = values.notna().to_numpy()
+        codes = np.full(len(values), -1, dtype=np.int64)
+        # hash_array uses a fixed key: a value lands in the same column in every process
+        hashed = pd.util.hash_array(values[present].astype(str).to_numpy(dtype=object))
+        codes[present] = (hashed % np.uint64(n_features)).astype(np.int64)
+        names = [f"{col}{sep}hash{i}" for i in range(n_features)]
+        parts.append(indicator_frame(codes, names, df.index, params.get("dtype", bool), params.get("sparse", True)))
+    return pd.concat([df.drop(columns=columns)] + parts, axis=1)
+
+
+def encode_values(values: pd.Series, mapping: Dict[str, list], default: float) -> np.ndarray:
+    """Frequency/target encoding of one column: known values get their number, unseen ones `default`."""
+    codes = pd.Categorical(values, categories=mapping["values"]).codes
+    table = np.append(np.asarray(mapping["encoded"], dtype='float64'), default)
+    encoded = table[codes]  # code -1 picks the default
+    encoded[values.isna().to_numpy()] = np.nan
+    return encoded
+
+
+class _ColumnTracker:
+    """
+    Remembers which columns matched a dtype selection in any chunk.
+    A column that reads as float in one chunk (e.g. all-NaN) but as text in another
+    is treated as text, like it would be on the whole frame.
+    """
+    def __init__(self, include: List[str], reject: Optional[List[str]] = None):
+        self.include = include
+        self.reject = reject or []
+        self.columns: Dict[str, None] = {}
+        self.rejected = set()
+
+    def select(self, chunk: pd.DataFrame) -> List[str]:
+        if self.reject:
+            self.rejected.update(chunk.select_dtypes(include=self.reject).columns)
+        cols = [c for c in chunk.select_dtypes(include=self.include).columns
+                if c not in self.rejected and not isinstance(chunk.dtypes[c], pd.SparseDtype)]
+        for col in cols:
+            self.columns.setdefault(col)
+        return cols
+
+    def final(self) -> List[str]:
+        return [c for c in self.columns if c not in self.rejected]
+
+
+class _MomentsAccumulator:
+    """Per-column count, mean and sum of squared deviations, merged chunk by chunk (Chan et al.)."""
+    def __init__(self):
+        self.n = self.mean = self.m2 = None
+
+    def update(self, block: pd.DataFrame):
+        values = block.to_numpy(dtype='float64', na_value=np.nan)
+        n_b = (~np.isnan(values)).sum(axis=0).astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_b = np.where(n_b > 0, np.nansum(values, axis=0) / n_b, 0.0)
+        m2_b = np.nansum((values - mean_b) ** 2, axis=0)
+        n_b, mean_b, m2_b = (pd.Series(a, index=block.columns) for a in (n_b, mean_b, m2_b))
+
+        if self.n is None:
+            self.n, self.mean, self.m2 = n_b, mean_b, m2_b
+            return
+
+        cols = self.n.index.union(block.columns, sort=False)
+        n_a, mean_a, m2_a = (s.reindex(cols, fill_value=0.0) for s in (self.n, self.mean, self.m2))
+        n_b, mean_b, m2_b = (s.reindex(cols, fill_value=0.0) for s in (n_b, mean_b, m2_b))
+        n = n_a + n_b
+        frac = (n_b / n).fillna(0.0)
+        delta = mean_b - mean_a
+        self.n = n
+        self.mean = mean_a + delta * frac
+        self.m2 = m2_a + m2_b + delta ** 2 * n_a * frac
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.n is None:
+            return {"columns": [], "n": [], "mean": [], "m2": []}
+        return {"columns": list(self.n.index), "n": self.n.tolist(), "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_MomentsAccumulator":
+        acc = cls()
+        if data["columns"]:
+            acc.n, acc.mean, acc.m2 = (pd.Series(data[k], index=data["columns"], dtype='float64') for k in ("n", "mean", "m2"))
+        return acc
+
+    def stats(self, columns: List[str]):
+        n = self.n.reindex(columns).to_numpy()
+        mean = self.mean.reindex(columns).to_numpy()
+        m2 = self.m2.reindex(columns).to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, mean, np.nan)
+            var = np.where(n > 0, m2 / n, np.nan)
+        return mean, var
+
+
+class _MinMaxAccumulator:
+    def __init__(self):
+        self.min = self.max = None
+
+    def update(self, block: pd.DataFrame):
+        b_min, b_max = block.min(), block.max()
+        if self.min is None:
+            self.min, self.max = b_min, b_max
+        else:
+            self.min = pd.concat([self.min, b_min], axis=1).min(axis=1)
+            self.max = pd.concat([self.max, b_max], axis=1).max(axis=1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.min is None:
+            return {"columns": [], "min": [], "max": []}
+        return {"columns": list(self.min.index), "min": self.min.astype('float64').tolist(),
+                "max": self.max.astype('float64').tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_MinMaxAccumulator":
+        acc = cls()
+        if data["columns"]:
+            acc.min, acc.max = (pd.Series(data[k], index=data["columns"], dtype='float64') for k in ("min", "max"))
+        return acc
+
+
+class ReservoirAccumulator:
+    """
+    Bounded uniform sample of the non-null values of each column.
+    Medians are exact while a column has fewer non-null values than the reservoir size,
+    and approximate beyond that.
+    """
+    def __init__(self, size: int, seed: int = 0):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.samples: Dict[str, np.ndarray] = {}
+        self.seen: Dict[str, int] = {}
+
+    def update(self, block: pd.DataFrame):
+        for col in block.columns:
+            values = block[col].to_numpy(dtype='float64', na_value=np.nan)
+            values = values[~np.isnan(values)]
+            sample = self.samples.get(col, np.empty(0))
+            seen = self.seen.get(col, 0)
+
+            take = min(self.size - len(sample), len(values))
+            if take > 0:
+                sample = np.concatenate([sample, values[:take]])
+            rest = values[take:]
+            if len(rest):
+                positions = self.rng.integers(0, seen + take + np.arange(1, len(rest) + 1))
+                keep = positions < self.size
+                sample[positions[keep]] = rest[keep]
+
+            self.samples[col] = sample
+            self.seen[col] = seen + len(values)
+
+    def median(self, col: str):
+        sample = self.samples.get(col)
+        return float(np.median(sample)) if sample is not None and len(sample) else np.nan
+
+    def quantiles(self, col: str, q: List[float]) -> List[float]:
+        sample = self.samples.get(col)
+        if sample is None or not len(sample):
+            return [np.nan] * len(q)
+        return np.quantile(sample, q).tolist()
+
+
+class _ValueCountsAccumulator:
+    def __init__(self):
+        self.counts: Dict[str, pd.Series] = {}
+
+    def update(self, block: pd.DataFrame):
+        for col in block.columns:
+            counts = block[col].value_counts(dropna=True)
+            counts = counts[counts > 0]  # unused categories of a category column
+            if col in self.counts:
+                counts = self.counts[col].add(counts, fill_value=0)
+            self.counts[col] = counts
+
+    def most_frequent(self, col: str):
+        counts = self.counts.get(col)
+        if counts is None or counts.empty:
+            return np.nan
+        candidates = counts[counts == counts.max()].index
+        # SimpleImputer breaks ties by taking the smallest value
+        try:
+            return min(candidates)
+        except TypeError:
+            return candidates[0]
+
+    def vocabulary(self, col: str, max_categories: Optional[int] = None) -> Tuple[list, bool]:
+        return vocabulary(self.counts.get(col, pd.Series(dtype='float64')), max_categories)
+
+    def frequencies(self, col: str, normalize: bool = True) -> Dict[str, list]:
+        values, _ = self.vocabulary(col)
+        counts = self.counts[col].reindex(values).to_numpy(dtype='float64') if values else np.empty(0)
+        if normalize and len(counts):
+            counts = counts / counts.sum()
+        return {"values": values, "encoded": counts.tolist()}
+
+
+class _TargetAccumulator:
+    """Per-value sum and count of a numeric target column, for target encoding."""
+    def __init__(self, target: str):
+        self.target = target
+        self.sums: Dict[str, pd.Series] = {}
+        self.counts: Dict[str, pd.Series] = {}
+        self.total = 0.0
+        self.n = 0
+
+    def update(self, block: pd.DataFrame):
+        y = block[self.target].astype('float64')
+        valid = y.notna()
+        y = y[valid]
+        self.total += float(y.sum())
+        self.n += len(y)
+        for col in block.columns:
+            if col == self.target:
+                continue
+            grouped = y.groupby(block[col][valid], observed=True).agg(["sum", "count"])
+            if col in self.sums:
+                self.sums[col] = self.sums[col].add(grouped["sum"], fill_value=0)
+                self.counts[col] = self.counts[col].add(grouped["count"], fill_value=0)
+            else:
+                self.sums[col], self.counts[col] = grouped["sum"], grouped["count"]
+
+    def prior(self) -> float:
+        return self.total / self.n if self.n else float("nan")
+
+    def encoding(self, col: str, smoothing: float) -> Dict[str, list]:
+        """Smoothed per-value means: (sum + smoothing * prior) / (count + smoothing)."""
+        counts = self.counts.get(col, pd.Series(dtype='float64'))
+        values, _ = vocabulary(counts)
+        if not values:
+            return {"values": [], "encoded": []}
+        n = counts.reindex(values).to_numpy(dtype='float64')
+        sums = self.sums[col].reindex(values).to_numpy(dtype='float64')
+        return {"values": values, "encoded": ((sums + smoothing * self.prior()) / (n + smoothing)).tolist()}
+
+
+class StepFitter:
+    """Accumulates the statistics of one stateful step over all chunks."""
+    def __init__(self, op: str, params: Dict[str, Any]):
+        self.op = op
+        self.params = params
+        strategy = params.get("strategy", "most_frequent")
+
+        if op in ("standard_scaler", "minmax_scaler"):
+            self.tracker = _ColumnTracker(SCALER_DTYPES, reject=CATEGORICAL_DTYPES)
+        elif op == "imputer" and strategy in ("mean", "median") or op == "winsorize":
+            self.tracker = _ColumnTracker(['number'], reject=CATEGORICAL_DTYPES)
+        else:
+            self.tracker = _ColumnTracker(CATEGORICAL_DTYPES)
+
+        if op == "standard_scaler" or (op == "imputer" and strategy == "mean"):
+            self.accumulator = _MomentsAccumulator()
+        elif op == "minmax_scaler":
+            self.accumulator = _MinMaxAccumulator()
+        elif op == "imputer" and strategy == "median" or op == "winsorize":
+            self.accumulator = ReservoirAccumulator(settings.STREAM_MEDIAN_SAMPLE_SIZE)
+        elif op == "target_encoder":
+            if not params.get("target"):
+                raise ValueError("target_encoder needs a target column")
+            self.accumulator = _TargetAccumulator(params["target"])
+        elif op == "hash_encoder":
+            self.accumulator = None  # stateless apart from the column selection
+        else:
+            self.accumulator = _ValueCountsAccumulator()
+
+    @classmethod
+    def resume(cls, op: str, params: Dict[str, Any], running: Dict[str, Any]) -> "StepFitter":
+        """A fitter that continues from the running_stats() of an earlier fit."""
+        fitter = cls(op, params)
+        fitter.accumulator = type(fitter.accumulator).from_dict(running)
+        return fitter
+
+    def running_stats(self) -> Optional[Dict[str, Any]]:
+        """The accumulated statistics, if they can be merged with those of new rows (see _is_mergeable)."""
+        return self.accumulator.to_dict() if _is_mergeable(self.op, self.params) else None
+
+    def update(self, chunk: pd.DataFrame):
+        if (self.op in ENCODERS or self.op == "winsorize") and self.params.get("columns") is not None:
+            cols = [c for c in self.params["columns"] if c in chunk.columns]
+        else:
+            cols = self.tracker.select(chunk)
+        if self.op == "target_encoder":
+            target = self.params["target"]
+            if target not in chunk.columns:
+                raise ValueError(f"Target column {target} not found")
+            cols = [c for c in cols if c != target] + [target]
+        if cols and self.accumulator is not None:
+            self.accumulator.update(chunk[cols])
+
+    def finalize(self, columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """The fitted state; `columns` overrides the columns the step was found to apply to."""
+        if columns is not None:
+            columns = list(columns)
+        elif (self.op in ENCODERS or self.op == "winsorize") and self.params.get("columns") is not None:
+            columns = list(self.params["columns"])
+        else:
+            columns = self.tracker.final()
+        if self.op == "target_encoder":
+            columns = [c for c in columns if c != self.params["target"]]
+        acc = self.accumulator
+
+        if self.op == "standard_scaler":
+            mean, var = acc.stats(columns) if columns else (np.empty(0), np.empty(0))
+            return {
+                "columns": columns,
+                "mean": mean.tolist() if self.params.get("with_mean", True) else None,
+                "scale": _handle_zeros_in_scale(np.sqrt(var)).tolist() if self.params.get("with_std", True) else None,
+            }
+
+        if self.op == "minmax_scaler":
+            low, high = self.params.get("feature_range", (0, 1))
+            data_min = acc.min.reindex(columns).to_numpy(dtype='float64') if columns else np.empty(0)
+            data_max = acc.max.reindex(columns).to_numpy(dtype='float64') if columns else np.empty(0)
+            scale = (high - low) / _handle_zeros_in_scale(data_max - data_min)
+            return {
+                "columns": columns,
+                "scale": scale.tolist(),
+                "min": (low - data_min * scale).tolist(),
+                "clip": bool(self.params.get("clip", False)),
+                "feature_range": [low, high],
+            }
+
+        if self.op == "imputer":
+            strategy = self.params.get("strategy", "most_frequent")
+            if strategy == "mean":
+                fill = acc.stats(columns)[0].tolist() if columns else []
+            elif strategy == "median":
+                fill = [acc.median(c) for c in columns]
+            else:
+                fill = [acc.most_frequent(c) for c in columns]
+            return {"columns": columns, "strategy": strategy, "fill": dict(zip(columns, fill))}
+
+        if self.op == "hash_encoder":
+            return {"columns": columns}
+
+        if self.op == "winsorize":
+            # Quantiles of the reservoir sample: exact below STREAM_MEDIAN_SAMPLE_SIZE values per column
+            q = [self.params.get("lower", 0.01), self.params.get("upper", 0.99)]
+            return {"columns": columns, "bounds": {c: acc.quantiles(c, q) for c in columns}}
+
+        if self.op == "frequency_encoder":
+            normalize = self.params.get("normalize", True)
+            return {"columns": columns, "mapping": {c: acc.frequencies(c, normalize) for c in columns}, "default": 0.0}
+
+        if self.op == "target_encoder":
+            smoothing = float(self.params.get("smoothing", 10.0))
+            return {"columns": columns, "mapping": {c: acc.encoding(c, smoothing) for c in columns}, "default": acc.prior()}
+
+        # one_hot / get_dummies
+        vocab = {c: acc.vocabulary(c, self.params.get("max_categories")) for c in columns}
+        state = {"columns": columns, "categories": {c: vocab[c][0] for c in columns}}
+        if self.params.get("max_categories"):
+            state["other"] = {c: vocab[c][1] for c in columns}
+        return state
+
+
+class FittedStep:
+    """
+    A pipeline step together with the statistics learned for it, if any.
+    Transforming a chunk never depends on the other chunks.
+    """
+    def __init__(self, operator: str, params: Dict[str, Any], state: Optional[Dict[str, Any]] = None):
+        self.operator = operator
+        self.params = params
+        self.state = state
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        op, params, state = self.operator, self.params, self.state
+
+        if op == "fillna":
+            return df.fillna(params.get("value", 0))
+
+        elif op == "drop_na":
+            if state is not None:
+                # Fitted over columns: keep the columns that survived at fit time
+                return df[[c for c in state["columns"] if c in df.columns]]
+            return df.dropna(**params)
+
+        elif op == "imputer":
+            if state is None:  # constant_zero
+                num_cols = number_columns(df)
+                if num_cols:
+                    df[num_cols] = df[num_cols].fillna(0)
+                return df
+            fill = {c: v for c, v in state["fill"].items() if c in df.columns and not pd.isna(v)}
+            if not fill:
+                return df
+            if state["strategy"] in ("mean", "median"):
+                # SimpleImputer always hands back floats for numeric columns.
+                # One block assignment instead of a per-column fillna
+                cols = list(fill)
+                block = df[cols].to_numpy(dtype=block_dtype(df.dtypes[cols]), na_value=np.nan)
+                rows, positions = np.nonzero(np.isnan(block))
+                block[rows, positions] = np.asarray(list(fill.values()), dtype=block.dtype)[positions]
+                df[cols] = block
+                return df
+            # Category columns accept the fill value: it was their most frequent category at fit time
+            for col, value in fill.items():
+                if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+                    df[col] = df[col].cat.add_categories([value])
+            return df.fillna(fill)
+
+        elif op == "standard_scaler":
+            cols = state["columns"]
+            if cols:
+                block = df[cols].to_numpy(dtype=block_dtype(df.dtypes[cols]), na_value=np.nan)
+                if state["mean"] is not None:
+                    block -= np.asarray(state["mean"])
+                if state["scale"] is not None:
+                    block /= np.asarray(state["scale"])
+                df[cols] = block
+            return df
+
+        elif op == "minmax_scaler":
+            cols = state["columns"]
+            if cols:
+                block = df[cols].to_numpy(dtype=block_dtype(df.dtypes[cols]), na_value=np.nan)
+                block *= np.asarray(state["scale"])
+                block += np.asarray(state["min"])
+                if state["clip"]:
+                    np.clip(block, *state["feature_range"], out=block)
+                df[cols] = block
+            return df
+
+        elif op == "hash_encoder":
+            return encode_hashed(df, params, state["columns"] if state else params["columns"])
+
+        elif op in ("frequency_encoder", "target_encoder"):
+            for col in state["columns"]:
+                if col in df.columns:
+                    df[col] = encode_values(df[col], state["mapping"][col], state["default"])
+            return df
+
+        elif op == "get_dummies" or op == "one_hot":
+            if sparse_dummies(params):
+                return encode_dummies(df, params, state)
+            cols = [c for c in state["columns"] if c in df.columns]
+            for col in cols:
+                df[col] = pd.Categorical(df[col], categories=state["categories"][col])
+            extra = {k: v for k, v in params.items() if k != "columns"}
+            return pd.get_dummies(df, columns=cols, **extra)
+
+        elif op in EXPRESSION_OPERATORS:
+            return transform_expression(df, op, params, state)
+
+        return df
+
+
+def _is_stateful(op: str, params: Dict[str, Any]) -> bool:
+    if op in ("standard_scaler", "minmax_scaler", "get_dummies", "one_hot", "frequency_encoder", "target_encoder"):
+        return True
+    if op == "hash_encoder":
+        return params.get("columns") is None
+    if op == "winsorize":
+        return True
+    if op == "imputer":
+        return params.get("strategy", "most_frequent") in ("mean", "median", "most_frequent")
+    return False
+
+
+def _is_mergeable(op: str, params: Dict[str, Any]) -> bool:
+    """Steps whose statistics (moments, min/max) can absorb new rows without a pass over the old ones."""
+    return op in ("standard_scaler", "minmax_scaler") or (op == "imputer" and params.get("strategy") == "mean")
+
+
+class StreamingProcessor:
+    """
+    Chunked counterpart of DataProcessor for inputs that do not fit in memory.
+
+    Each stateful step gets one pass over the source to fit its statistics on the
+    output of the steps before it; a final pass then transforms chunk by chunk.
+    Peak memory is bounded by the chunk size, not by the dataset size.
+    """
+    KNOWN_OPERATORS = {"fillna", "imputer", "drop_na", "standard_scaler", "minmax_scaler"} | ENCODERS | EXPRESSION_OPERATORS
+
+    def fit(self, source: ChunkSource, steps: List[PipelineStep],
+            progress: Optional[Callable[[float], None]] = None,
+            running: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[FittedStep]:
+        """
+        Fits every step on the output of the steps before it. `progress` is called with the
+        fraction of all passes (fit passes plus the final transform pass) done so far.
+        `running`, if given, receives the mergeable statistics of each step (None for the
+        steps without), for refit().
+        """
+        passes = sum(_is_stateful(s.operator.lower(), s.params or {}) for s in steps) + 1
+        done = 0
+        fitted: List[FittedStep] = []
+        for step in steps:
+            op = step.operator.lower()
+            params = step.params or {}
+
+            if op not in self.KNOWN_OPERATORS:
+                raise ValueError(f"Unknown operator {op}")
+            if op == "drop_na" and params.get("axis", 0) in (1, "columns"):
+                raise ValueError("drop_na over columns needs the whole dataset and is not supported in streaming mode")
+
+            state = None
+            if _is_stateful(op, params):
+                fitter = StepFitter(op, params)
+                for chunk in source():
+                    fitter.update(self._transform_chunk(chunk, fitted))
+                state = fitter.finalize()
+                done += 1
+                if progress:
+                    progress(done / passes)
+                if running is not None:
+                    running.append(fitter.running_stats())
+            elif running is not None:
+                running.append(None)
+            fitted.append(FittedStep(op, params, state))
+        return fitted
+
+    def refit(self, source: ChunkSource, fitted: List[FittedStep], running: List[Optional[Dict[str, Any]]],
+              progress: Optional[Callable[[float], None]] = None) -> List[FittedStep]:
+        """
+        Folds the rows of `source` into the mergeable statistics of an earlier fit and refits
+        those steps, one pass each; `running` is updated in place. The other steps keep their
+        state, and every step keeps its columns, so the output schema does not change.
+        A step after another refitted one keeps statistics of rows transformed with the
+        earlier state of that step: exact for the first such step, close for the others.
+        """
+        refitted = list(fitted)
+        indices = [i for i, stats in enumerate(running) if stats is not None]
+        for done, index in enumerate(indices, 1):
+            step = fitted[index]
+            fitter = StepFitter.resume(step.operator, step.params, running[index])
+            for chunk in source():
+                fitter.update(self._transform_chunk(chunk, refitted[:index]))
+            refitted[index] = FittedStep(step.operator, step.params, fitter.finalize(step.state["columns"]))
+            running[index] = fitter.running_stats()
+            if progress:
+                progress(done / (len(indices) + 1))
+        return refitted
+
+    def transform(self, chunks: Iterator[pd.DataFrame], fitted: List[FittedStep], offset: int = 0) -> Iterator[pd.DataFrame]:
+        """Transforms chunk by chunk; `offset` is the index of the first of `fitted` in the whole pipeline."""
+        for chunk in chunks:
+            yield self._transform_chunk(chunk, fitted, record=True, offset=offset)
+
+    def _transform_chunk(self, chunk: pd.DataFrame, fitted: List[FittedStep], record: bool = False,
+                         offset: int = 0) -> pd.DataFrame:
+        # Every pass over the input goes through here: a running job can stop between chunks
+        checkpoint()
+        for index, step in enumerate(fitted):
+            start, rows = time.perf_counter(), len(chunk)
+            chunk = step.transform(chunk)
+            if record:
+                # The transform pass only: fit passes replay the earlier steps once per stateful step
+                record_operator([offset + index], operator_label(step.operator, step.params), time.perf_counter() - start,
+                                rows, len(chunk))
+        return chunk
+
+streaming_processor = StreamingProcessor()
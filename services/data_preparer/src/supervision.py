@@ -0,0 +1,240 @@
+"""
+Memory and time limits of running jobs, and their cancellation.
+
+With JOB_ISOLATION every job (or group of batch jobs) runs in a child process of its
+worker, started with the spawn method so it inherits no database connections. The child
+caps its address space at JOB_MEMORY_LIMIT_MB plus JOB_ADDRESS_SPACE_HEADROOM_MB: a job
+allocating past it gets a MemoryError and ends as OOM instead of taking memory from the
+other jobs on the node, and a child killed by the kernel's OOM killer ends as OOM too.
+
+Jobs stop cooperatively at checkpoint(), called between the steps of a pipeline, between
+chunks and between the jobs of a group: once /cancel was called for them (CANCELLED) or
+once they ran for JOB_TIME_LIMIT_SECONDS (TIMEOUT). A child that has not stopped
+JOB_CANCEL_GRACE_SECONDS later, stuck in one long step, is killed by its worker.
+
+Without isolation jobs run in the worker process: cancellation and the time limit still
+apply at the checkpoints, the memory limit does not.
+"""
+import contextlib
+import multiprocessing
+import resource
+import signal
+import time
+import traceback
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .metrics import JobMetrics, collecting
+from .config import settings
+
+JobResults = Dict[str, Union[Dict[str, Any], Exception]]
+
+
+class JobInterrupted(Exception):
+    """Ends a job in a terminal status of its own instead of FAILED. Never retried."""
+    status = "FAILED"
+
+
+class JobCancelled(JobInterrupted):
+    status = "CANCELLED"
+
+
+class JobTimeout(JobInterrupted):
+    status = "TIMEOUT"
+
+
+class JobOutOfMemory(JobInterrupted):
+    status = "OOM"
+
+
+class JobProcessError(Exception):
+    """An error raised in a job process, relayed to its worker."""
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+_INTERRUPTIONS = {cls.status: cls for cls in (JobCancelled, JobTimeout, JobOutOfMemory)}
+
+
+def terminal_status(error: Exception) -> str:
+    """The status a job ends in when `error` stops it for good."""
+    if isinstance(error, JobInterrupted):
+        return error.status
+    if isinstance(error, MemoryError):  # pyarrow's ArrowMemoryError included
+        return "OOM"
+    return "FAILED"
+
+
+class JobControl:
+    def __init__(self, cancel=None, time_limit: Optional[float] = None):
+        self.cancel = cancel  # threading or multiprocessing Event, set by the worker
+        self.time_limit = time_limit
+        self.deadline = time.monotonic() + time_limit if time_limit else None
+
+    def check(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise JobCancelled("Job was cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise JobTimeout(f"Job exceeded its time limit of {self.time_limit:.0f} s")
+
+
+_current: ContextVar[Optional[JobControl]] = ContextVar("job_control", default=None)
+
+
+def checkpoint():
+    """Raises JobCancelled or JobTimeout if the job running in this context has to stop."""
+    control = _current.get()
+    if control is not None:
+        control.check()
+
+
+@contextlib.contextmanager
+def controlling(control: JobControl):
+    token = _current.set(control)
+    try:
+        yield control
+    finally:
+        _current.reset(token)
+
+
+def time_limit(job_count: int) -> Optional[float]:
+    """Time limit of a run of `job_count` jobs: a group gets the sum of the limits of its jobs."""
+    return settings.JOB_TIME_LIMIT_SECONDS and settings.JOB_TIME_LIMIT_SECONDS * job_count
+
+
+def run_jobs(runner: Callable, jobs: List[Tuple[str, Any]], grouped: bool, progress: Callable[[str, float], None],
+             control: JobControl) -> Tuple[JobResults, Dict[str, Any]]:
+    """
+    Runs one job, runner(job_id, request, progress), or a group of jobs, runner(jobs, progress),
+    under `control`. Returns per job id its result or the exception that failed it, and the
+    metrics summary of the run.
+    """
+    metrics = JobMetrics()
+    with collecting(metrics), controlling(control):
+        try:
+            if grouped:
+                results = runner(jobs, progress=progress)
+            else:
+                job_id, request = jobs[0]
+                results = {job_id: runner(job_id, request, progress=lambda fraction: progress(job_id, fraction))}
+        except Exception as e:
+            if not isinstance(e, JobInterrupted):
+                traceback.print_exc()
+            results = {job_id: e for job_id, _ in jobs}
+    return results, metrics.summary()
+
+
+def _memory_limit() -> Optional[int]:
+    if not settings.JOB_MEMORY_LIMIT_MB:
+        return None
+    return (settings.JOB_MEMORY_LIMIT_MB + settings.JOB_ADDRESS_SPACE_HEADROOM_MB) * 2 ** 20
+
+
+def _job_process(conn, cancel):
+    # Loaded before a job arrives, while the worker is still idle
+    from .jobs import is_retryable
+    import sklearn.impute, sklearn.preprocessing  # noqa: F401,E401
+
+    # The worker decides when its job stops (Ctrl-C reaches the whole process group)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    limit = _memory_limit()
+    if limit:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    task = conn.recv()
+    if task is None:
+        return
+    runner, jobs, grouped, seconds = task
+    results, summary = run_jobs(runner, jobs, grouped, lambda job_id, fraction: conn.send(("progress", job_id, fraction)),
+                                JobControl(cancel, seconds))
+    encoded = {}
+    for job_id, result in results.items():
+        if isinstance(result, Exception):
+            # Exceptions of other libraries do not always survive pickling: sent as their outcome
+            result = ("error", str(result), terminal_status(result), is_retryable(result))
+        encoded[job_id] = result
+    conn.send(("done", encoded, summary))
+
+
+def _decode(result) -> Union[Dict[str, Any], Exception]:
+    if not isinstance(result, tuple):
+        return result
+    _, message, status, retryable = result
+    if status in _INTERRUPTIONS:
+        return _INTERRUPTIONS[status](message)
+    return JobProcessError(message, retryable)
+
+
+class JobProcess:
+    """A child process that runs one job, or one group of jobs, and exits."""
+    def __init__(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.cancel = ctx.Event()
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_job_process, args=(child_conn, self.cancel), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def run(self, runner: Callable, jobs: List[Tuple[str, Any]], grouped: bool,
+            progress: Callable[[str, float], None]) -> Tuple[JobResults, Optional[Dict[str, Any]]]:
+        """
+        Runs the jobs in the child, see run_jobs(). Stops the child once its cancel event is
+        set or its time limit has passed, and kills it if it has not stopped
+        JOB_CANCEL_GRACE_SECONDS later. A killed child leaves no metrics summary.
+        """
+        seconds = time_limit(len(jobs))
+        start = time.monotonic()
+        self._conn.send((runner, jobs, grouped, seconds))
+        # The child counts its time limit from when it gets the task; the grace period covers its startup
+        timeout_at = start + seconds + settings.JOB_CANCEL_GRACE_SECONDS if seconds else None
+        cancel_at = None
+        while True:
+            now = time.monotonic()
+            if cancel_at is None and self.cancel.is_set():
+                cancel_at = now + settings.JOB_CANCEL_GRACE_SECONDS
+            if cancel_at is not None and now > cancel_at:
+                self.kill()
+                return {job_id: JobCancelled("Job was cancelled") for job_id, _ in jobs}, None
+            if timeout_at is not None and now > timeout_at:
+                self.kill()
+                return {job_id: JobTimeout(f"Job exceeded its time limit of {seconds:.0f} s") for job_id, _ in jobs}, None
+
+            if self._conn.poll(0.1):
+                try:
+                    message = self._conn.recv()
+                except EOFError:
+                    return self._exited(jobs), None
+                if message[0] == "progress":
+                    progress(message[1], message[2])
+                else:
+                    self.process.join()
+                    return {job_id: _decode(result) for job_id, result in message[1].items()}, message[2]
+            elif not self.process.is_alive():
+                return self._exited(jobs), None
+
+    def _exited(self, jobs: List[Tuple[str, Any]]) -> JobResults:
+        self.process.join()
+        code = self.process.exitcode
+        if code == -signal.SIGKILL:
+            error = JobOutOfMemory("Job process was killed, most likely by the out-of-memory killer")
+        else:
+            error = JobProcessError(f"Job process exited with code {code}", retryable=True)
+        return {job_id: error for job_id, _ in jobs}
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+
+    def close(self):
+        """Stops an unused child."""
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
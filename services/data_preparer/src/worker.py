@@ -0,0 +1,254 @@
+"""
+Worker pool for preparation jobs.
+
+    python -m src.worker
+
+Starts WORKER_CONCURRENCY processes on this node. Each one claims PENDING jobs from
+the prepared_datasets table, heartbeats while it works and retries failures with
+backoff. Any number of nodes can run a pool against the same database. Jobs run in
+child processes of the worker under the job memory and time limits, and stop when
+cancelled (see supervision.py).
+"""
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Callable, List, Optional, Set
+
+from .jobs import run_preparation, run_preparation_group, is_retryable
+from .job_queue import ClaimedJob
+from .supervision import JobCancelled, JobControl, JobProcess, run_jobs, terminal_status, time_limit
+from .config import settings
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Heartbeats the running jobs, and checks every JOB_CANCEL_POLL_INTERVAL seconds whether
+    they were cancelled; `on_cancel` gets the newly cancelled job ids.
+    """
+    def __init__(self, queue, job_ids: List[str], worker_id: str, on_cancel: Optional[Callable[[Set[str]], None]] = None):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_ids = job_ids
+        self.worker_id = worker_id
+        self.on_cancel = on_cancel
+        self.cancelled: Set[str] = set()
+        self.stopped = threading.Event()
+
+    def run(self):
+        last_beat = last_poll = time.monotonic()
+        interval = min(settings.WORKER_HEARTBEAT_INTERVAL, settings.JOB_CANCEL_POLL_INTERVAL)
+        while not self.stopped.wait(interval):
+            now = time.monotonic()
+            if now - last_beat >= settings.WORKER_HEARTBEAT_INTERVAL:
+                last_beat = now
+                for job_id in self.job_ids:
+                    try:
+                        self.queue.heartbeat(job_id, self.worker_id)
+                    except Exception as e:
+                        print(f"Heartbeat for job {job_id} failed: {e}")
+            if self.on_cancel is not None and now - last_poll >= settings.JOB_CANCEL_POLL_INTERVAL:
+                last_poll = now
+                try:
+                    cancelled = self.queue.cancel_requested([j for j in self.job_ids if j not in self.cancelled])
+                except Exception as e:
+                    print(f"Cancellation check failed: {e}")
+                    continue
+                if cancelled:
+                    self.cancelled |= cancelled
+                    self.on_cancel(cancelled)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class _ProgressReporter:
+    """Forwards the runner's progress to the queue, at most every PROGRESS_MIN_INTERVAL seconds."""
+    def __init__(self, queue, job_id: str, worker_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._last = 0.0
+
+    def __call__(self, fraction: float):
+        now = time.monotonic()
+        if now - self._last < settings.PROGRESS_MIN_INTERVAL:
+            return
+        self._last = now
+        try:
+            self.queue.progress(self.job_id, self.worker_id, round(min(max(fraction, 0.0), 1.0), 4))
+        except Exception as e:
+            print(f"Progress report for job {self.job_id} failed: {e}")
+
+
+class Worker:
+    def __init__(self, queue, worker_id: Optional[str] = None, runner: Callable = run_preparation,
+                 group_runner: Callable = run_preparation_group, isolate: Optional[bool] = None):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.runner = runner
+        self.group_runner = group_runner
+        # Runners are sent to the job process by reference: module-level functions only
+        self.isolate = settings.JOB_ISOLATION if isolate is None else isolate
+        self._spare: Optional[JobProcess] = None
+        self._last_reclaim = 0.0
+
+    def run_once(self) -> bool:
+        """Claims and runs at most one job. Returns whether a job was run."""
+        if time.monotonic() - self._last_reclaim > settings.WORKER_STALL_TIMEOUT / 2:
+            self._last_reclaim = time.monotonic()
+            self.queue.reclaim_stalled()
+
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return False
+        self._execute(job)
+        return True
+
+    def run_forever(self, stop: Optional[threading.Event] = None):
+        stop = stop or threading.Event()
+        print(f"Worker {self.worker_id} started")
+        while not stop.is_set():
+            try:
+                # The next job's process starts and imports while this worker waits for a job
+                self._prestart()
+                if not self.run_once():
+                    stop.wait(settings.WORKER_POLL_INTERVAL)
+            except Exception as e:
+                # Database or network hiccup while polling: back off and keep going
+                print(f"Worker {self.worker_id} poll failed: {e}")
+                stop.wait(settings.WORKER_POLL_INTERVAL)
+        self.close()
+
+    def close(self):
+        if self._spare is not None:
+            self._spare.close()
+            self._spare = None
+
+    def _prestart(self):
+        if self.isolate and settings.JOB_PROCESS_PRESTART and self._spare is None:
+            self._spare = JobProcess()
+
+    def _job_process(self) -> JobProcess:
+        process, self._spare = self._spare, None
+        if process is None or not process.alive():
+            process = JobProcess()
+        return process
+
+    def _execute(self, job: ClaimedJob):
+        jobs = [job]
+        if job.batch_id and not job.request.streaming and settings.BATCH_GROUP_MAX_JOBS > 1:
+            # Batch jobs on the same input run together: one load, shared pipeline prefixes
+            jobs += self.queue.claim_siblings(job, self.worker_id, settings.BATCH_GROUP_MAX_JOBS - 1)
+        grouped = len(jobs) > 1
+        if grouped:
+            print(f"Worker {self.worker_id} running {len(jobs)} jobs of batch {job.batch_id} together")
+        else:
+            print(f"Worker {self.worker_id} running job {job.job_id} (attempt {job.attempts})")
+
+        process = self._job_process() if self.isolate else None
+        cancel = process.cancel if process else threading.Event()
+        by_id = {j.job_id: j for j in jobs}
+        aborted = set()
+
+        def on_cancel(cancelled: Set[str]):
+            if heartbeat.cancelled >= set(by_id):
+                # Nothing left to run: the job (or group) stops at its next checkpoint
+                cancel.set()
+                return
+            # The rest of the group keeps running; these jobs end now and their outputs are dropped
+            for job_id in cancelled:
+                aborted.add(job_id)
+                self._fail(by_id[job_id], JobCancelled("Job was cancelled"))
+
+        heartbeat = _Heartbeat(self.queue, list(by_id), self.worker_id, on_cancel)
+        heartbeat.start()
+        reporters = {j.job_id: _ProgressReporter(self.queue, j.job_id, self.worker_id) for j in jobs}
+        progress = lambda job_id, fraction: reporters[job_id](fraction)
+        runner = self.group_runner if grouped else self.runner
+        pairs = [(j.job_id, j.request) for j in jobs]
+        try:
+            if process is not None:
+                results, summary = process.run(runner, pairs, grouped, progress)
+            else:
+                results, summary = run_jobs(runner, pairs, grouped, progress, JobControl(cancel, time_limit(len(jobs))))
+        finally:
+            heartbeat.stop()
+        if grouped and summary:
+            # The input load and the shared pipeline prefixes cannot be split between jobs:
+            # every job of the group gets the totals of the whole group
+            summary = dict(summary, group_size=len(jobs))
+
+        for job in jobs:
+            if job.job_id in aborted:
+                continue
+            result = results.get(job.job_id)
+            if result is None:
+                result = RuntimeError(f"No result for job {job.job_id}")
+            if isinstance(result, Exception):
+                self._fail(job, result, summary)
+            else:
+                self._complete(job, result, summary)
+
+    def _fail(self, job: ClaimedJob, error: Exception, metrics: Optional[dict] = None):
+        status = self.queue.fail(job, self.worker_id, str(error), retryable=is_retryable(error), metrics=metrics,
+                                 status=terminal_status(error))
+        print(f"Job {job.job_id} failed: {error} -> {status}")
+
+    def _complete(self, job: ClaimedJob, result: dict, metrics: Optional[dict] = None):
+        if metrics:
+            stages = ", ".join(f"{s['name']} {s['seconds']:.2f} s" for s in metrics["stages"])
+            print(f"Job {job.job_id} took {metrics['duration_seconds']:.2f} s ({stages})")
+        if self.queue.complete(job, self.worker_id, metrics=metrics, **result):
+            print(f"Job {job.job_id} completed successfully.")
+        else:
+            print(f"Job {job.job_id} was reclaimed by another worker; result discarded.")
+
+
+def _worker_process(index: int):
+    from .database import SessionLocal
+    from .job_queue import SqlJobQueue
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    worker = Worker(SqlJobQueue(SessionLocal), worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}")
+    worker.run_forever(stop)
+
+
+def main(concurrency: Optional[int] = None):
+    from .startup import startup
+
+    # Waits for Postgres and MinIO instead of crashing while they start
+    if not startup.run(settings.STARTUP_MAX_ATTEMPTS):
+        sys.exit(1)
+    concurrency = concurrency or settings.WORKER_CONCURRENCY
+    # spawn: children start clean instead of inheriting DB connections and BLAS threads
+    ctx = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    processes = {}
+    while not stopping.is_set():
+        for index in range(concurrency):
+            proc = processes.get(index)
+            if proc is None or not proc.is_alive():
+                if proc is not None:
+                    print(f"Worker process {index} exited with {proc.exitcode}; restarting")
+                proc = ctx.Process(target=_worker_process, args=(index,), daemon=False)
+                proc.start()
+                processes[index] = proc
+        stopping.wait(1.0)
+
+    for proc in processes.values():
+        proc.terminate()
+    for proc in processes.values():
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()
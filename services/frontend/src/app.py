@@ -1,27 +1,80 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import requests
 import time
-from minio import Minio
-import io
+import json
 import os
 
 # Configuration
 API_URL = os.getenv("API_URL", "http://data_preparer:8000")
-MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "minio:9000")
-MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
-MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
-MINIO_BUCKET_RAW = "raw-data"
-MINIO_BUCKET_PROCESSED = "processed-data"
-
-# Setup MinIO Client
-def get_minio_client():
-    return Minio(
-        MINIO_ENDPOINT.replace("http://", ""),
-        access_key=MINIO_ACCESS_KEY,
-        secret_key=MINIO_SECRET_KEY,
-        secure=False
-    )
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "600"))
+FINAL_STATUSES = {"COMPLETED", "FAILED", "TIMEOUT", "OOM", "CANCELLED"}
+
+# The browser PUTs the file to a presigned URL: it never passes through this server
+UPLOAD_WIDGET = """
+<div style="font-family: sans-serif; font-size: 14px">
+  <input type="file" id="file" accept=".csv,text/csv">
+  <button id="send">Upload</button>
+  <progress id="bar" value="0" max="1" style="width: 100%; margin-top: 8px"></progress>
+  <div id="msg"></div>
+</div>
+<script>
+  const url = __URL__;
+  const bar = document.getElementById("bar"), msg = document.getElementById("msg");
+  document.getElementById("send").onclick = () => {
+    const file = document.getElementById("file").files[0];
+    if (!file) { msg.textContent = "Choose a CSV file first."; return; }
+    const xhr = new XMLHttpRequest();
+    xhr.open("PUT", url);
+    xhr.setRequestHeader("Content-Type", "text/csv");
+    xhr.upload.onprogress = (e) => { if (e.lengthComputable) bar.value = e.loaded / e.total; };
+    xhr.onload = () => {
+      msg.textContent = xhr.status < 300 ? `Uploaded ${file.name}: continue below.` : `Upload failed (HTTP ${xhr.status}).`;
+    };
+    xhr.onerror = () => { msg.textContent = "Upload failed: the storage server is not reachable."; };
+    msg.textContent = `Uploading ${file.name}...`;
+    xhr.send(file);
+  };
+</script>
+"""
+
+def new_upload():
+    """Object location and presigned PUT URL for the next file."""
+    response = requests.post(f"{API_URL}/uploads", json={"filename": "data.csv"}, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+def wait_for_job(job_id, on_update, timeout=JOB_TIMEOUT_SECONDS):
+    """
+    Follows the job's Server-Sent Events stream until it finishes; falls back to
+    long-polling /status if the stream is unavailable. Returns the last known state.
+    """
+    deadline = time.time() + timeout
+    job = None
+    try:
+        with requests.get(f"{API_URL}/events/{job_id}", stream=True, timeout=(5, 60)) as res:
+            res.raise_for_status()
+            for line in res.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    job = json.loads(line[len("data:"):])
+                    on_update(job)
+                    if job["status"] in FINAL_STATUSES:
+                        return job
+                if time.time() > deadline:
+                    return job
+    except requests.RequestException:
+        pass
+
+    while time.time() < deadline:
+        params = {"wait": 30}
+        if job:
+            params["since"] = job["status"]
+        job = requests.get(f"{API_URL}/status/{job_id}", params=params, timeout=40).json()
+        on_update(job)
+        if job["status"] in FINAL_STATUSES:
+            break
+    return job
 
 st.set_page_config(page_title="AutoML Data Preparer", layout="wide", page_icon="✨")
 
@@ -48,21 +101,53 @@ st.markdown("Simply upload your raw data, choose your cleaning options, and get
 
 # --- STEP 1: UPLOAD ---
 st.header("1. Upload Data")
-uploaded_file = st.file_uploader("Drop your CSV file here", type="csv")
+if "upload" not in st.session_state:
+    try:
+        st.session_state["upload"] = new_upload()
+    except Exception as e:
+        st.error(f"Cannot start an upload: {e}")
+        st.stop()
+upload = st.session_state["upload"]
+
+if not st.session_state.get("uploaded"):
+    components.html(UPLOAD_WIDGET.replace("__URL__", json.dumps(upload["url"])), height=110)
+    if st.button("Continue with the uploaded file"):
+        check = requests.get(f"{API_URL}/preview", params={"bucket": upload["bucket"], "path": upload["path"], "limit": 1}, timeout=30)
+        if check.status_code == 404:
+            st.warning("No file has been uploaded yet.")
+        else:
+            st.session_state["uploaded"] = True
+            st.rerun()
+elif st.button("Upload another file"):
+    for key in ("upload", "uploaded"):
+        st.session_state.pop(key, None)
+    st.rerun()
+
+if st.session_state.get("uploaded"):
+    file_name = upload["path"]
+
+    # Profiled by the server: only the statistics and a few rows reach this app
+    try:
+        response = requests.get(f"{API_URL}/profile", params={"bucket": upload["bucket"], "path": file_name}, timeout=120)
+        response.raise_for_status()
+        profile = response.json()
+    except Exception as e:
+        st.error(f"Profiling failed: {e}")
+        st.stop()
+    preview_df = pd.DataFrame(profile["preview"])
 
-if uploaded_file is not None:
-    # Read locally for preview
-    original_df = pd.read_csv(uploaded_file)
-    uploaded_file.seek(0) # Reset pointer
-    
     # Show stats
+    approx = "" if profile["exact_counts"] else " (est.)"
     col1, col2, col3 = st.columns(3)
-    col1.metric("Rows", original_df.shape[0])
-    col2.metric("Columns", original_df.shape[1])
-    col3.metric("Missing Values", original_df.isna().sum().sum())
+    col1.metric("Rows" + approx, profile["rows"])
+    col2.metric("Columns", len(profile["columns"]))
+    col3.metric("Missing Values" + approx, profile["missing_values"])
 
     with st.expander("👀 View Raw Data", expanded=True):
-        st.dataframe(original_df.head(10), use_container_width=True)
+        st.dataframe(preview_df, use_container_width=True)
+
+    with st.expander("📊 Column Statistics"):
+        st.dataframe(pd.DataFrame(profile["columns"]).drop(columns=["quantiles"]), use_container_width=True)
 
     # --- STEP 2: CONFIGURE ---
     st.header("2. Configuration")
@@ -114,28 +199,11 @@ if uploaded_file is not None:
     st.header("3. Process")
     
     if st.button("🚀 Launch Data Cleaning Pipeline", type="primary"):
-        client = get_minio_client()
-        file_name = uploaded_file.name
-        
-        # 1. Upload
         with st.status("Processing data...", expanded=True) as status:
-            status.write("Uploading to storage...")
-            try:
-                if not client.bucket_exists(MINIO_BUCKET_RAW):
-                    client.make_bucket(MINIO_BUCKET_RAW)
-                client.put_object(
-                    MINIO_BUCKET_RAW, file_name, uploaded_file, uploaded_file.size, content_type="application/csv"
-                )
-                status.write("✅ Upload complete.")
-            except Exception as e:
-                status.update(label="Upload failed!", state="error")
-                st.error(f"Error: {e}")
-                st.stop()
-            
-            # 2. Call API
+            # 1. Call API (the file was uploaded when it was chosen)
             status.write("Triggering processing job...")
             payload = {
-                "input_data": {"bucket": MINIO_BUCKET_RAW, "path": file_name},
+                "input_data": {"bucket": upload["bucket"], "path": file_name},
                 "pipeline": pipeline_steps
             }
             
@@ -149,22 +217,40 @@ if uploaded_file is not None:
                 st.error(f"Error: {e}")
                 st.stop()
                 
-            # 3. Poll
+            # 2. Wait (pushed by the server, no polling)
             status.write("Waiting for results...")
-            result_df = None
-            for _ in range(40):
-                time.sleep(1)
-                res = requests.get(f"{API_URL}/status/{job_id}")
-                if res.status_code == 200 and res.json()["status"] == "COMPLETED":
-                    out_data = res.json()
-                    obj = client.get_object(out_data["output_bucket"], out_data["output_path"])
-                    result_df = pd.read_csv(io.BytesIO(obj.read()))
-                    status.update(label="Processing Complete!", state="complete", expanded=False)
-                    break
-                elif res.json()["status"] == "FAILED":
-                    status.update(label="Processing Failed!", state="error")
-                    st.error(res.json().get("error"))
+            progress_bar = st.progress(0.0, text="Queued")
+
+            def show_progress(job):
+                progress_bar.progress(float(job.get("progress") or 0.0), text=job["status"].capitalize())
+
+            result_df = download = None
+            out_data = wait_for_job(job_id, show_progress)
+            if out_data and out_data["status"] == "COMPLETED":
+                # A few rows read by the server, and a link the browser downloads the output from
+                try:
+                    preview = requests.get(f"{API_URL}/preview", params={
+                        "bucket": out_data["output_bucket"], "path": out_data["output_path"], "limit": 5
+                    }, timeout=60)
+                    preview.raise_for_status()
+                    result_df = pd.DataFrame(preview.json()["rows"], columns=preview.json()["columns"])
+                    download = requests.get(f"{API_URL}/download/{job_id}", timeout=10)
+                    download.raise_for_status()
+                except Exception as e:
+                    status.update(label="Cannot read the result!", state="error")
+                    st.error(f"Error: {e}")
                     st.stop()
+                status.update(label="Processing Complete!", state="complete", expanded=False)
+            elif out_data and out_data["status"] in FINAL_STATUSES:
+                # FAILED, or stopped at the job limits (TIMEOUT, OOM) or by /cancel
+                label = "Processing Failed!" if out_data["status"] == "FAILED" else f"Processing stopped: {out_data['status']}"
+                status.update(label=label, state="error")
+                st.error(out_data.get("error"))
+                st.stop()
+            else:
+                status.update(label="Still processing, check back later", state="error")
+                st.warning(f"Job {job_id} did not finish within {JOB_TIMEOUT_SECONDS} s.")
+                st.stop()
             
             if result_df is not None:
                 st.success("✨ Data processed successfully!")
@@ -175,17 +261,15 @@ if uploaded_file is not None:
                 
                 with col_orig:
                     st.markdown("**Original Data (First 5 rows)**")
-                    st.dataframe(original_df.head(), use_container_width=True)
+                    st.dataframe(preview_df.head(), use_container_width=True)
                     
                 with col_proc:
                     st.markdown("**Processed Data (First 5 rows)**")
-                    st.dataframe(result_df.head(), use_container_width=True)
+                    st.dataframe(result_df, use_container_width=True)
                 
-                st.download_button(
+                st.link_button(
                     label="⬇️ Download Cleaned CSV",
-                    data=result_df.to_csv(index=False),
-                    file_name=f"processed_{file_name}",
-                    mime="text/csv",
+                    url=download.json()["url"],
                     type="primary"
                 )
 
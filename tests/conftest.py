@@ -0,0 +1,32 @@
+"""
+Offline setup for the data_preparer tests: the in-process S3 stand-in of the benchmarks
+replaces MinIO and a SQLite file replaces Postgres. Both are set in the environment before
+any service module is imported, since src.config reads it at import. Jobs run in the
+test process unless a test asks for isolation. (test_data_preparer.py still needs the
+docker stack.)
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "services", "data_preparer"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from s3_standin import S3StandIn  # noqa: E402
+
+_server = S3StandIn().start()
+os.environ["MINIO_ENDPOINT"] = _server.endpoint
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/tests.db"
+os.environ["JOB_ISOLATION"] = "false"
+
+
+@pytest.fixture(scope="session")
+def services():
+    """Tables and buckets created; yields the S3 stand-in."""
+    from src.startup import startup
+    assert startup.run(max_attempts=1)
+    yield _server
+    _server.stop()
@@ -0,0 +1,84 @@
+"""Result cache keys, and eviction of outputs together with the locations jobs hand out."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database import Base
+from src.models import PreparedDataset, ResultCacheEntry
+from src.schemas import PreparationRequest
+from src.cache import result_cache
+from src.minio_client import minio_client
+from src.config import settings
+
+REQUEST = {"input_data": {"bucket": "raw-data", "path": "a.csv"}, "pipeline": [{"operator": "standard_scaler"}]}
+
+
+def test_key_includes_output_path():
+    key = lambda **fields: result_cache.make_key(PreparationRequest(**REQUEST, **fields), "etag")
+    assert key() == key(output_path=None)
+    assert key(output_path="x.csv") != key()
+    assert key(output_path="x.csv") != key(output_path="y.csv")
+    assert key(output_path="x.csv") == key(output_path="x.csv")
+
+
+@pytest.fixture
+def db(services, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/cache.db")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _output(name, data=b"a,b\n1,2\n"):
+    minio_client.put_bytes(data, settings.MINIO_BUCKET_PROCESSED, f"tests/{name}.csv", "text/csv")
+    return minio_client.object_version(settings.MINIO_BUCKET_PROCESSED, f"tests/{name}.csv")
+
+
+def _entry(db, key, output, etag, jobs=()):
+    bucket = settings.MINIO_BUCKET_PROCESSED
+    db.add(ResultCacheEntry(cache_key=key, job_id=key, input_bucket="raw-data", input_path="a.csv",
+                            input_version="etag", output_bucket=bucket, output_path=f"tests/{output}.csv",
+                            output_etag=etag))
+    for job_id in jobs:
+        db.add(PreparedDataset(job_id=job_id, status="COMPLETED", output_bucket=bucket, output_path=f"tests/{output}.csv"))
+    db.commit()
+
+
+def _exists(name):
+    try:
+        minio_client.object_version(settings.MINIO_BUCKET_PROCESSED, f"tests/{name}.csv")
+        return True
+    except Exception:
+        return False
+
+
+def test_eviction_deletes_output_and_expires_its_jobs(db, monkeypatch):
+    # The job that wrote the output, and one answered from the cache
+    _entry(db, "evicted", "evicted", _output("evicted"), jobs=["producer", "hit"])
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_ENTRIES", 0)
+    assert result_cache.evict(db) == 1
+    assert not _exists("evicted")
+    for job in db.query(PreparedDataset).all():
+        assert (job.status, job.output_path) == ("COMPLETED", None)
+        assert job.output_evicted_at is not None
+
+
+def test_eviction_keeps_shared_and_overwritten_outputs(db, monkeypatch):
+    etag = _output("shared")
+    _entry(db, "old", "shared", etag, jobs=["old"])
+    _entry(db, "new", "shared", etag, jobs=["new"])
+    # Written again by a job that did not use the cache: no longer the cached output
+    _entry(db, "stale", "overwritten", _output("overwritten"), jobs=["stale"])
+    _output("overwritten", b"a,b\n3,4\n")
+    db.query(ResultCacheEntry).filter(ResultCacheEntry.cache_key == "new").update(
+        {"last_accessed_at": datetime.now(timezone.utc) + timedelta(days=1)})
+    db.commit()
+
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_ENTRIES", 1)
+    assert result_cache.evict(db) == 2
+    assert _exists("shared") and _exists("overwritten")
+    assert db.query(PreparedDataset).filter(PreparedDataset.output_evicted_at.isnot(None)).count() == 0
@@ -0,0 +1,119 @@
+"""Expression operators: the whitelisted parser, SQL null semantics and scan pushdown."""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+from src.expressions import parse, split_scan, transform
+from src.schemas import PipelineStep
+
+
+def _steps(*steps):
+    return [PipelineStep(operator=op, params=params) for op, params in steps]
+
+
+def _filter(df, condition):
+    return transform(df.copy(), "filter", {"condition": condition}).index.tolist()
+
+
+@pytest.mark.parametrize("text", [
+    "x +",                       # not Python
+    "__import__('os')",          # unknown function
+    "x.real",                    # attribute access
+    "x[0]",                      # subscript
+    "lambda: 1",
+    "[x for x in y]",
+    "sqrt(x, y)",                # wrong arity
+    "abs(x=1)",                  # keywords
+    "x in y",                    # `in` needs literal values
+    "x in (y, 1)",
+    "x is 1",                    # `is` only with None
+    "x // 2",
+])
+def test_rejected_syntax_and_functions(text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+
+def test_filter_drops_rows_its_condition_is_null_for():
+    df = pd.DataFrame({"x": [1.0, np.nan, 3.0, None], "y": [1, 2, 3, 4]})
+    assert _filter(df, "x > 1") == [2]
+    assert _filter(df, "not (x > 1)") == [0]
+    assert _filter(df, "x != 1") == [2]
+    assert _filter(df, "x not in (1,)") == [2]
+    assert _filter(df, "x > 1 or y == 2") == [1, 2]   # null or true is true
+    assert _filter(df, "x is None") == [1, 3]
+    assert _filter(df, "coalesce(x, 0) < 1") == [1, 3]
+    with pytest.raises(ValueError):
+        _filter(df, "x + 1")
+
+
+def test_in_on_category_columns():
+    df = pd.DataFrame({"c": pd.Categorical(["a", "b", "a", None])})
+    assert _filter(df, "c in ('a',)") == [0, 2]
+    assert _filter(df, "c in ('z',)") == []
+    assert _filter(df, "c not in ('a',)") == [1]
+    assert _filter(df, "c == 'a'") == [0, 2]
+
+
+def test_scan_matches_in_memory_steps(tmp_path):
+    df = pd.DataFrame({
+        "x": [1.7, -2.2, None, 40.9, 5.5, np.nan],
+        "y": [10, 20, 30, 40, 50, 60],
+        "z": ["a", "b", "c", "d", "e", "f"],
+        "unused": [0.0] * 6,
+    })
+    path = tmp_path / "input.parquet"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+
+    steps = _steps(
+        ("cast", {"columns": {"x": "int64", "y": "float32"}}),
+        ("clip", {"columns": ["x", "y"], "lower": 0, "upper": 35}),
+        ("derive", {"column": "w", "expression": "x * 2 + y"}),
+        ("filter", {"condition": "w > 20 or x is None"}),
+        ("select", {"columns": ["w", "x", "z"]}),
+    )
+    scan, rest = split_scan(steps)
+    assert rest == [] and len(scan.steps) == 5
+
+    scanned = scan.to_table(ds.dataset(str(path)), list(df.columns)).to_pandas()
+    in_memory = scan.apply(df.copy()).reset_index(drop=True)
+    pd.testing.assert_frame_equal(scanned, in_memory, check_dtype=False)
+    # 40.9 truncates to 40, then clips to 35; the null stays null through clip and derive
+    assert scanned["z"].tolist() == ["c", "d", "e", "f"]
+    assert scanned["x"].tolist()[1:3] == [35, 5]
+    assert scanned["x"].isna().tolist() == [True, False, False, True]
+    assert scanned["w"].tolist()[1:3] == [105, 45]
+
+
+def test_split_scan_stops_at_steps_a_scan_cannot_run():
+    steps = _steps(
+        ("filter", {"condition": "x > 0"}),
+        ("clip", {"lower": 0}),                  # every numeric column: depends on the frame
+        ("select", {"columns": ["x"]}),
+    )
+    scan, rest = split_scan(steps)
+    assert len(scan.steps) == 1 and rest == steps[1:]
+    assert split_scan(_steps(("cast", {"columns": {"x": "category"}})))[0] is None
+
+
+def test_columns_read_is_the_projection():
+    names = ["a", "b", "c", "d", "e"]
+    scan, _ = split_scan(_steps(
+        ("filter", {"condition": "d > 0"}),
+        ("derive", {"column": "f", "expression": "a + col('b')"}),
+        ("select", {"columns": ["f", "c"]}),
+    ))
+    projection, condition = scan.bind(names)
+    assert list(projection) == ["f", "c"]
+    assert condition is not None
+    assert scan.columns_read == ["a", "b", "c", "d"]
+
+    scan, _ = split_scan(_steps(("select", {"drop": ["a", "e"]})))
+    scan.bind(names)
+    assert scan.columns_read == ["b", "c", "d"]
+
+    with pytest.raises(ValueError):
+        split_scan(_steps(("select", {"columns": ["missing"]})))[0].bind(names)
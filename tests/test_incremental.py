@@ -0,0 +1,79 @@
+"""Incremental runs append partitions; of two runs racing on one manifest only the first commits."""
+import uuid
+
+import pytest
+
+from synthetic import make_dataset
+from src.schemas import PreparationRequest
+from src import incremental
+from src.incremental import ManifestConflict, read_manifest, run_incremental
+from src.jobs import is_retryable
+from src.minio_client import minio_client
+from src.config import settings
+
+
+def _request(prefix):
+    return PreparationRequest(input_data={"bucket": settings.MINIO_BUCKET_RAW, "path": f"{prefix}/in/"},
+                              pipeline=[{"operator": "standard_scaler"}], output_path=f"{prefix}/out",
+                              incremental={"statistics": "update"})
+
+
+def _add_input(prefix, name, seed):
+    minio_client.save_dataframe(make_dataset(300, 4, seed=seed), settings.MINIO_BUCKET_RAW, f"{prefix}/in/{name}.csv")
+
+
+def test_runs_append_partitions(services):
+    prefix = f"tests/incremental-{uuid.uuid4().hex[:8]}"
+    request = _request(prefix)
+    _add_input(prefix, "a", 0)
+    _, _, manifest_path = run_incremental(str(uuid.uuid4()), request)
+    _add_input(prefix, "b", 1)
+    run_incremental(str(uuid.uuid4()), request)
+    manifest, _ = read_manifest(settings.MINIO_BUCKET_PROCESSED, manifest_path)
+    assert [p["rows"] for p in manifest["partitions"]] == [300, 300]
+    assert sorted(manifest["sources"]) == [f"{prefix}/in/a.csv", f"{prefix}/in/b.csv"]
+
+
+def test_stale_run_does_not_commit(services, monkeypatch):
+    prefix = f"tests/incremental-{uuid.uuid4().hex[:8]}"
+    request = _request(prefix)
+    bucket = settings.MINIO_BUCKET_PROCESSED
+    _add_input(prefix, "a", 0)
+    _, _, manifest_path = run_incremental(str(uuid.uuid4()), request)
+    stale = read_manifest(bucket, manifest_path)
+
+    # Another run commits between this run's manifest read and its commit
+    _add_input(prefix, "b", 1)
+    run_incremental(str(uuid.uuid4()), request)
+    committed = read_manifest(bucket, manifest_path)
+    _add_input(prefix, "c", 2)
+    monkeypatch.setattr(incremental, "read_manifest", lambda *args: stale)
+    with pytest.raises(ManifestConflict) as raised:
+        run_incremental(str(uuid.uuid4()), request)
+    assert is_retryable(raised.value)
+
+    assert read_manifest(bucket, manifest_path) == committed
+    listed = {p["path"] for p in committed[0]["partitions"]}
+    stored = {path for path, _, _ in minio_client.list_objects(bucket, f"{prefix}/out/part-")}
+    assert stored == listed
+
+
+def test_first_runs_race(services):
+    bucket, path = settings.MINIO_BUCKET_PROCESSED, f"tests/incremental-{uuid.uuid4().hex[:8]}/_manifest.json"
+    incremental._commit(bucket, path, {"run": 1}, None, path + ".part")
+    with pytest.raises(ManifestConflict):
+        incremental._commit(bucket, path, {"run": 2}, None, path + ".part")
+    assert read_manifest(bucket, path)[0] == {"run": 1}
+
+
+def test_conditional_put(services):
+    bucket, path = settings.MINIO_BUCKET_PROCESSED, f"tests/conditional-{uuid.uuid4().hex[:8]}"
+    assert minio_client.put_bytes_if(b"1", bucket, path, None, content_type="application/json")
+    version, _, content_type = minio_client.object_info(bucket, path)
+    assert content_type == "application/json"
+    assert not minio_client.put_bytes_if(b"2", bucket, path, None)
+    assert minio_client.put_bytes_if(b"2", bucket, path, version)
+    assert not minio_client.put_bytes_if(b"3", bucket, path, version)
+    assert not minio_client.put_bytes_if(b"3", bucket, path + "-missing", version)
+    buffer, _ = minio_client.read_object(bucket, path)
+    assert bytes(buffer) == b"2"
@@ -0,0 +1,169 @@
+"""Claim, retry, stall recovery and cancellation, the same for SqlJobQueue and InMemoryJobQueue."""
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from synthetic import make_dataset
+from src.database import Base
+from src.models import PreparedDataset, ResultCacheEntry
+from src.schemas import PreparationRequest
+from src.job_queue import SqlJobQueue, InMemoryJobQueue
+from src.cache import result_cache
+from src.supervision import checkpoint
+from src.worker import Worker
+from src.minio_client import minio_client
+from src.config import settings
+
+REQUEST = {"input_data": {"bucket": settings.MINIO_BUCKET_RAW, "path": "tests/queue.csv"},
+           "pipeline": [{"operator": "standard_scaler"}]}
+
+
+@pytest.fixture(params=["sql", "memory"])
+def queue(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    # A database of its own per test: SqlJobQueue claims any pending job of its table
+    engine = create_engine(f"sqlite:///{tmp_path}/queue.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    if request.param == "sql":
+        yield SqlJobQueue(session_factory)
+    else:
+        yield InMemoryJobQueue(session_factory=session_factory)
+    engine.dispose()
+
+
+def _job(queue, job_id):
+    if isinstance(queue, InMemoryJobQueue):
+        return dict(queue.jobs[job_id])
+    db = queue.session_factory()
+    try:
+        record = db.query(PreparedDataset).filter(PreparedDataset.job_id == job_id).one()
+        return {"status": record.status, "attempts": record.attempts, "worker_id": record.worker_id,
+                "error_message": record.error_message, "output_path": record.output_path}
+    finally:
+        db.close()
+
+
+def _submit(queue, body=None, cache_key=None):
+    job_id = str(uuid.uuid4())
+    queue.submit(job_id, PreparationRequest(**(body or REQUEST)), cache_key)
+    return job_id
+
+
+def test_claim_is_exclusive(queue):
+    job_id = _submit(queue)
+    job = queue.claim("a")
+    assert job.job_id == job_id and job.attempts == 1
+    assert queue.claim("b") is None
+    assert _job(queue, job_id)["status"] == "PROCESSING"
+    # State changes only from the claiming worker
+    assert not queue.heartbeat(job_id, "b")
+    assert not queue.complete(job, "b", "bucket", "path")
+    assert queue.complete(job, "a", "bucket", "path")
+    assert _job(queue, job_id)["status"] == "COMPLETED"
+
+
+def test_retry_then_fail(queue):
+    job_id = _submit(queue)
+    assert queue.fail(queue.claim("a"), "a", "boom") == "PENDING"
+    job = queue.claim("a")
+    assert job.attempts == 2
+    assert queue.fail(job, "a", "boom") == "FAILED"
+    assert _job(queue, job_id)["error_message"] == "boom"
+    assert queue.claim("a") is None
+
+
+def test_retry_waits_for_backoff(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 60.0)
+    _submit(queue)
+    assert queue.fail(queue.claim("a"), "a", "boom") == "PENDING"
+    assert queue.claim("a") is None
+
+
+@pytest.mark.parametrize("status", ["FAILED", "TIMEOUT", "OOM", "CANCELLED"])
+def test_terminal_failures_are_not_retried(queue, status):
+    job_id = _submit(queue)
+    retryable = status != "FAILED"
+    assert queue.fail(queue.claim("a"), "a", "stop", retryable=retryable, status=status) == status
+    assert _job(queue, job_id)["status"] == status
+
+
+def test_reclaim_stalled(queue, monkeypatch):
+    job_id = _submit(queue)
+    queue.claim("a")
+    monkeypatch.setattr(settings, "WORKER_STALL_TIMEOUT", 0)
+    time.sleep(0.01)
+    assert queue.reclaim_stalled() == 1
+    assert _job(queue, job_id)["status"] == "PENDING"
+    assert queue.claim("b").attempts == 2
+    time.sleep(0.01)
+    # Out of attempts
+    queue.reclaim_stalled()
+    assert _job(queue, job_id)["status"] == "FAILED"
+
+
+def test_cancel(queue, monkeypatch):
+    assert queue.cancel("no-such-job") is None
+    pending = _submit(queue)
+    assert queue.cancel(pending) == "CANCELLED"
+    assert queue.claim("a") is None
+
+    running = _submit(queue)
+    queue.claim("a")
+    # Flagged for the worker, which stops the job at its next checkpoint
+    assert queue.cancel(running) == "PROCESSING"
+    assert queue.cancel_requested([running, pending]) == {running}
+    monkeypatch.setattr(settings, "WORKER_STALL_TIMEOUT", 0)
+    time.sleep(0.01)
+    queue.reclaim_stalled()
+    assert _job(queue, running)["status"] == "CANCELLED"
+
+
+def test_complete_indexes_result_cache(services, queue):
+    minio_client.save_dataframe(make_dataset(200, 4), settings.MINIO_BUCKET_RAW, "tests/queue.csv")
+    request = PreparationRequest(**REQUEST)
+    cache_key = result_cache.resolve(request)
+    job_id = _submit(queue, cache_key=cache_key)
+    assert Worker(queue, "a", isolate=False).run_once()
+    assert _job(queue, job_id)["status"] == "COMPLETED"
+    db = queue.session_factory()
+    try:
+        entry = db.query(ResultCacheEntry).filter(ResultCacheEntry.cache_key == cache_key[0]).one()
+        assert (entry.job_id, entry.output_path) == (job_id, _job(queue, job_id)["output_path"])
+    finally:
+        db.close()
+
+
+def _run_until_stopped(job_id, request, progress=None):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        checkpoint()
+        time.sleep(0.01)
+    return {"output_bucket": "bucket", "output_path": "path"}
+
+
+def test_worker_stops_cancelled_job(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_CANCEL_POLL_INTERVAL", 0.05)
+    job_id = _submit(queue)
+    worker = Worker(queue, "a", runner=_run_until_stopped, isolate=False)
+    thread = threading.Thread(target=worker.run_once)
+    thread.start()
+    while _job(queue, job_id)["status"] != "PROCESSING":
+        time.sleep(0.01)
+    queue.cancel(job_id)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert _job(queue, job_id)["status"] == "CANCELLED"
+
+
+def test_worker_times_out_job(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_TIME_LIMIT_SECONDS", 0.2)
+    job_id = _submit(queue)
+    assert Worker(queue, "a", runner=_run_until_stopped, isolate=False).run_once()
+    job = _job(queue, job_id)
+    assert (job["status"], job["attempts"]) == ("TIMEOUT", 1)
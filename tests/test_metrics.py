@@ -0,0 +1,61 @@
+"""Per-operator job metrics: each pipeline step reported once per row, batch or streaming."""
+import uuid
+
+import pytest
+
+from synthetic import make_dataset
+from src.schemas import PreparationRequest
+from src.jobs import run_preparation, run_preparation_group
+from src.metrics import JobMetrics, collecting
+from src.minio_client import minio_client
+from src.config import settings
+
+ROWS = 2_000
+
+
+@pytest.fixture(scope="module")
+def input_path(services):
+    minio_client.save_dataframe(make_dataset(ROWS, 6), settings.MINIO_BUCKET_RAW, "tests/metrics.parquet")
+    return "tests/metrics.parquet"
+
+
+def _operators(input_path, pipeline, **options):
+    request = PreparationRequest(input_data={"bucket": settings.MINIO_BUCKET_RAW, "path": input_path},
+                                 pipeline=pipeline, use_cache=False, **options)
+    metrics = JobMetrics()
+    with collecting(metrics):
+        run_preparation(str(uuid.uuid4()), request)
+    return metrics.summary()["operators"]
+
+
+def test_streaming_records_the_transform_pass_only(input_path):
+    pipeline = [{"operator": "imputer", "params": {"strategy": "mean"}}, {"operator": "standard_scaler"},
+                {"operator": "minmax_scaler"}]
+    operators = _operators(input_path, pipeline, streaming=True, chunk_size=500)
+    assert [o["steps"] for o in operators] == [[0], [1], [2]]
+    for operator in operators:
+        assert (operator["calls"], operator["rows_in"]) == (ROWS // 500, ROWS)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_step_indices_count_the_pushed_down_steps(input_path, streaming):
+    pipeline = [{"operator": "filter", "params": {"condition": "int_1 < 700"}},
+                {"operator": "imputer", "params": {"strategy": "mean"}}, {"operator": "standard_scaler"},
+                {"operator": "fillna", "params": {"value": "missing"}}]
+    operators = _operators(input_path, pipeline, streaming=streaming, chunk_size=500)
+    assert sorted(step for o in operators for step in o["steps"]) == [1, 2, 3]
+
+
+def test_step_indices_in_a_batch_group(input_path):
+    filter_step = {"operator": "filter", "params": {"condition": "int_1 < 700"}}
+    scale = {"operator": "standard_scaler"}
+    jobs = [(str(uuid.uuid4()), PreparationRequest(
+        input_data={"bucket": settings.MINIO_BUCKET_RAW, "path": input_path}, use_cache=False,
+        pipeline=[filter_step, {"operator": "imputer", "params": {"strategy": "mean"}}, *tail]))
+        for tail in ([scale], [scale, {"operator": "minmax_scaler"}])]
+    metrics = JobMetrics()
+    with collecting(metrics):
+        results = run_preparation_group(jobs)
+    assert not any(isinstance(result, Exception) for result in results.values())
+    # The shared imputer/scaler prefix runs once, the minmax_scaler of the second job after it
+    assert sorted(step for o in metrics.summary()["operators"] for step in o["steps"]) == [1, 2, 3]
@@ -0,0 +1,29 @@
+"""Previews read the head of an object, not the whole object."""
+import pandas as pd
+import pytest
+
+from synthetic import make_dataset
+from src.minio_client import minio_client
+from src.config import settings
+
+
+@pytest.fixture(scope="module")
+def df():
+    return make_dataset(300_000, 4)  # Arrow record batches hold up to 64Ki rows
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "arrow"])
+def test_head_reads_a_fraction_of_the_object(services, df, fmt, monkeypatch):
+    bucket, path = settings.MINIO_BUCKET_RAW, f"tests/head.{fmt}"
+    minio_client.save_dataframe(df, bucket, path, row_group_size=20_000, fmt=fmt)
+    size = minio_client.object_info(bucket, path)[1]
+
+    fetched = []
+    read_ranges = minio_client.read_ranges
+    monkeypatch.setattr(minio_client, "read_ranges",
+                        lambda bucket, path, ranges, version=None: fetched.extend(ranges) or read_ranges(bucket, path, ranges, version))
+    monkeypatch.setattr(minio_client.client, "fget_object", lambda *args, **kwargs: pytest.fail("downloaded whole object"))
+    head = minio_client.head_dataframe(bucket, path, 5)
+
+    pd.testing.assert_frame_equal(head, df.head(5), check_dtype=False)
+    assert sum(length for _, length in fetched) < size / 2
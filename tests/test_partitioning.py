@@ -0,0 +1,52 @@
+"""Partitioned outputs: the rows sharing a key land in one partition, streamed or not."""
+import io
+import uuid
+
+import pandas as pd
+import pytest
+
+from src.schemas import PartitionOptions
+from src.partitioning import write_chunks, write_frame
+from src.minio_client import minio_client
+from src.config import settings
+
+
+def _partitions(manifest):
+    frames = []
+    for partition in manifest["partitions"]:
+        buffer, _ = minio_client.read_object(settings.MINIO_BUCKET_PROCESSED, partition["path"])
+        frames.append(pd.read_parquet(io.BytesIO(bytes(buffer))))
+    return frames
+
+
+def _write(chunks, options):
+    prefix = f"tests/partitioned-{uuid.uuid4().hex[:8]}/"
+    return write_chunks("job", (c.copy() for c in chunks), settings.MINIO_BUCKET_PROCESSED, prefix, options, "parquet")
+
+
+def test_key_in_one_partition_across_chunk_dtypes(services):
+    # The null makes k float64 in the second chunk; the first chunk's schema has it as int64
+    chunks = [pd.DataFrame({"k": [1, 2, 3], "v": [0.1, 0.2, 0.3]}),
+              pd.DataFrame({"k": [1, 2, None], "v": [0.4, 0.5, 0.6]})]
+    options = PartitionOptions(count=4, by=["k"])
+    streamed = _partitions(_write(chunks, options))
+    for key in (1, 2):
+        assert sum(key in part["k"].tolist() for part in streamed) == 1
+
+    prefix = f"tests/partitioned-{uuid.uuid4().hex[:8]}/"
+    batch = _partitions(write_frame("job", pd.concat(chunks, ignore_index=True), settings.MINIO_BUCKET_PROCESSED,
+                                    prefix, options, "parquet"))
+    for left, right in zip(streamed, batch):
+        pd.testing.assert_frame_equal(left, right, check_dtype=False)
+
+
+def test_range_partitions(services):
+    chunks = [pd.DataFrame({"v": range(start, start + 5)}) for start in range(0, 25, 5)]
+    manifest = _write(chunks, PartitionOptions(count=3))
+    assert [p["rows"] for p in manifest["partitions"]] == [8, 8, 9]
+    assert pd.concat(_partitions(manifest))["v"].tolist() == list(range(25))
+
+
+def test_unknown_key_column(services):
+    with pytest.raises(ValueError):
+        _write([pd.DataFrame({"v": [1]})], PartitionOptions(count=2, by=["k"]))
@@ -0,0 +1,137 @@
+"""Dataset profiles: distinct count sketch, sampled CSV profiles and the per-version cache."""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic import make_dataset
+from src.profiling import HyperLogLog, ProfileStore, Profiler, _sample_csv
+from src.minio_client import minio_client
+from src.config import settings
+
+ROWS = 100_000
+
+
+@pytest.fixture
+def small_ranges(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILE_SAMPLE_RANGES", 8)
+    monkeypatch.setattr(settings, "PROFILE_SAMPLE_RANGE_BYTES", 64 * 1024)
+
+
+@pytest.fixture(scope="module")
+def large_csv(services):
+    df = make_dataset(ROWS, 10)
+    minio_client.save_dataframe(df, settings.MINIO_BUCKET_RAW, "tests/profile.csv")
+    return df
+
+
+@pytest.mark.parametrize("distinct", [50, 5_000, 300_000])
+def test_hll_error_bound(distinct):
+    precision = 12
+    hll = HyperLogLog(precision)
+    values = pd.Series(np.arange(distinct, dtype=np.int64) * 7919)
+    hll.add(values)
+    hll.add(values.sample(frac=0.5, random_state=0))  # repeated values do not count again
+    bound = 3 * 1.04 / np.sqrt(2 ** precision)
+    assert abs(hll.count() - distinct) <= bound * distinct
+
+
+def test_hll_text_and_nulls():
+    hll = HyperLogLog(12)
+    hll.add(pd.Series([f"id-{i}" for i in range(1000)] + [None] * 100, dtype=object))
+    assert abs(hll.count() - 1000) <= 50
+    empty = HyperLogLog(12)
+    empty.add(pd.Series([None, np.nan]))
+    assert empty.count() == 0
+
+
+def test_result_scales_counts_to_estimated_rows():
+    profiler = Profiler()
+    profiler.update(pd.DataFrame({"id": np.arange(1000), "cat": ["a", "b"] * 500, "x": [1.0, None] * 500}))
+    profile = profiler.result(rows=10_000)
+    columns = {c["name"]: c for c in profile["columns"]}
+    assert profile["rows"] == 10_000
+    assert columns["x"]["count"] == 5_000 and columns["x"]["nulls"] == 5_000
+    assert columns["x"]["null_fraction"] == 0.5
+    assert abs(columns["id"]["distinct"] - 10_000) <= 500   # mostly distinct: scaled up
+    assert columns["cat"]["distinct"] == 2                    # saturated in the sample: not scaled
+    assert profile["missing_values"] == 5_000
+
+
+def test_sample_csv_reads_one_range_per_stratum(large_csv, small_ranges, monkeypatch):
+    version, size, _ = minio_client.object_info(settings.MINIO_BUCKET_RAW, "tests/profile.csv")
+    requested = []
+    read_ranges = minio_client.read_ranges
+    monkeypatch.setattr(minio_client, "read_ranges",
+                        lambda *args: requested.append(args[2]) or read_ranges(*args))
+
+    sample, rows = _sample_csv(settings.MINIO_BUCKET_RAW, "tests/profile.csv", size, version)
+    n, length = settings.PROFILE_SAMPLE_RANGES, settings.PROFILE_SAMPLE_RANGE_BYTES
+    ranges = requested[0]
+    assert ranges[0] == (0, length) and len(ranges) == n
+    stratum = (size - length) // (n - 1)
+    for i, (offset, range_length) in enumerate(ranges[1:]):
+        assert range_length == length
+        assert length + i * stratum <= offset and offset + length <= length + (i + 1) * stratum
+
+    # Whole lines only: every sampled row is a row of the file
+    full = pd.read_csv(io.BytesIO(bytes(minio_client.read_object(settings.MINIO_BUCKET_RAW, "tests/profile.csv")[0])))
+    assert len(sample) and list(sample.columns) == list(full.columns)
+    assert sample.merge(full.drop_duplicates(), how="left", indicator=True)["_merge"].eq("both").all()
+    assert abs(rows - ROWS) <= 0.05 * ROWS
+
+    # Seeded by the version: the same object gives the same ranges
+    _sample_csv(settings.MINIO_BUCKET_RAW, "tests/profile.csv", size, version)
+    assert requested[1] == ranges
+    _sample_csv(settings.MINIO_BUCKET_RAW, "tests/profile.csv", size, version + "-other")
+    assert requested[2] != ranges
+
+
+def test_sampled_profile_close_to_full(large_csv, small_ranges):
+    store = ProfileStore(minio_client, 16)
+    full = store.get(settings.MINIO_BUCKET_RAW, "tests/profile.csv", mode="full")
+    sampled = store.get(settings.MINIO_BUCKET_RAW, "tests/profile.csv", mode="sample")
+    assert full["mode"] == "full" and full["exact_counts"] and full["rows"] == ROWS
+    assert sampled["mode"] == "sample" and not sampled["exact_counts"]
+    assert sampled["sampled_rows"] < ROWS / 4
+    assert abs(sampled["rows"] - ROWS) <= 0.05 * ROWS
+
+    columns = {c["name"]: c for c in full["columns"]}
+    for column in sampled["columns"]:
+        exact = columns[column["name"]]
+        assert column["dtype"] == exact["dtype"]
+        assert abs(column["nulls"] - exact["nulls"]) <= 0.3 * exact["nulls"] + 50
+        if column["name"].startswith("cat_"):
+            assert column["distinct"] == exact["distinct"]
+        if exact["mean"] is not None:
+            spread = exact["max"] - exact["min"]
+            assert abs(column["mean"] - exact["mean"]) <= 0.05 * spread
+            assert abs(column["quantiles"]["0.5"] - exact["quantiles"]["0.5"]) <= 0.05 * spread
+
+
+def test_cache_keyed_on_object_version(services, monkeypatch):
+    path = "tests/profile-versions.csv"
+    minio_client.save_dataframe(make_dataset(500, 4, seed=1), settings.MINIO_BUCKET_RAW, path)
+    scans = []
+    iter_chunks = minio_client.iter_dataframe_chunks
+    monkeypatch.setattr(minio_client, "iter_dataframe_chunks",
+                        lambda *args, **kwargs: scans.append(args[1]) or iter_chunks(*args, **kwargs))
+
+    store = ProfileStore(minio_client, 16)
+    first = store.get(settings.MINIO_BUCKET_RAW, path)
+    assert not first["cached"] and first["rows"] == 500 and len(scans) == 1
+    assert store.get(settings.MINIO_BUCKET_RAW, path)["cached"] and len(scans) == 1
+
+    # Another process: the profile stored in the processed bucket, not a rescan
+    assert ProfileStore(minio_client, 16).get(settings.MINIO_BUCKET_RAW, path)["cached"] and len(scans) == 1
+    assert not store.get(settings.MINIO_BUCKET_RAW, path, refresh=True)["cached"] and len(scans) == 2
+
+    # A new version of the object is a miss
+    minio_client.save_dataframe(make_dataset(700, 4, seed=2), settings.MINIO_BUCKET_RAW, path)
+    second = store.get(settings.MINIO_BUCKET_RAW, path)
+    assert not second["cached"] and second["rows"] == 700 and second["version"] != first["version"]
+    assert len(scans) == 3
+    version, size, _ = minio_client.object_info(settings.MINIO_BUCKET_RAW, path)
+    assert store.cached(settings.MINIO_BUCKET_RAW, path, version, size, "csv")["rows"] == 700
+    assert store.cached(settings.MINIO_BUCKET_RAW, path, first["version"], first["size"], "csv")["rows"] == 500
@@ -0,0 +1,60 @@
+"""Startup brings a database created by an earlier version up to the current models."""
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from src import startup as startup_module
+from src.database import Base
+from src.schemas import PreparationRequest
+from src.job_queue import SqlJobQueue
+
+# prepared_datasets as the first release created it
+BASELINE = """
+CREATE TABLE prepared_datasets (
+    id INTEGER NOT NULL PRIMARY KEY,
+    job_id VARCHAR,
+    input_bucket VARCHAR,
+    input_path VARCHAR,
+    output_bucket VARCHAR,
+    output_path VARCHAR,
+    pipeline_config JSON,
+    status VARCHAR,
+    error_message VARCHAR,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    updated_at DATETIME
+)
+"""
+
+
+@pytest.fixture
+def old_engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db", connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text(BASELINE))
+        conn.execute(text("CREATE UNIQUE INDEX ix_prepared_datasets_job_id ON prepared_datasets (job_id)"))
+        conn.execute(text("INSERT INTO prepared_datasets (job_id, status) VALUES ('old', 'COMPLETED')"))
+    monkeypatch.setattr(startup_module, "engine", engine)
+    yield engine
+    engine.dispose()
+
+
+def test_adds_missing_columns(old_engine):
+    startup_module._create_tables()
+    startup_module._create_tables()  # idempotent
+    inspector = inspect(old_engine)
+    for table in Base.metadata.sorted_tables:
+        assert {c["name"] for c in inspector.get_columns(table.name)} == set(table.columns.keys())
+    with old_engine.connect() as conn:
+        row = conn.execute(text("SELECT status, available_at FROM prepared_datasets WHERE job_id = 'old'")).one()
+    assert row.status == "COMPLETED" and row.available_at is not None
+
+    indexes = {index["name"] for index in inspector.get_indexes("prepared_datasets")}
+    assert {"ix_prepared_datasets_queue", "ix_prepared_datasets_status_created", "ix_prepared_datasets_created",
+            "ix_prepared_datasets_batch_id"} <= indexes
+
+    queue = SqlJobQueue(sessionmaker(bind=old_engine))
+    job_id = str(uuid.uuid4())
+    queue.submit(job_id, PreparationRequest(input_data={"bucket": "b", "path": "p.csv"}, pipeline=[]))
+    assert queue.claim("a").job_id == job_id